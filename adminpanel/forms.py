@@ -1,5 +1,6 @@
 from django import forms
 from allergy_app.models import FoodItem, Allergen, ScanHistory  # adjust import if models live in a different app
+from allergy_app.catalogue import CatalogueError, format_for
 
 class FoodItemForm(forms.ModelForm):
     class Meta:
@@ -19,3 +20,17 @@ class ScanHistoryForm(forms.ModelForm):
     class Meta:
         model = ScanHistory
         fields = ['user', 'food_item', 'image', 'allergen_detected']
+
+
+class CatalogueImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV, JSON or JSON Lines catalogue file.')
+    dry_run = forms.BooleanField(required=False, label='Dry run (validate only, save nothing)',
+                                 widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+    def clean_file(self):
+        f = self.cleaned_data['file']
+        try:
+            self.format = format_for(f.name)
+        except CatalogueError as e:
+            raise forms.ValidationError(str(e))
+        return f
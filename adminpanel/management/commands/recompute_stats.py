@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from adminpanel import stats
+from adminpanel.models import StatCounter
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the dashboard statistics (counters, scans per food, users per "
+            "allergen) from the source tables, repairing any drift.")
+
+    def handle(self, *args, **options):
+        before = dict(StatCounter.objects.values_list('key', 'value'))
+        after = stats.recompute()
+        for key in stats.COUNTERS:
+            old = before.get(key)
+            note = '' if old == after[key] else f" (was {old if old is not None else 'unset'})"
+            self.stdout.write(f"{key}: {after[key]}{note}")
+        self.stdout.write(self.style.SUCCESS('Dashboard statistics recomputed.'))
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from adminpanel import rollups
+
+
+class Command(BaseCommand):
+    help = ("Fold new scans into the hourly / daily analytics rollups. Only buckets "
+            "from the latest rolled-up one onward are recomputed; run it from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Recompute the last N days instead (e.g. after rescore_scans).')
+        parser.add_argument('--full', action='store_true', help='Rebuild all rollups from scratch.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days']:
+            since = timezone.now() - timedelta(days=options['days'])
+        started = time.perf_counter()
+        written = rollups.rollup(since=since, full=options['full'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {written['hour']} hourly and {written['day']} daily food buckets in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('allergy_app', '0005_scanhistory_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=32, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AllergenStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('affected_users', models.BigIntegerField(default=0)),
+                ('allergen', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stat', to='allergy_app.allergen')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FoodScanStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scans', models.BigIntegerField(db_index=True, default=0)),
+                ('food_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scan_stat', to='allergy_app.fooditem')),
+            ],
+        ),
+    ]
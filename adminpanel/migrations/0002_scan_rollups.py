@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:29
+
+import adminpanel.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0001_dashboard_stats'),
+        ('allergy_app', '0005_scanhistory_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllergenRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('scans', models.IntegerField(default=0)),
+                ('alerts', models.IntegerField(default=0)),
+                ('allergen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='allergy_app.allergen')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'bucket'], name='allergen_rollup_bucket_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('scans', models.IntegerField(default=0)),
+                ('alerts', models.IntegerField(default=0)),
+                ('low_confidence', models.IntegerField(default=0)),
+                ('scored', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('confidence_histogram', models.JSONField(default=adminpanel.models.empty_histogram)),
+                ('food_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='allergy_app.fooditem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'bucket'], name='scan_rollup_bucket_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:31
+
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    # Runs before this migration may have written duplicate buckets. Rollups are
+    # derived data: the next `rollup_scans` run finds none and rebuilds them all.
+    apps.get_model('adminpanel', 'ScanRollup').objects.all().delete()
+    apps.get_model('adminpanel', 'AllergenRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0002_scan_rollups'),
+        ('allergy_app', '0008_scanhistory_candidates'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='allergenrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'allergen'), name='allergen_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='scanrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('food_item__isnull', False)), fields=('period', 'bucket', 'food_item'), name='scan_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='scanrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('food_item__isnull', True)), fields=('period', 'bucket'), name='scan_rollup_unique_no_food'),
+        ),
+    ]
@@ -1,3 +1,91 @@
 from django.db import models
 
-# Create your models here.
+from allergy_app.models import Allergen, FoodItem
+
+
+# Materialized dashboard statistics, kept up to date by adminpanel/signals.py
+# and rebuilt from scratch by `manage.py recompute_stats` (see stats.py).
+
+class StatCounter(models.Model):
+    """A named global counter: users, foods, allergens, scans, alerts, unmatched_scans."""
+    key = models.CharField(max_length=32, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class FoodScanStat(models.Model):
+    """Number of scans matched to a food item."""
+    food_item = models.OneToOneField(FoodItem, on_delete=models.CASCADE, related_name='scan_stat')
+    scans = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.food_item} - {self.scans} scans"
+
+
+class AllergenStat(models.Model):
+    """Number of users with an allergen in their profile."""
+    allergen = models.OneToOneField(Allergen, on_delete=models.CASCADE, related_name='stat')
+    affected_users = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.allergen} - {self.affected_users} users"
+
+
+# Time-bucketed scan analytics, filled by `manage.py rollup_scans` (see rollups.py)
+
+ROLLUP_PERIODS = [('hour', 'Hourly'), ('day', 'Daily')]
+CONFIDENCE_BINS = 10  # 0-10%, 10-20%, ..., 90-100%
+
+
+def empty_histogram():
+    return [0] * CONFIDENCE_BINS
+
+
+class ScanRollup(models.Model):
+    """Scans of one food (None = no matching food) within one hour or day."""
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    bucket = models.DateTimeField()  # start of the hour / day
+    food_item = models.ForeignKey(FoodItem, null=True, blank=True, on_delete=models.CASCADE)
+    scans = models.IntegerField(default=0)
+    alerts = models.IntegerField(default=0)
+    low_confidence = models.IntegerField(default=0)
+    scored = models.IntegerField(default=0)  # scans with a confidence value
+    confidence_sum = models.FloatField(default=0)
+    confidence_histogram = models.JSONField(default=empty_histogram)
+
+    class Meta:
+        indexes = [models.Index(fields=['period', 'bucket'], name='scan_rollup_bucket_idx')]
+        # One row per bucket and food; NULLs are distinct in a unique index, so
+        # the no-food row needs its own
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'food_item'],
+                                    condition=models.Q(food_item__isnull=False), name='scan_rollup_unique'),
+            models.UniqueConstraint(fields=['period', 'bucket'],
+                                    condition=models.Q(food_item__isnull=True), name='scan_rollup_unique_no_food'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.food_item or 'Unknown'}: {self.scans}"
+
+
+class AllergenRollup(models.Model):
+    """
+    Scans of foods containing an allergen within one hour or day, and the
+    alerts raised for users whose profile lists that allergen.
+    """
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    bucket = models.DateTimeField()
+    allergen = models.ForeignKey(Allergen, on_delete=models.CASCADE)
+    scans = models.IntegerField(default=0)
+    alerts = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['period', 'bucket'], name='allergen_rollup_bucket_idx')]
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'allergen'], name='allergen_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.allergen}: {self.alerts}/{self.scans}"
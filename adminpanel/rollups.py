@@ -0,0 +1,198 @@
+# adminpanel/rollups.py
+#
+# Pre-aggregated scan analytics. `manage.py rollup_scans` folds ScanHistory
+# into hourly and daily buckets:
+#
+# * ScanRollup: per bucket and food -- scans, alerts, low-confidence scans and
+#   a 10-bin confidence histogram;
+# * AllergenRollup: per bucket and allergen -- scans of foods containing it
+#   and alerts for users whose profile lists it.
+#
+# Each run re-aggregates only from the latest rolled-up bucket onward (scans
+# in the current hour / day are still arriving and being scored), so its cost
+# follows the new data, not the table size. Rows are upserted on their unique
+# (period, bucket, food / allergen) key, so overlapping runs or a rerun after a
+# failed one never count a bucket twice. The chart endpoints read only the
+# rollup tables: their cost depends on the time range asked for, not on how
+# many scans there are.
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+
+from allergy_app.models import ScanHistory
+from allergy_app.constants import CONFIDENCE_THRESHOLD
+from .models import CONFIDENCE_BINS, AllergenRollup, ScanRollup
+
+TRUNC = {'hour': TruncHour, 'day': TruncDay}
+
+
+def floor_bucket(dt, period):
+    """Start of the hour / day (in the current time zone) containing `dt`."""
+    dt = timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if period == 'day' else dt
+
+
+def _scan_rows(scans, trunc):
+    bins = {
+        f'bin{i}': Count('id', filter=Q(confidence__gte=i * 100 / CONFIDENCE_BINS,
+                                        confidence__lt=(i + 1) * 100 / CONFIDENCE_BINS))
+        for i in range(CONFIDENCE_BINS)
+    }
+    # 100% lands in the last bin
+    bins[f'bin{CONFIDENCE_BINS - 1}'] = Count('id', filter=Q(confidence__gte=100 - 100 / CONFIDENCE_BINS))
+    return (scans.annotate(b=trunc('scanned_at'))
+            .values('b', 'food_item')
+            .annotate(scans=Count('id'),
+                      alerts=Count('id', filter=Q(allergen_detected=True)),
+                      low_confidence=Count('id', filter=Q(confidence__lt=CONFIDENCE_THRESHOLD * 100)),
+                      scored=Count('confidence'),
+                      confidence_sum=Sum('confidence'),
+                      **bins)
+            .order_by())
+
+
+def _allergen_rows(scans, trunc):
+    counts = defaultdict(lambda: [0, 0])  # (bucket, allergen id) -> [scans, alerts]
+    exposed = (scans.filter(food_item__allergens__isnull=False)
+               .annotate(b=trunc('scanned_at'), allergen=F('food_item__allergens'))
+               .values('b', 'allergen').annotate(n=Count('id')).order_by())
+    for row in exposed:
+        counts[row['b'], row['allergen']][0] = row['n']
+    # Alert attributed to every allergen shared by the food and the user's profile
+    alerted = (scans.filter(allergen_detected=True,
+                            food_item__allergens=F('user__allergyprofile__allergens'))
+               .annotate(b=trunc('scanned_at'), allergen=F('food_item__allergens'))
+               .values('b', 'allergen').annotate(n=Count('id', distinct=True)).order_by())
+    for row in alerted:
+        counts[row['b'], row['allergen']][1] = row['n']
+    return counts
+
+
+def rollup(since=None, full=False):
+    """
+    Rebuild rollup buckets from the bucket containing `since` onward (default:
+    the latest bucket already rolled up; everything if there is none or `full`).
+    Returns {period: number of ScanRollup rows written}.
+    """
+    written = {}
+    for period, trunc in TRUNC.items():
+        if full:
+            start = None
+        else:
+            start = since or ScanRollup.objects.filter(period=period).aggregate(m=Max('bucket'))['m']
+        if start is not None:
+            start = floor_bucket(start, period)
+
+        scans = ScanHistory.objects.all()
+        if start is not None:
+            scans = scans.filter(scanned_at__gte=start)
+
+        scan_rollups = {
+            (row['b'], row['food_item']): {
+                'scans': row['scans'], 'alerts': row['alerts'], 'low_confidence': row['low_confidence'],
+                'scored': row['scored'], 'confidence_sum': float(row['confidence_sum'] or 0),
+                'confidence_histogram': [row[f'bin{i}'] for i in range(CONFIDENCE_BINS)],
+            }
+            for row in _scan_rows(scans, trunc)
+        }
+        allergen_rollups = {
+            key: {'scans': n_scans, 'alerts': n_alerts}
+            for key, (n_scans, n_alerts) in _allergen_rows(scans, trunc).items()
+        }
+
+        with transaction.atomic():
+            _replace(ScanRollup, 'food_item_id', period, start, scan_rollups)
+            _replace(AllergenRollup, 'allergen_id', period, start, allergen_rollups)
+        written[period] = len(scan_rollups)
+    return written
+
+
+def _replace(model, key, period, start, rows):
+    """
+    Make `model`'s rows of `period` from `start` on exactly `rows`
+    ({(bucket, key value): counts}): rows for keys no longer present are
+    deleted, the rest upserted.
+    """
+    current = model.objects.filter(period=period)
+    if start is not None:
+        current = current.filter(bucket__gte=start)
+    gone = [pk for pk, bucket, value in current.values_list('pk', 'bucket', key) if (bucket, value) not in rows]
+    if gone:
+        model.objects.filter(pk__in=gone).delete()
+    for (bucket, value), counts in rows.items():
+        model.objects.update_or_create(period=period, bucket=bucket, **{key: value}, defaults=counts)
+
+
+# --- chart queries (rollup tables only) -----------------------------------
+
+def window_start(period, buckets):
+    """Start of the `buckets` most recent hours / days, the current one included."""
+    step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+    return floor_bucket(timezone.now(), period) - step * (buckets - 1)
+
+
+def scan_trend(period, start):
+    """Scans, alerts, alert rate and mean confidence per bucket."""
+    rows = (ScanRollup.objects.filter(period=period, bucket__gte=start)
+            .values('bucket')
+            .annotate(scans=Sum('scans'), alerts=Sum('alerts'), low_confidence=Sum('low_confidence'),
+                      scored=Sum('scored'), confidence_sum=Sum('confidence_sum'))
+            .order_by('bucket'))
+    return [
+        {
+            'bucket': row['bucket'].isoformat(),
+            'scans': row['scans'],
+            'alerts': row['alerts'],
+            'alert_rate': round(row['alerts'] / row['scans'], 4) if row['scans'] else 0.0,
+            'low_confidence': row['low_confidence'],
+            'avg_confidence': round(row['confidence_sum'] / row['scored'], 2) if row['scored'] else None,
+        }
+        for row in rows
+    ]
+
+
+def confidence_distribution(start):
+    """Scans per 10% confidence bin since `start`."""
+    histogram = [0] * CONFIDENCE_BINS
+    for row in ScanRollup.objects.filter(period='day', bucket__gte=start).values_list(
+            'confidence_histogram', flat=True):
+        for i, n in enumerate(row):
+            histogram[i] += n
+    width = 100 // CONFIDENCE_BINS
+    return [{'bin': f'{i * width}-{(i + 1) * width}%', 'scans': n} for i, n in enumerate(histogram)]
+
+
+def top_foods_by_week(start, limit=5):
+    """The `limit` most scanned foods of each week since `start`."""
+    rows = (ScanRollup.objects.filter(period='day', bucket__gte=start, food_item__isnull=False)
+            .annotate(week=TruncWeek('bucket'))
+            .values('week', 'food_item__name')
+            .annotate(scans=Sum('scans'))
+            .order_by('week', '-scans', 'food_item__name'))
+    weeks = {}
+    for row in rows:
+        foods = weeks.setdefault(row['week'].date().isoformat(), [])
+        if len(foods) < limit:
+            foods.append({'food': row['food_item__name'], 'scans': row['scans']})
+    return [{'week': week, 'foods': foods} for week, foods in weeks.items()]
+
+
+def allergen_summary(period, start):
+    """Scans of foods containing each allergen and the alerts it caused, since `start`."""
+    rows = (AllergenRollup.objects.filter(period=period, bucket__gte=start)
+            .values('allergen__name')
+            .annotate(scans=Sum('scans'), alerts=Sum('alerts'))
+            .order_by('-alerts', 'allergen__name'))
+    return [
+        {
+            'allergen': row['allergen__name'],
+            'scans': row['scans'],
+            'alerts': row['alerts'],
+            'alert_rate': round(row['alerts'] / row['scans'], 4) if row['scans'] else 0.0,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from allergy_app.models import Allergen, AllergyProfile, FoodItem, ScanHistory
+from allergy_app.signals import catalogue_imported, scans_bulk_saved
+from . import stats
+
+User = get_user_model()
+ProfileAllergens = AllergyProfile.allergens.through
+
+# Deltas are applied once the surrounding transaction commits, so rolled-back
+# edits never reach the counters. See stats.py.
+
+
+def _on_commit(fn, *args, **kwargs):
+    transaction.on_commit(lambda: fn(*args, **kwargs))
+
+
+# --- users (non-staff) ----------------------------------------------------
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._stats_is_staff = instance.__dict__.get('is_staff') if instance.pk else None
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    was_staff = instance._stats_is_staff
+    if created:
+        delta = 0 if instance.is_staff else 1
+    elif was_staff is None or was_staff == instance.is_staff:
+        delta = 0
+    else:
+        delta = -1 if instance.is_staff else 1
+    instance._stats_is_staff = instance.is_staff
+    if delta:
+        _on_commit(stats.bump, users=delta)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if not instance.is_staff:
+        _on_commit(stats.bump, users=-1)
+
+
+# --- catalogue ------------------------------------------------------------
+
+@receiver(post_save, sender=FoodItem)
+def food_created(sender, instance, created, **kwargs):
+    if created:
+        _on_commit(stats.bump, foods=1)
+
+
+@receiver(post_delete, sender=FoodItem)
+def food_deleted(sender, instance, **kwargs):
+    _on_commit(stats.bump, foods=-1)
+
+
+@receiver(post_save, sender=Allergen)
+def allergen_created(sender, instance, created, **kwargs):
+    if created:
+        _on_commit(stats.bump, allergens=1)
+
+
+@receiver(post_delete, sender=Allergen)
+def allergen_deleted(sender, instance, **kwargs):
+    _on_commit(stats.bump, allergens=-1)
+
+
+@receiver(catalogue_imported)
+def catalogue_imported_handler(sender, report, **kwargs):
+    # Already committed; bulk writes sent no post_save
+    stats.bump(foods=report.foods_created, allergens=report.allergens_created)
+
+
+# --- scans ----------------------------------------------------------------
+# The (food_item_id, allergen_detected) a scan was loaded with is kept on the
+# instance, so an update only applies the difference -- without a query.
+
+def _scan_state(instance):
+    fields = instance.__dict__
+    if instance.pk is None or 'food_item_id' not in fields or 'allergen_detected' not in fields:
+        return None
+    return fields['food_item_id'], fields['allergen_detected']
+
+
+def _apply_scan_change(old, new):
+    """Counter deltas going from state `old` to `new`; None means "no scan"."""
+    old_food, old_alert = old or (None, False)
+    new_food, new_alert = new or (None, False)
+    stats.bump(scans=(new is not None) - (old is not None), alerts=int(new_alert) - int(old_alert))
+    if old is not None and (new is None or old_food != new_food):
+        stats.bump_food(old_food, -1)
+    if new is not None and (old is None or old_food != new_food):
+        stats.bump_food(new_food, 1)
+
+
+def _scan_saved(instance, created):
+    new = (instance.food_item_id, instance.allergen_detected)
+    if created:
+        old = None
+    else:
+        old = getattr(instance, '_stats_state', None)
+        if old is None:  # loaded with deferred fields; left to recompute_stats
+            instance._stats_state = new
+            return
+    instance._stats_state = new
+    if old != new:
+        _on_commit(_apply_scan_change, old, new)
+
+
+@receiver(post_init, sender=ScanHistory)
+def scan_loaded(sender, instance, **kwargs):
+    instance._stats_state = _scan_state(instance)
+
+
+@receiver(post_save, sender=ScanHistory)
+def scan_saved(sender, instance, created, **kwargs):
+    _scan_saved(instance, created)
+
+
+@receiver(scans_bulk_saved)
+def scans_bulk_saved_handler(sender, scans, created, **kwargs):
+    for scan in scans:
+        _scan_saved(scan, created)
+
+
+@receiver(post_delete, sender=ScanHistory)
+def scan_deleted(sender, instance, **kwargs):
+    _on_commit(_apply_scan_change, (instance.food_item_id, instance.allergen_detected), None)
+
+
+# --- allergy profiles -----------------------------------------------------
+
+def _profile_allergens(instance, reverse, pk_set=None):
+    """Allergen ids currently linked, from the profile's or the allergen's side."""
+    links = ProfileAllergens.objects.all()
+    if not reverse:
+        links = links.filter(allergyprofile=instance)
+        if pk_set is not None:
+            links = links.filter(allergen__in=pk_set)
+        return list(links.values_list('allergen_id', flat=True))
+    links = links.filter(allergen=instance)
+    if pk_set is not None:
+        links = links.filter(allergyprofile__in=pk_set)
+    # One row per profile; every one of them touches `instance`
+    return [instance.pk] * links.count()
+
+
+@receiver(m2m_changed, sender=ProfileAllergens)
+def profile_allergens_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # pk_set for remove is what was asked for, not what was linked
+        instance._stats_removed = _profile_allergens(instance, reverse, pk_set)
+    elif action == 'post_add':  # pk_set only holds newly added links
+        allergen_ids = list(pk_set) if not reverse else [instance.pk] * len(pk_set)
+        _on_commit(stats.bump_allergens, allergen_ids, 1)
+    elif action in ('post_remove', 'post_clear'):
+        _on_commit(stats.bump_allergens, instance.__dict__.pop('_stats_removed', []), -1)
+
+
+@receiver(pre_delete, sender=AllergyProfile)
+def profile_deleting(sender, instance, **kwargs):
+    # The cascade removes the profile's links without m2m_changed
+    _on_commit(stats.bump_allergens, _profile_allergens(instance, reverse=False), -1)
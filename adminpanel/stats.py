@@ -0,0 +1,127 @@
+# adminpanel/stats.py
+#
+# Materialized statistics for the admin dashboard. Instead of COUNT(*) and
+# GROUP BY queries over every table on each page view, the dashboard reads a
+# handful of counter rows:
+#
+# * StatCounter: global totals (users, foods, allergens, scans, alerts and
+#   scans that matched no food item);
+# * FoodScanStat: scans per food item, for the "top foods" list;
+# * AllergenStat: users whose profile lists each allergen.
+#
+# signals.py applies deltas with `UPDATE ... SET value = value + n` once the
+# surrounding transaction commits. Code paths that bypass model signals
+# (bulk_create / bulk_update / QuerySet.update) or concurrent edits can make
+# the numbers drift; `manage.py recompute_stats` rebuilds everything exactly.
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+
+from allergy_app.models import Allergen, AllergyProfile, FoodItem, ScanHistory
+from .models import AllergenStat, FoodScanStat, StatCounter
+
+COUNTERS = ('users', 'foods', 'allergens', 'scans', 'alerts', 'unmatched_scans')
+
+
+def bump(**deltas):
+    """Add to global counters in one UPDATE, e.g. bump(scans=1, alerts=1)."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    increment = Case(
+        *[When(key=key, then=Value(delta)) for key, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    StatCounter.objects.filter(key__in=deltas).update(value=F('value') + increment)
+
+
+def _add(model, field, lookup, delta):
+    if not delta:
+        return
+    if model.objects.filter(**lookup).update(**{field: F(field) + delta}):
+        return
+    if delta > 0:
+        _, created = model.objects.get_or_create(**lookup, defaults={field: delta})
+        if not created:  # created concurrently
+            model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+
+def bump_food(food_id, delta):
+    """Scans matched to `food_id`, or unmatched scans if it is None."""
+    if food_id is None:
+        bump(unmatched_scans=delta)
+    else:
+        _add(FoodScanStat, 'scans', {'food_item_id': food_id}, delta)
+
+
+def bump_allergens(allergen_ids, delta):
+    """Affected users of each allergen; an id listed n times changes by n * delta."""
+    for allergen_id, n in Counter(allergen_ids).items():
+        _add(AllergenStat, 'affected_users', {'allergen_id': allergen_id}, n * delta)
+
+
+@transaction.atomic
+def recompute():
+    """Rebuild every statistic from the source tables; returns the counters."""
+    User = get_user_model()
+    values = {
+        'users': User.objects.filter(is_staff=False).count(),
+        'foods': FoodItem.objects.count(),
+        'allergens': Allergen.objects.count(),
+        'scans': ScanHistory.objects.count(),
+        'alerts': ScanHistory.objects.filter(allergen_detected=True).count(),
+        'unmatched_scans': ScanHistory.objects.filter(food_item__isnull=True).count(),
+    }
+    StatCounter.objects.all().delete()
+    StatCounter.objects.bulk_create(StatCounter(key=k, value=v) for k, v in values.items())
+
+    FoodScanStat.objects.all().delete()
+    per_food = (ScanHistory.objects.filter(food_item__isnull=False)
+                .values_list('food_item').annotate(n=Count('id')))
+    FoodScanStat.objects.bulk_create(
+        (FoodScanStat(food_item_id=food_id, scans=n) for food_id, n in per_food), batch_size=500
+    )
+
+    AllergenStat.objects.all().delete()
+    per_allergen = (AllergyProfile.allergens.through.objects
+                    .values_list('allergen').annotate(n=Count('allergyprofile', distinct=True)))
+    AllergenStat.objects.bulk_create(
+        (AllergenStat(allergen_id=allergen_id, affected_users=n) for allergen_id, n in per_allergen),
+        batch_size=500,
+    )
+    return values
+
+
+def counters():
+    """All global counters in one query, computing them on first use."""
+    values = dict(StatCounter.objects.values_list('key', 'value'))
+    if len(values) < len(COUNTERS):
+        values = recompute()
+    return values
+
+
+def top_foods(limit=5, unmatched=0):
+    """
+    Most scanned foods as dicts of food_item__name / n, like the old GROUP BY;
+    `unmatched` scans are ranked as a food named None.
+    """
+    rows = [
+        {'food_item__name': stat.food_item.name, 'n': stat.scans}
+        for stat in (FoodScanStat.objects.select_related('food_item')
+                     .filter(scans__gt=0).order_by('-scans')[:limit])
+    ]
+    if unmatched > 0:
+        rows.append({'food_item__name': None, 'n': unmatched})
+        rows.sort(key=lambda row: -row['n'])
+    return rows[:limit]
+
+
+def allergen_stats():
+    """Allergens annotated with `affected_users`, ordered by name."""
+    return (Allergen.objects
+            .annotate(affected_users=Coalesce('stat__affected_users', 0))
+            .order_by('name'))
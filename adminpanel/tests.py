@@ -1,3 +1,77 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from allergy_app import benchmark
+from allergy_app.models import Allergen, AllergyProfile, FoodItem, ScanHistory
+from allergy_app.tests import BenchmarkTestCase
+from .models import AllergenRollup, ScanRollup
+from .rollups import floor_bucket, rollup
+
+
+class AdminBenchmarkTests(BenchmarkTestCase):
+    views = ('dashboard', 'scan_list')
+
+    def test_query_counts_within_baseline(self):
+        results = self.run_benchmark()
+        self.assertEqual(benchmark.query_regressions(results, benchmark.load_baseline()), [])
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        milk = Allergen.objects.create(name='Milk')
+        wheat = Allergen.objects.create(name='Wheat')
+        cls.pie = FoodItem.objects.create(name='Apple pie', ingredients='See allergens')
+        cls.pie.allergens.add(milk, wheat)
+        cls.both = User.objects.create_user('alice', password='pw')
+        AllergyProfile.objects.create(user=cls.both).allergens.add(milk, wheat)
+        cls.milk_only = User.objects.create_user('bob', password='pw')
+        AllergyProfile.objects.create(user=cls.milk_only).allergens.add(milk)
+
+    def scan(self, user, at, detected=True, food=True):
+        scan = ScanHistory.objects.create(user=user, food_item=self.pie if food else None, confidence=90.0,
+                                          allergen_detected=detected)
+        ScanHistory.objects.filter(pk=scan.pk).update(scanned_at=at)
+
+    def rows(self):
+        return (sorted(ScanRollup.objects.values_list('period', 'bucket', 'food_item__name', 'scans', 'alerts'),
+                       key=str),
+                sorted(AllergenRollup.objects.values_list('period', 'bucket', 'allergen__name', 'scans', 'alerts')))
+
+    def test_incremental_rollup_matches_full_rebuild(self):
+        now = timezone.now()
+        self.scan(self.both, now - timedelta(hours=3))
+        self.scan(self.milk_only, now - timedelta(hours=3))
+        rollup()
+        # Later scans, one of them in the bucket already rolled up
+        self.scan(self.both, now - timedelta(hours=3), detected=False)
+        self.scan(self.milk_only, now)
+        rollup()
+        incremental = self.rows()
+
+        rollup(full=True)
+        self.assertEqual(self.rows(), incremental)
+        hour = floor_bucket(now, 'hour')
+        self.assertIn(('hour', hour, 'Milk', 1, 1), incremental[1])
+        self.assertIn(('hour', hour, 'Wheat', 1, 0), incremental[1])  # bob is not allergic to wheat
+        self.assertIn(('hour', hour - timedelta(hours=3), 'Wheat', 3, 1), incremental[1])
+
+    def test_rerun_upserts_instead_of_duplicating(self):
+        now = timezone.now()
+        self.scan(self.both, now - timedelta(hours=3))
+        self.scan(self.milk_only, now - timedelta(hours=3), detected=False, food=False)
+        rollup()
+        rolled_up = self.rows()
+        rollup(since=now - timedelta(days=2))  # overlaps every bucket already written
+        rollup()
+        self.assertEqual(self.rows(), rolled_up)
 
-# Create your tests here.
+        # The database refuses a second row for a bucket, the no-food one included
+        for food in (self.pie, None):
+            row = ScanRollup.objects.get(period='hour', food_item=food)
+            with self.subTest(food=food), self.assertRaises(IntegrityError), transaction.atomic():
+                ScanRollup.objects.create(period='hour', bucket=row.bucket, food_item=food)
@@ -10,14 +10,21 @@ urlpatterns = [
     path('foods/create/', views.food_create, name='food_create'),
     path('foods/<int:pk>/edit/', views.food_edit, name='food_edit'),
     path('foods/<int:pk>/delete/', views.food_delete, name='food_delete'),
+    path('foods/import/', views.catalogue_import, name='catalogue_import'),
+    path('foods/export/', views.catalogue_export, name='catalogue_export'),
     path('allergens/', views.allergen_list, name='allergen_list'),
     path('allergens/create/', views.allergen_create, name='allergen_create'),
     path('allergens/<int:pk>/edit/', views.allergen_edit, name='allergen_edit'),
     path('allergens/<int:pk>/delete/', views.allergen_delete, name='allergen_delete'),
     path('scans/', views.scan_list, name='scan_list'),
+    path('scans/page/', views.scan_page, name='scan_page'),
     path('scans/<int:pk>/delete/', views.scan_delete, name='scan_delete'),
     path('users/delete/<int:user_id>/', views.delete_user, name='delete_user'),
     path('users/edit/<int:user_id>/', views.edit_user, name='edit_user'),
+    path('analytics/scans/', views.analytics_scans, name='analytics_scans'),
+    path('analytics/confidence/', views.analytics_confidence, name='analytics_confidence'),
+    path('analytics/top-foods/', views.analytics_top_foods, name='analytics_top_foods'),
+    path('analytics/allergens/', views.analytics_allergens, name='analytics_allergens'),
 
 
 ]
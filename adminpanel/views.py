@@ -1,24 +1,24 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Count
+from . import rollups, stats
 from .decorators import staff_required
-from .forms import FoodItemForm, AllergenForm
+from .forms import CatalogueImportForm, FoodItemForm, AllergenForm
 from allergy_app.models import FoodItem, Allergen, ScanHistory  # adjust module
+from allergy_app.catalogue import FORMATS, CatalogueError, export_chunks, import_catalogue
+from allergy_app.pagination import keyset_page, page_response, page_size_from
 
 User = get_user_model()
 
 @login_required
 @staff_required
 def dashboard(request):
-    stats = {
-        'users': User.objects.filter(is_staff=False).count(),
-        'foods': FoodItem.objects.count(),
-        'allergens': Allergen.objects.count(),
-        'scans': ScanHistory.objects.count(),
-        'alerts': ScanHistory.objects.filter(allergen_detected=True).count(),
-    }
+    # Counters and top foods are materialized (see stats.py): a few small
+    # reads instead of COUNT(*) / GROUP BY over whole tables
+    counters = stats.counters()
+    stats_ctx = {key: counters[key] for key in ('users', 'foods', 'allergens', 'scans', 'alerts')}
     recent_scans = (ScanHistory.objects
                     .select_related('user', 'food_item')
                     .order_by('-scanned_at')[:15])
@@ -30,17 +30,12 @@ def dashboard(request):
              .prefetch_related('allergens')
              .order_by('name')[:20])
     
-    affected = (Allergen.objects
-                .annotate(affected_users=Count('allergyprofile', distinct=True))
-                .order_by('name'))
+    affected = stats.allergen_stats()
     
-    top_foods = (ScanHistory.objects
-                 .values('food_item__name')
-                 .annotate(n=Count('id'))
-                 .order_by('-n')[:5])
+    top_foods = stats.top_foods(5, unmatched=counters['unmatched_scans'])
     
     return render(request, 'adminpanel/dashboard.html', {
-        'stats': stats,
+        'stats': stats_ctx,
         'top_foods': top_foods,
         'recent_scans': recent_scans,
         'users': users,
@@ -91,9 +86,11 @@ def edit_user(request, user_id):
     else:
         form = UserEditForm(instance=user)
 
-    # Fetch all scan history for this user
-    scans = ScanHistory.objects.filter(user=user).order_by('-scanned_at')
-    
+    # One keyset page of the user's scan history; the rest loads on scroll
+    scans = keyset_page(
+        ScanHistory.objects.filter(user=user).select_related('food_item'),
+        request.GET.get('cursor'),
+    )
 
     return render(request, 'adminpanel/edit_user.html', {
         'form': form,
@@ -154,6 +151,37 @@ def food_delete(request, pk):
         return redirect('adminpanel:food_list')
     return render(request, 'adminpanel/confirm_delete.html', {'obj': food})
 
+@login_required
+@staff_required
+def catalogue_import(request):
+    report = None
+    if request.method == 'POST':
+        form = CatalogueImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                report = import_catalogue(form.cleaned_data['file'], form.format,
+                                          dry_run=form.cleaned_data['dry_run'])
+            except CatalogueError as e:
+                form.add_error('file', str(e))
+            else:
+                verb = 'Checked' if report.dry_run else 'Imported'
+                messages.success(request, f'{verb} {report.rows} rows in {report.seconds:.2f}s '
+                                          f'({report.rows_per_second:.0f} rows/s).')
+    else:
+        form = CatalogueImportForm()
+    return render(request, 'adminpanel/catalogue_import.html', {'form': form, 'report': report})
+
+@login_required
+@staff_required
+def catalogue_export(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        fmt = 'csv'
+    content_type = {'csv': 'text/csv', 'json': 'application/json', 'jsonl': 'application/x-ndjson'}[fmt]
+    response = StreamingHttpResponse(export_chunks(fmt), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="safebite-catalogue.{fmt}"'
+    return response
+
 @login_required
 @staff_required
 def allergen_list(request):
@@ -200,10 +228,26 @@ def allergen_delete(request, pk):
 @login_required 
 @staff_required
 def scan_list(request):
-    scans = (ScanHistory.objects
-             .select_related('user', 'food_item')
-             .order_by('-scanned_at')[:200])
+    scans = keyset_page(
+        ScanHistory.objects.select_related('user', 'food_item'),
+        request.GET.get('cursor'),
+        page_size=50,
+    )
     return render(request, 'adminpanel/scan_list.html', {'scans': scans})
+
+@login_required
+@staff_required
+def scan_page(request):
+    """Next page of all scans, or of one user's scans (?user=<id>), for infinite scroll."""
+    scans = ScanHistory.objects.select_related('user', 'food_item')
+    user_id = request.GET.get('user', '')
+    if user_id.isdigit():
+        scans = scans.filter(user_id=int(user_id))
+    page = keyset_page(scans, request.GET.get('cursor'), page_size_from(request, default=50))
+    return page_response(request, page, 'adminpanel/_scan_rows.html', {
+        'show_user': not user_id.isdigit(),
+        'show_actions': not user_id.isdigit(),
+    })
 # views.py
 @login_required
 @staff_required
@@ -215,3 +259,54 @@ def scan_delete(request, pk):
         return redirect('adminpanel:scan_list')
     return render(request, 'adminpanel/confirm_delete.html', {'obj': scan})
 
+
+
+# Analytics chart data, read from the rollup tables only (see rollups.py)
+ANALYTICS_MAX_BUCKETS = {'hour': 24 * 14, 'day': 366}
+
+
+def _analytics_window(request, default_period='day'):
+    period = request.GET.get('period', default_period)
+    if period not in rollups.TRUNC:
+        period = default_period
+    default = 48 if period == 'hour' else 30
+    try:
+        buckets = int(request.GET.get('buckets', default))
+    except ValueError:
+        buckets = default
+    buckets = max(1, min(buckets, ANALYTICS_MAX_BUCKETS[period]))
+    return period, rollups.window_start(period, buckets)
+
+
+@login_required
+@staff_required
+def analytics_scans(request):
+    """Scans, alerts and alert rate per hour / day (?period=hour|day&buckets=N)."""
+    period, start = _analytics_window(request)
+    return JsonResponse({'period': period, 'series': rollups.scan_trend(period, start)})
+
+
+@login_required
+@staff_required
+def analytics_confidence(request):
+    """Confidence histogram over the last ?buckets=N days."""
+    _, start = _analytics_window(request, 'day')
+    return JsonResponse({'bins': rollups.confidence_distribution(start)})
+
+
+@login_required
+@staff_required
+def analytics_top_foods(request):
+    """Top ?limit=N foods per week over the last ?buckets=N days."""
+    _, start = _analytics_window(request, 'day')
+    limit = request.GET.get('limit', '5')
+    limit = max(1, min(int(limit), 20)) if limit.isdigit() else 5
+    return JsonResponse({'weeks': rollups.top_foods_by_week(start, limit)})
+
+
+@login_required
+@staff_required
+def analytics_allergens(request):
+    """Alerts and exposure per allergen over the window."""
+    period, start = _analytics_window(request)
+    return JsonResponse({'period': period, 'allergens': rollups.allergen_summary(period, start)})
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import Allergen, AllergyProfile, FoodItem, ScanHistory
+from .thumbnails import get_thumbnail_url
+from .models import Allergen, AllergyProfile, FoodClass, FoodItem, ScanHistory, ScanJob
 
 
 @admin.register(Allergen)
@@ -69,7 +70,7 @@ class FoodItemInline(admin.StackedInline):
 
     def image_preview(self, obj):
         if getattr(obj, "image", None) and getattr(obj.image, "url", None):
-            return format_html('<img src="{}" style="max-height:120px; max-width:160px; border:1px solid #ddd;"/>', obj.image.url)
+            return format_html('<img src="{}" style="max-height:120px; max-width:160px; border:1px solid #ddd;"/>', get_thumbnail_url(obj.image, 320))
         return "-"
     image_preview.short_description = "Preview"
 
@@ -96,12 +97,33 @@ class ScanHistoryAdmin(admin.ModelAdmin):
 
     def thumbnail(self, obj):
         if getattr(obj, "image", None) and getattr(obj.image, "url", None):
-            return format_html('<img src="{}" style="height:40px; width:auto; border-radius:4px;"/>', obj.image.url)
+            return format_html('<img src="{}" style="height:40px; width:auto; border-radius:4px;"/>', get_thumbnail_url(obj.image, 96))
         return "-"
     thumbnail.short_description = "Image"
 
     def image_preview(self, obj):
         if getattr(obj, "image", None) and getattr(obj.image, "url", None):
-            return format_html('<img src="{}" style="max-height:240px; max-width:320px; border:1px solid #ddd;"/>', obj.image.url)
+            return format_html('<img src="{}" style="max-height:240px; max-width:320px; border:1px solid #ddd;"/>', get_thumbnail_url(obj.image, 320))
         return "-"
     image_preview.short_description = "Preview"
+
+
+@admin.register(ScanJob)
+class ScanJobAdmin(admin.ModelAdmin):
+    list_display = ["id", "scan", "status", "attempts", "created_at", "finished_at"]
+    list_filter = ["status"]
+    readonly_fields = ["scan", "result", "error", "attempts", "created_at", "started_at", "finished_at"]
+    list_select_related = ["scan__user", "scan__food_item"]
+    ordering = ["-created_at"]
+    list_per_page = 25
+
+
+@admin.register(FoodClass)
+class FoodClassAdmin(admin.ModelAdmin):
+    list_display = ["index", "label", "food_item"]
+    list_editable = ["food_item"]
+    list_filter = [("food_item", admin.EmptyFieldListFilter)]
+    search_fields = ["label", "food_item__name"]
+    readonly_fields = ["index", "label"]
+    list_select_related = ["food_item"]
+    list_per_page = 101
@@ -0,0 +1,86 @@
+# allergy_app/allergen_cache.py
+#
+# Shared cache entries behind the allergen index, stored in the 'allergens'
+# cache alias (local memory by default; point it at a file-based cache to share
+# entries and invalidations between worker processes).
+#
+# * catalogue token: an opaque value replaced on every allergen / food /
+#   food-allergen change. The catalogue snapshot (allergens, foods and their
+#   allergen ids) is stored under a key versioned by that token, so stale
+#   snapshots are never read, only left to expire.
+# * per-user allergen ids: one key per user, deleted when the user's profile
+#   or its allergens change.
+#
+# A process-local cache cannot carry invalidations to other workers, so
+# multi-worker deployments (WEB_CONCURRENCY > 1) refuse to start without a
+# shared one.
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+CACHE_ALIAS = 'allergens'
+TOKEN_KEY = 'catalogue-token'
+NO_PROFILE = 'none'  # cached marker for users without an AllergyProfile
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def is_shared():
+    """Whether the 'allergens' cache is visible to other processes."""
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def require_shared_cache():
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    if workers > 1 and not is_shared():
+        raise ImproperlyConfigured(
+            f'WEB_CONCURRENCY={workers} needs a shared allergens cache: set '
+            'SAFEBITE_ALLERGEN_CACHE_DIR or point CACHES["allergens"] at a shared backend.'
+        )
+
+
+def _ttl():
+    return getattr(settings, 'ALLERGEN_INDEX_TTL', 60) or None
+
+
+def catalogue_token():
+    cache = _cache()
+    token = cache.get(TOKEN_KEY)
+    if token is None:
+        token = uuid.uuid4().hex
+        if not cache.add(TOKEN_KEY, token, timeout=None):
+            token = cache.get(TOKEN_KEY, token)
+    return token
+
+
+def bump_catalogue_token():
+    token = uuid.uuid4().hex
+    _cache().set(TOKEN_KEY, token, timeout=None)
+    return token
+
+
+def get_catalogue(token):
+    return _cache().get(f'catalogue:{token}')
+
+
+def set_catalogue(token, snapshot):
+    _cache().set(f'catalogue:{token}', snapshot, timeout=None)
+
+
+def get_user_allergens(user_id):
+    """Tuple of allergen ids, NO_PROFILE, or None when not cached."""
+    return _cache().get(f'user-allergens:{user_id}')
+
+
+def set_user_allergens(user_id, allergen_ids):
+    _cache().set(f'user-allergens:{user_id}', allergen_ids, timeout=_ttl())
+
+
+def forget_users(user_ids):
+    _cache().delete_many([f'user-allergens:{user_id}' for user_id in user_ids])
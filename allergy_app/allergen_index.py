@@ -0,0 +1,189 @@
+# allergy_app/allergen_index.py
+#
+# In-memory allergen index: every Allergen owns one bit, every FoodItem and
+# AllergyProfile is summarized as an integer bitmask of its allergens. Overlap
+# checks and "safe alternative" filtering become bitwise ANDs instead of
+# per-item queries and Python sets.
+#
+# The classifier's class indices are mapped to foods here too (see
+# food_classes.py), so a prediction resolves to a food without a query.
+#
+# The catalogue part (allergens, foods, their allergens and the class map) is
+# loaded once per catalogue token from the shared allergen cache (see
+# allergen_cache.py), falling back to four queries. After a change commits, the
+# signal handlers in signals.py replace the token and publish a snapshot read
+# back from the database, so other processes sharing the cache pick it up
+# without querying. Users'
+# allergen sets are cached per user and dropped when their profile changes. As
+# a safety net for process-local caches, the index is re-read from the
+# database after ALLERGEN_INDEX_TTL seconds.
+import threading
+import time
+
+from django.conf import settings
+
+from . import allergen_cache
+from .models import Allergen, AllergyProfile, FoodClass, FoodItem
+
+
+class AllergenIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._token = None
+        self._built_at = None
+        self._bits = {}  # allergen id -> bit position
+        self._allergen_names = {}  # bit position -> allergen name
+        self._food_names = {}  # food id -> name
+        self._food_allergens = {}  # food id -> frozenset of allergen ids
+        self._food_masks = {}  # food id -> mask
+        self._classes = {}  # classifier class index -> food id
+        self._version = 0  # bumped on every change, for indexes derived from this one
+
+    # --- building -------------------------------------------------------
+
+    def _ensure_built(self):
+        ttl = getattr(settings, 'ALLERGEN_INDEX_TTL', 60)
+        token = allergen_cache.catalogue_token()
+        if self._built_at is None or (ttl and time.monotonic() - self._built_at > ttl):
+            snapshot = self._query_snapshot()
+            self._apply(snapshot, token)
+            allergen_cache.set_catalogue(token, snapshot)
+        elif token != self._token:
+            snapshot = allergen_cache.get_catalogue(token)
+            if snapshot is None:
+                snapshot = self._query_snapshot()
+                allergen_cache.set_catalogue(token, snapshot)
+            self._apply(snapshot, token)
+
+    def rebuild(self):
+        """
+        Re-read the catalogue from the database and publish it to other processes.
+
+        The token is replaced before the database is read, so the snapshot
+        stored under the newest token includes every committed change. Patching
+        this process's copy instead could publish a stale catalogue over another
+        worker's newer one.
+        """
+        with self._lock:
+            token = allergen_cache.bump_catalogue_token()
+            snapshot = self._query_snapshot()
+            self._apply(snapshot, token)
+            allergen_cache.set_catalogue(token, snapshot)
+
+    def _query_snapshot(self):
+        """Four queries regardless of catalogue size."""
+        food_allergens = {}
+        through = FoodItem.allergens.through.objects.values_list('fooditem_id', 'allergen_id')
+        for food_id, allergen_id in through:
+            food_allergens.setdefault(food_id, []).append(allergen_id)
+        return {
+            'allergens': list(Allergen.objects.order_by('pk').values_list('pk', 'name')),
+            'foods': dict(FoodItem.objects.values_list('pk', 'name')),
+            'food_allergens': food_allergens,
+            'classes': self._query_classes(),
+        }
+
+    def _query_classes(self):
+        return dict(FoodClass.objects.exclude(food_item=None).values_list('index', 'food_item_id'))
+
+    def _apply(self, snapshot, token):
+        self._bits, self._allergen_names = {}, {}
+        for bit, (allergen_id, name) in enumerate(snapshot['allergens']):
+            self._bits[allergen_id] = bit
+            self._allergen_names[bit] = name
+        self._food_names = dict(snapshot['foods'])
+        self._food_allergens = {
+            food_id: frozenset(snapshot['food_allergens'].get(food_id, ()))
+            for food_id in self._food_names
+        }
+        self._food_masks = {
+            food_id: self._mask(allergen_ids) for food_id, allergen_ids in self._food_allergens.items()
+        }
+        self._classes = dict(snapshot['classes'])
+        self._token = token
+        self._built_at = time.monotonic()
+        self._version += 1
+
+    def _mask(self, allergen_ids):
+        mask = 0
+        for allergen_id in allergen_ids:
+            bit = self._bits.get(allergen_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    # --- lookups --------------------------------------------------------
+
+    def mask_for_allergens(self, allergen_ids):
+        with self._lock:
+            self._ensure_built()
+            return self._mask(allergen_ids)
+
+    def food_mask(self, food_id):
+        with self._lock:
+            self._ensure_built()
+            return self._food_masks.get(food_id, 0)
+
+    def user_mask(self, user_id):
+        """Bitmask of the user's profile allergens, or None if the user has no profile."""
+        allergen_ids = allergen_cache.get_user_allergens(user_id)
+        if allergen_ids is None:
+            rows = list(AllergyProfile.objects.filter(user_id=user_id).values_list('allergens', flat=True))
+            allergen_ids = tuple(a for a in rows if a is not None) if rows else allergen_cache.NO_PROFILE
+            allergen_cache.set_user_allergens(user_id, allergen_ids)
+        if allergen_ids == allergen_cache.NO_PROFILE:
+            return None
+        return self.mask_for_allergens(allergen_ids)
+
+    def names(self, mask):
+        """Sorted allergen names for the bits set in `mask`."""
+        with self._lock:
+            self._ensure_built()
+            names = []
+            bit = 0
+            while mask:
+                if mask & 1 and bit in self._allergen_names:
+                    names.append(self._allergen_names[bit])
+                mask >>= 1
+                bit += 1
+            return sorted(names)
+
+    def food_for_class(self, class_idx):
+        """(food id, name) the classifier's class maps to, or None if it is unmapped."""
+        with self._lock:
+            self._ensure_built()
+            food_id = self._classes.get(class_idx)
+            if food_id not in self._food_names:  # unmapped, or the food was deleted
+                return None
+            return food_id, self._food_names[food_id]
+
+    def safe_foods(self, mask, exclude=None):
+        """(id, name) of every food sharing no allergen with `mask`."""
+        with self._lock:
+            self._ensure_built()
+            return [
+                (food_id, self._food_names[food_id])
+                for food_id, food_mask in self._food_masks.items()
+                if not food_mask & mask and food_id != exclude
+            ]
+
+    def version(self):
+        """Changes whenever the catalogue may have; derived indexes rebuild on it."""
+        with self._lock:
+            self._ensure_built()
+            return self._version
+
+    def foods_view(self):
+        """(version, {food id: name}, {food id: mask}, {class index: food id})."""
+        with self._lock:
+            self._ensure_built()
+            return self._version, dict(self._food_names), dict(self._food_masks), dict(self._classes)
+
+    # --- invalidation (called from signals.py) ------------------------
+
+    def forget_users(self, user_ids):
+        """Drop cached profile allergens; they are reloaded on next lookup."""
+        allergen_cache.forget_users(user_ids)
+
+
+allergen_index = AllergenIndex()
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AllergyAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'allergy_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .allergen_cache import require_shared_cache
+        require_shared_cache()
@@ -0,0 +1,251 @@
+# allergy_app/benchmark.py
+#
+# End-to-end benchmark of the scan flow, used by `manage.py benchmark_scans`
+# and by the query-count regression tests.
+#
+# * seed(): the Food-101 catalogue from seed_data.py plus synthetic users (with
+#   random allergy profiles) and scan history;
+# * StubBackend: stands in for the classifier with a fixed cost per forward
+#   pass, so no model (or TensorFlow) is needed and timings are repeatable;
+# * run_view(): drives one view with N concurrent clients, each on its own
+#   thread and database connection, recording latency and query count per
+#   request;
+# * compare(): flags views slower or chattier than a stored baseline.
+import io
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from .models import Allergen, AllergyProfile, FoodItem, ScanHistory
+from .ml_model import load_model
+from .seed_data import seed_catalogue
+from .thumbnails import create_thumbnails, wait_for_thumbnails
+
+BASELINE_PATH = settings.BASE_DIR / 'allergy_app' / 'benchmark_baseline.json'
+
+
+class StubBackend:
+    """Classifier of fixed cost: `cost_ms` per forward pass, class picked from the pixels."""
+    name = 'stub'
+
+    def __init__(self, cost_ms=20.0, num_classes=None):
+        self.cost_s = cost_ms / 1000.0
+        self.num_classes = num_classes or len(load_model.food_classes)
+
+    def predict(self, batch):
+        time.sleep(self.cost_s)
+        batch = np.asarray(batch)
+        if batch.ndim == 3:
+            batch = batch[None]
+        out = np.full((len(batch), self.num_classes), 0.1 / (self.num_classes - 1), dtype=np.float32)
+        for i, image in enumerate(batch):
+            out[i, int(abs(float(image.mean())) * 1e4) % self.num_classes] = 0.9
+        return out
+
+
+def install_stub(cost_ms=20.0):
+    """Serve predictions from StubBackend; the batching engine and cache start empty."""
+    with load_model._load_lock:
+        load_model._backend = StubBackend(cost_ms)
+        load_model._engine = None
+        load_model._prediction_cache = None
+
+
+def jpeg_bytes(rng, size=(320, 240)):
+    """A small random-noise JPEG; every one is distinct, so the prediction cache misses."""
+    pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, 'JPEG', quality=80)
+    return buf.getvalue()
+
+
+# --- seeding -----------------------------------------------------------------
+
+def seed(users=200, scans_per_user=20, random_seed=1337):
+    """
+    Catalogue plus `users` users with 0-3 random allergens and `scans_per_user`
+    scans each, written with bulk inserts. Returns the staff user.
+    """
+    rng = random.Random(random_seed)
+    seed_catalogue()
+    allergen_ids = list(Allergen.objects.values_list('pk', flat=True))
+    food_ids = list(FoodItem.objects.values_list('pk', flat=True))
+    image_name = default_storage.save('scans/benchmark.jpg',
+                                      ContentFile(jpeg_bytes(np.random.default_rng(random_seed))))
+    create_thumbnails(image_name)  # bulk inserts skip the signal that renders them
+
+    password = make_password(None)
+    User.objects.bulk_create(
+        [User(username=f'bench{i}', password=password) for i in range(users)], batch_size=500)
+    bench_users = list(User.objects.filter(username__startswith='bench').values_list('pk', flat=True))
+    AllergyProfile.objects.bulk_create([AllergyProfile(user_id=pk) for pk in bench_users], batch_size=500)
+    profiles = dict(AllergyProfile.objects.filter(user_id__in=bench_users).values_list('user_id', 'pk'))
+    Link = AllergyProfile.allergens.through
+    Link.objects.bulk_create([
+        Link(allergyprofile_id=profiles[pk], allergen_id=a)
+        for pk in bench_users for a in rng.sample(allergen_ids, rng.randint(0, 3))
+    ], batch_size=500)
+
+    ScanHistory.objects.bulk_create([
+        ScanHistory(user_id=pk, food_item_id=rng.choice(food_ids + [None]), image=image_name,
+                    allergen_detected=rng.random() < 0.3, confidence=round(rng.uniform(20, 99), 2))
+        for pk in bench_users for _ in range(scans_per_user)
+    ], batch_size=500)
+
+    return User.objects.create_user('bench-staff', password=None, is_staff=True)
+
+
+# --- driving views -------------------------------------------------------------
+
+@dataclass
+class ViewResult:
+    view: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float  # requests / s
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries: float  # median per request
+    max_queries: int
+
+
+def run_view(view, request_fn, users, clients=4, requests=50, warmup=2):
+    """
+    Send `requests` requests per client, from `clients` threads at once, after
+    `warmup` unrecorded ones (cold caches, first thumbnails).
+    `request_fn(client, i)` makes one request and returns the response;
+    `users` are logged in round-robin, one per client.
+    """
+    latencies, queries, errors, windows = [], [], [], []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = Client()
+        client.force_login(users[n % len(users)])
+        try:
+            for i in range(warmup):
+                request_fn(client, clients * requests + n * warmup + i)
+            window_start = time.perf_counter()
+            for i in range(requests):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = request_fn(client, n * requests + i)
+                    elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(len(ctx.captured_queries))
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+            with lock:
+                windows.append((window_start, time.perf_counter()))
+        finally:
+            if clients > 1:
+                connection.close()
+
+    if clients == 1:
+        worker(0)  # inline: keeps the test case's transaction and connection
+    else:
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(worker, range(clients)))
+    seconds = max(end for _, end in windows) - min(start for start, _ in windows)
+
+    ms = np.array(latencies) * 1000.0
+    return ViewResult(
+        view=view,
+        requests=len(latencies),
+        errors=len(errors),
+        seconds=round(seconds, 3),
+        throughput=round(len(latencies) / seconds, 2) if seconds else 0.0,
+        p50_ms=round(float(np.percentile(ms, 50)), 2),
+        p95_ms=round(float(np.percentile(ms, 95)), 2),
+        p99_ms=round(float(np.percentile(ms, 99)), 2),
+        queries=float(np.median(queries)),
+        max_queries=max(queries),
+    )
+
+
+def scan_views(images):
+    """(view name, request function, staff only) for every benchmarked view."""
+    def scan(client, i):
+        upload = SimpleUploadedFile('meal.jpg', images[i % len(images)], content_type='image/jpeg')
+        return client.post('/scan/', {'image': upload})
+
+    return [
+        ('scan_food', scan, False),
+        ('home', lambda client, i: client.get('/'), False),
+        ('dashboard', lambda client, i: client.get('/adminpanel/'), True),
+        ('scan_list', lambda client, i: client.get('/adminpanel/scans/'), True),
+    ]
+
+
+def run(users, staff, clients=4, requests=50, only=None, warmup=2, random_seed=1337):
+    """Benchmark every view (or those named in `only`); returns a list of ViewResult."""
+    rng = np.random.default_rng(random_seed)
+    images = [jpeg_bytes(rng) for _ in range(clients * (requests + warmup))]
+    results = []
+    for view, request_fn, staff_only in scan_views(images):
+        if only and view not in only:
+            continue
+        results.append(run_view(view, request_fn, [staff] if staff_only else users,
+                                clients, requests, warmup))
+        wait_for_thumbnails()  # scans leave renditions queued; don't bill them to the next view
+    return results
+
+
+# --- baseline ------------------------------------------------------------------
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, config, path=BASELINE_PATH):
+    with open(path, 'w') as f:
+        json.dump({'config': config, 'views': {r.view: asdict(r) for r in results}}, f, indent=2)
+        f.write('\n')
+
+
+def query_regressions(results, baseline):
+    """Views issuing more queries per request than in `baseline`; timings are not compared."""
+    return [p for p in compare(results, baseline, tolerance=float('inf')) if 'queries' in p]
+
+
+def compare(results, baseline, tolerance=0.5):
+    """
+    Regressions against `baseline`: any view issuing more queries per request,
+    or whose p95 latency / throughput is more than `tolerance` worse.
+    """
+    problems = []
+    for r in results:
+        base = (baseline or {}).get('views', {}).get(r.view)
+        if base is None:
+            continue
+        if r.queries > base['queries']:
+            problems.append(f"{r.view}: {r.queries:g} queries per request (baseline {base['queries']:g})")
+        if r.p95_ms > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{r.view}: p95 {r.p95_ms:.1f} ms (baseline {base['p95_ms']:.1f} ms)")
+        if r.throughput < base['throughput'] / (1 + tolerance):
+            problems.append(f"{r.view}: {r.throughput:.1f} req/s (baseline {base['throughput']:.1f})")
+        if r.errors:
+            problems.append(f"{r.view}: {r.errors} failed requests")
+    return problems
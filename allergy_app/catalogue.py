@@ -0,0 +1,263 @@
+# allergy_app/catalogue.py
+#
+# Bulk import / export of the food catalogue (allergens, foods and the
+# allergens each food contains) as CSV, JSON or JSON Lines.
+#
+# Imports stream the file in chunks: every chunk is written with
+# bulk_create / bulk_update and its FoodItem.allergens links with one
+# through-table delete and one bulk insert, all inside a single transaction,
+# so a bad row leaves the catalogue untouched. An imported food's allergen
+# list replaces the stored one, which makes export -> import a round trip.
+# Allergen and food names match existing ones case-insensitively ('milk' is
+# the stored 'Milk'); new rows keep the spelling of the file.
+#
+#   CSV        kind,name,ingredients,allergens   (allergens separated by ';',
+#              kind is 'food' (default) or 'allergen')
+#   JSON       {"allergens": [...names], "foods": [{"name", "ingredients", "allergens"}]}
+#   JSON Lines one {"kind": ..., "name": ..., ...} object per line
+#
+# Bulk writes skip model signals, so the allergen index is rebuilt once after
+# commit and `catalogue_imported` is sent for other listeners.
+import csv
+import io
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from . import food_classes
+from .allergen_index import allergen_index
+from .models import Allergen, FoodItem
+from .signals import catalogue_imported
+
+FORMATS = ('csv', 'json', 'jsonl')
+CSV_FIELDS = ['kind', 'name', 'ingredients', 'allergens']
+CHUNK_SIZE = 1000
+
+
+class CatalogueError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    allergens_created: int = 0
+    foods_created: int = 0
+    foods_updated: int = 0
+    links_written: int = 0
+    classes_linked: int = 0
+    seconds: float = 0.0
+    dry_run: bool = False
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def format_for(filename):
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    if ext == 'ndjson':
+        ext = 'jsonl'
+    if ext not in FORMATS:
+        raise CatalogueError(f"Unsupported catalogue file '{filename}'; use .csv, .json or .jsonl.")
+    return ext
+
+
+# --- reading ----------------------------------------------------------------
+
+def _text_lines(stream):
+    """Decoded lines of a binary or text stream, read incrementally."""
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def _text(raw, key, where):
+    value = raw.get(key) or ''
+    if not isinstance(value, str):
+        raise CatalogueError(f"{where}: '{key}' must be a string.")
+    return value.strip()
+
+
+def _entry(raw, where):
+    if not isinstance(raw, dict):
+        raise CatalogueError(f"{where}: expected an object, got {type(raw).__name__}.")
+    kind = _text(raw, 'kind', where).lower() or 'food'
+    name = _text(raw, 'name', where)
+    if kind not in ('food', 'allergen'):
+        raise CatalogueError(f"{where}: unknown kind '{kind}'.")
+    if not name:
+        raise CatalogueError(f"{where}: missing name.")
+    allergens = raw.get('allergens') or []
+    if not isinstance(allergens, list) or not all(isinstance(a, str) for a in allergens):
+        raise CatalogueError(f"{where}: 'allergens' must be a list of names.")
+    return {
+        'kind': kind,
+        'name': name,
+        'ingredients': _text(raw, 'ingredients', where) or 'See allergens',
+        'allergens': sorted({a.strip().casefold(): a.strip() for a in allergens if a.strip()}.values()),
+    }
+
+
+def read_entries(stream, fmt):
+    """Yield normalized catalogue entries from an open file in format `fmt`."""
+    if fmt == 'csv':
+        for line_no, raw in enumerate(csv.DictReader(_text_lines(stream)), start=2):
+            raw['allergens'] = (raw.get('allergens') or '').split(';')
+            yield _entry(raw, f'line {line_no}')
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(_text_lines(stream), start=1):
+            if line.strip():
+                try:
+                    raw = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise CatalogueError(f"line {line_no}: {e}")
+                yield _entry(raw, f'line {line_no}')
+    else:
+        try:
+            document = json.loads(''.join(_text_lines(stream)))
+        except json.JSONDecodeError as e:
+            raise CatalogueError(f"invalid JSON: {e}")
+        if not isinstance(document, dict):
+            raise CatalogueError('expected an object with "allergens" and "foods" lists.')
+        for key in ('allergens', 'foods'):
+            if not isinstance(document.get(key, []), list):
+                raise CatalogueError(f"'{key}' must be a list.")
+        for i, name in enumerate(document.get('allergens', [])):
+            yield _entry({'kind': 'allergen', 'name': name}, f'allergens[{i}]')
+        for i, raw in enumerate(document.get('foods', [])):
+            yield _entry(raw, f'foods[{i}]')
+
+
+def _chunks(entries, size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- importing --------------------------------------------------------------
+
+def import_catalogue(stream, fmt, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Import an open catalogue file; returns an ImportReport. Raises CatalogueError."""
+    report = ImportReport(dry_run=dry_run)
+    started = time.perf_counter()
+    Link = FoodItem.allergens.through
+
+    with transaction.atomic():
+        # Keyed by casefolded name
+        allergen_ids = {name.casefold(): pk for name, pk in Allergen.objects.values_list('name', 'pk')}
+        foods = {name.casefold(): (pk, ingredients)
+                 for pk, name, ingredients in FoodItem.objects.values_list('pk', 'name', 'ingredients')}
+        links = {}
+        for food_id, allergen_id in Link.objects.values_list('fooditem_id', 'allergen_id'):
+            links.setdefault(food_id, set()).add(allergen_id)
+
+        for chunk in _chunks(read_entries(stream, fmt), chunk_size):
+            report.rows += len(chunk)
+
+            # Allergens named anywhere in the chunk
+            names = {}
+            for e in chunk:
+                for name in ([e['name']] if e['kind'] == 'allergen' else e['allergens']):
+                    names.setdefault(name.casefold(), name)
+            new_allergens = [Allergen(name=name) for key, name in sorted(names.items()) if key not in allergen_ids]
+            Allergen.objects.bulk_create(new_allergens)
+            if new_allergens:
+                # Not every backend returns primary keys from bulk_create
+                allergen_ids.update(
+                    (name.casefold(), pk) for name, pk in Allergen.objects.filter(
+                        name__in=[a.name for a in new_allergens]).values_list('name', 'pk'))
+            report.allergens_created += len(new_allergens)
+
+            # Foods: create new, update changed ingredients (last row wins)
+            food_entries = {e['name'].casefold(): e for e in chunk if e['kind'] == 'food'}
+            new_foods, changed = [], []
+            for key, entry in food_entries.items():
+                if key not in foods:
+                    new_foods.append(FoodItem(name=entry['name'], ingredients=entry['ingredients']))
+                elif foods[key][1] != entry['ingredients']:
+                    changed.append(FoodItem(pk=foods[key][0], ingredients=entry['ingredients']))
+            FoodItem.objects.bulk_create(new_foods)
+            FoodItem.objects.bulk_update(changed, ['ingredients'])
+            if new_foods:
+                foods.update({
+                    name.casefold(): (pk, ingredients)
+                    for pk, name, ingredients in FoodItem.objects
+                    .filter(name__in=[f.name for f in new_foods]).values_list('pk', 'name', 'ingredients')
+                })
+            report.foods_created += len(new_foods)
+            report.foods_updated += len(changed)
+
+            # Allergen links: rewrite only foods whose set changed
+            stale, rows = [], []
+            for key, entry in food_entries.items():
+                food_id = foods[key][0]
+                wanted = {allergen_ids[a.casefold()] for a in entry['allergens']}
+                if links.get(food_id, set()) != wanted:
+                    stale.append(food_id)
+                    rows.extend(Link(fooditem_id=food_id, allergen_id=a) for a in wanted)
+                    links[food_id] = wanted
+            if stale:
+                Link.objects.filter(fooditem_id__in=stale).delete()
+                Link.objects.bulk_create(rows, batch_size=500)
+            report.links_written += len(rows)
+
+        # New foods may complete the classifier class map
+        report.classes_linked = len(food_classes.sync(dry_run=dry_run).linked)
+
+        if dry_run:
+            transaction.set_rollback(True)
+        else:
+            transaction.on_commit(allergen_index.rebuild)
+            transaction.on_commit(lambda: catalogue_imported.send(sender=FoodItem, report=report))
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+# --- exporting --------------------------------------------------------------
+
+def export_entries():
+    """Catalogue entries: every allergen, then every food with its allergen names (3 queries)."""
+    allergen_names = dict(Allergen.objects.values_list('pk', 'name'))
+    for name in sorted(allergen_names.values()):
+        yield {'kind': 'allergen', 'name': name, 'ingredients': '', 'allergens': []}
+    links = {}
+    for food_id, allergen_id in FoodItem.allergens.through.objects.values_list('fooditem_id', 'allergen_id'):
+        links.setdefault(food_id, []).append(allergen_names[allergen_id])
+    for pk, name, ingredients in FoodItem.objects.order_by('name').values_list('pk', 'name', 'ingredients'):
+        yield {'kind': 'food', 'name': name, 'ingredients': ingredients,
+               'allergens': sorted(links.get(pk, []))}
+
+
+def export_chunks(fmt):
+    """Yield the exported catalogue as text pieces, for files and streaming responses."""
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, CSV_FIELDS)
+        writer.writeheader()
+        for entry in export_entries():
+            writer.writerow(dict(entry, allergens=';'.join(entry['allergens'])))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    elif fmt == 'jsonl':
+        for entry in export_entries():
+            if entry['kind'] == 'allergen':
+                entry = {'kind': 'allergen', 'name': entry['name']}
+            yield json.dumps(entry, ensure_ascii=False) + '\n'
+    else:
+        allergens, foods = [], []
+        for entry in export_entries():
+            if entry['kind'] == 'allergen':
+                allergens.append(entry['name'])
+            else:
+                foods.append({k: entry[k] for k in ('name', 'ingredients', 'allergens')})
+        yield json.dumps({'allergens': allergens, 'foods': foods}, indent=2, ensure_ascii=False) + '\n'
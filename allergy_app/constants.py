@@ -0,0 +1,11 @@
+# allergy_app/constants.py
+#
+# Scan thresholds shared by the scan path (services.py) and reporting code
+# (adminpanel rollups) -- kept here so reports don't import the inference stack.
+
+# Confidence threshold (e.g., 40% for full Food-101), on calibrated probabilities
+CONFIDENCE_THRESHOLD = 0.40
+# Foods offered to pick from: the best class plus runners-up (up to
+# SCAN_CANDIDATES in all) with at least CANDIDATE_MIN_PROBABILITY
+SCAN_CANDIDATES = 3
+CANDIDATE_MIN_PROBABILITY = 0.05
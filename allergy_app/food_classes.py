@@ -0,0 +1,81 @@
+# allergy_app/food_classes.py
+#
+# Mapping between the classifier's output indices (ml_model/food_classes.json)
+# and catalogue FoodItems, stored in FoodClass rows. The allergen index holds
+# it in memory, so a prediction resolves to a food and its allergens without a
+# text-matching query.
+#
+# Labels are matched to food names ignoring case, spaces, underscores and
+# punctuation, so 'cup_cakes' finds "Cup cakes" as well as "Cupcakes".
+# Anything that still does not match is reported by `sync_food_classes` and
+# can be linked by hand in the Django admin.
+import re
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .allergen_index import allergen_index
+from .ml_model.load_model import food_classes
+from .models import FoodClass, FoodItem
+
+
+def match_key(name):
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+@dataclass
+class SyncReport:
+    created: int = 0
+    linked: list = field(default_factory=list)  # (index, label, food name)
+    unlinked: list = field(default_factory=list)  # (index, new label, food name) whose label changed
+    unmapped: list = field(default_factory=list)  # (index, label)
+    unused_foods: list = field(default_factory=list)  # food names no class maps to
+    stale: list = field(default_factory=list)  # (index, label) no longer produced by the model
+
+
+def sync(dry_run=False):
+    """
+    Create a FoodClass row per model class and link unmapped ones to the food
+    whose name matches their label. Existing links are kept unless a retrained
+    model put a different label at that index: then the link is dropped (the
+    food belongs to the old class) and the new label is matched afresh.
+    """
+    report = SyncReport()
+    all_foods = dict(FoodItem.objects.values_list('pk', 'name'))
+    foods = {}
+    for pk, name in all_foods.items():
+        foods.setdefault(match_key(name), (pk, name))
+
+    rows = {fc.index: fc for fc in FoodClass.objects.all()}
+    new, changed = [], []
+    for index, label in enumerate(food_classes):
+        fc = rows.get(index)
+        if fc is None:
+            fc = rows[index] = FoodClass(index=index, label=label)
+            new.append(fc)
+        elif fc.label != label:
+            fc.label = label
+            changed.append(fc)
+            if fc.food_item_id is not None:
+                report.unlinked.append((index, label, all_foods.get(fc.food_item_id)))
+                fc.food_item_id = None
+        if fc.food_item_id is None and match_key(label) in foods:
+            fc.food_item_id, food_name = foods[match_key(label)]
+            report.linked.append((index, label, food_name))
+            if fc.pk and fc not in changed:
+                changed.append(fc)
+        if fc.food_item_id is None:
+            report.unmapped.append((index, label))
+    report.created = len(new)
+
+    if not dry_run and (new or changed):
+        # Bulk writes skip the model signals: refresh the in-memory index once
+        with transaction.atomic():
+            FoodClass.objects.bulk_create(new)
+            FoodClass.objects.bulk_update(changed, ['label', 'food_item'])
+            transaction.on_commit(allergen_index.rebuild)
+
+    report.stale = [(fc.index, fc.label) for fc in rows.values() if fc.index >= len(food_classes)]
+    mapped = {fc.food_item_id for fc in rows.values()}
+    report.unused_foods = sorted(name for pk, name in all_foods.items() if pk not in mapped)
+    return report
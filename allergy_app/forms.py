@@ -1,5 +1,12 @@
+import os
+import zipfile
+
 from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile
 from django.contrib.auth.models import User
+from .ingest import InvalidImage, ingest_image
+from .metrics import span
 from .models import AllergyProfile, Allergen, ScanHistory
 
 class UserRegisterForm(forms.ModelForm):
@@ -40,4 +47,75 @@ class ScanForm(forms.ModelForm):
             raise forms.ValidationError('Unsupported image format. Please upload a JPG/JPEG file.')
         if getattr(img, 'content_type', '') != 'image/jpeg':
             raise forms.ValidationError('Unsupported image type. Only JPEG is allowed.')
-        return img
+        # Decode once in memory: store a downsized copy without EXIF and keep
+        # the decoded pixels for the classifier (see ingest.py)
+        try:
+            with span('decode'):
+                self.ingested = ingest_image(img.read(), img.name)
+        except InvalidImage as e:
+            raise forms.ValidationError(str(e))
+        return ContentFile(self.ingested.data, name=self.ingested.name)
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)] if data else []
+
+
+class BatchScanForm(forms.Form):
+    """Several JPEG photos, as individual files and/or one zip archive."""
+    images = MultipleFileField(required=False)
+    archive = forms.FileField(required=False)
+
+    def _check(self, name, size):
+        if not name.lower().endswith(('.jpg', '.jpeg')):
+            raise forms.ValidationError(f"'{name}': unsupported image format. Only JPG/JPEG files are allowed.")
+        if size > settings.BATCH_SCAN_MAX_FILE_SIZE:
+            raise forms.ValidationError(f"'{name}' is too large.")
+
+    def clean(self):
+        cd = super().clean()
+        uploads = []
+        for img in cd.get('images') or []:
+            self._check(img.name, img.size)
+            if getattr(img, 'content_type', '') != 'image/jpeg':
+                raise forms.ValidationError(f"'{img.name}': unsupported image type. Only JPEG is allowed.")
+            uploads.append((os.path.basename(img.name), img.read()))
+
+        archive = cd.get('archive')
+        if archive:
+            try:
+                with zipfile.ZipFile(archive) as zf:
+                    for info in zf.infolist():
+                        if info.is_dir() or os.path.basename(info.filename).startswith('.'):
+                            continue
+                        if len(uploads) >= settings.BATCH_SCAN_MAX_IMAGES:
+                            raise forms.ValidationError(
+                                f'At most {settings.BATCH_SCAN_MAX_IMAGES} images per batch.'
+                            )
+                        self._check(info.filename, info.file_size)
+                        uploads.append((os.path.basename(info.filename), zf.read(info)))
+            except zipfile.BadZipFile:
+                raise forms.ValidationError('The archive is not a valid zip file.')
+
+        if not uploads:
+            raise forms.ValidationError('Upload at least one JPEG image.')
+        if len(uploads) > settings.BATCH_SCAN_MAX_IMAGES:
+            raise forms.ValidationError(f'At most {settings.BATCH_SCAN_MAX_IMAGES} images per batch.')
+        try:
+            with span('decode'):
+                cd['uploads'] = [ingest_image(data, name) for name, data in uploads]
+        except InvalidImage as e:
+            raise forms.ValidationError(str(e))
+        return cd
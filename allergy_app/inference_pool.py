@@ -0,0 +1,73 @@
+# allergy_app/inference_pool.py
+#
+# Bounded executor for the CPU-bound part of a scan (upload decode and model
+# inference) used by the async views. Under ASGI the event loop only awaits:
+# many uploads can be in flight in one process while at most
+# INFERENCE_POOL_WORKERS of them decode or predict at a time.
+#
+# Back-pressure: admit() lets at most INFERENCE_POOL_MAX_PENDING scans in at
+# once (running or waiting for a worker); beyond that it raises PoolSaturated
+# and the view answers 503 with Retry-After instead of queueing without bound.
+#
+# Threads rather than processes: PIL decoding and TensorFlow / TFLite predict
+# release the GIL, and the model is loaded once per process instead of once
+# per pool worker.
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class PoolSaturated(Exception):
+    """Raised by admit() when INFERENCE_POOL_MAX_PENDING scans are already in flight."""
+
+
+class InferencePool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'INFERENCE_POOL_MAX_PENDING', 32)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, 'INFERENCE_POOL_WORKERS', 4),
+                        thread_name_prefix='inference',
+                    )
+        return self._executor
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Hold one of the pool's in-flight slots for the duration of a scan."""
+        with self._lock:
+            if self.pending >= self.max_pending:  # counted by the view (safebite_scans_rejected_total)
+                raise PoolSaturated()
+            self.pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) on a pool thread, keeping the caller's context (metrics)."""
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self.pending, 'max_pending': self.max_pending}
+
+
+inference_pool = InferencePool()
@@ -0,0 +1,69 @@
+# allergy_app/ingest.py
+#
+# Upload ingestion for scans. The uploaded bytes are decoded once in memory:
+#
+# * oversized files and images with huge pixel counts are rejected from the
+#   header, before anything is decompressed;
+# * the photo is decoded at reduced scale (JPEG draft mode), rotated upright
+#   from its EXIF orientation and bounded to SCAN_MAX_DIMENSION;
+# * the copy written to media/scans/ is re-encoded without EXIF/GPS metadata;
+# * the classifier gets the already-decoded 224x224 pixels, so the stored file
+#   is never read back from disk.
+import io
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .ml_model.preprocess import IMG_SIZE, decode_image
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+@dataclass
+class IngestedImage:
+    name: str  # original file name, without directories
+    data: bytes  # re-encoded JPEG, metadata stripped
+    pixels: np.ndarray  # uint8 (224, 224, 3), ready for the classifier
+    width: int
+    height: int
+
+
+def ingest_image(data, name):
+    """Validate, downsize and re-encode raw upload bytes. Raises InvalidImage."""
+    if len(data) > getattr(settings, 'SCAN_MAX_UPLOAD_SIZE', 10 * 1024 * 1024):
+        raise InvalidImage(f"'{name}' is too large.")
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+    except Exception:
+        raise InvalidImage(f"'{name}' is not a valid image.")
+    if fmt != 'JPEG':
+        raise InvalidImage(f"'{name}' is not a valid JPEG image.")
+    # Header-only size check, before any pixel is decompressed
+    if img.width * img.height > getattr(settings, 'SCAN_MAX_PIXELS', 40_000_000):
+        raise InvalidImage(f"'{name}' has too many pixels.")
+
+    max_dim = getattr(settings, 'SCAN_MAX_DIMENSION', 1024)
+    try:
+        img.draft('RGB', (max_dim, max_dim))  # reduced-scale decode of big photos
+        img = ImageOps.exif_transpose(img).convert('RGB')
+    except Exception:  # truncated or corrupt data
+        raise InvalidImage(f"'{name}' could not be decoded.")
+    img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+
+    # No exif= argument: the stored copy carries no metadata
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=getattr(settings, 'SCAN_JPEG_QUALITY', 85), optimize=True)
+
+    return IngestedImage(
+        name=os.path.basename(name) or 'scan.jpg',
+        data=buf.getvalue(),
+        pixels=decode_image(img, IMG_SIZE),
+        width=img.width,
+        height=img.height,
+    )
@@ -0,0 +1,140 @@
+# allergy_app/jobs.py
+#
+# Asynchronous scan pipeline. The ScanJob table is the queue, so no external
+# broker is needed: the web process either hands new jobs to a local thread
+# pool (SCAN_QUEUE_BACKEND = 'thread') or just leaves them in the table for
+# `manage.py run_scan_worker` processes to claim (SCAN_QUEUE_BACKEND = 'db').
+#
+# Thread-pool submissions die with the web process, so resume_job() -- called
+# whenever the result page polls an unfinished job -- resubmits jobs queued for
+# too long, requeues jobs stuck in 'running' and retries failed ones while they
+# have attempts left (SCAN_JOB_MAX_ATTEMPTS).
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import ScanJob
+from .services import analyze_scan
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SCAN_WORKER_THREADS', 2),
+                    thread_name_prefix='safebite-scan',
+                )
+    return _executor
+
+
+def _uses_threads():
+    return getattr(settings, 'SCAN_QUEUE_BACKEND', 'thread') == 'thread'
+
+
+def max_attempts():
+    return getattr(settings, 'SCAN_JOB_MAX_ATTEMPTS', 3)
+
+
+def enqueue_scan(scan):
+    """Create the job row for a saved scan and schedule it once the transaction commits."""
+    job = ScanJob.objects.create(scan=scan)
+    if _uses_threads():
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        process_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """Atomically move a queued job to running; False if another worker got it first."""
+    return bool(
+        ScanJob.objects
+        .filter(pk=job_id, status=ScanJob.QUEUED)
+        .update(status=ScanJob.RUNNING, started_at=timezone.now())
+    )
+
+
+def process_job(job_id):
+    """Run inference for one job and store its result. Returns the job, or None if not claimed."""
+    if not claim_job(job_id):
+        return None
+    job = ScanJob.objects.select_related('scan__user').get(pk=job_id)
+    job.attempts += 1
+    try:
+        with metrics.request_trace('scan_job'):
+            job.result = analyze_scan(job.scan, job.scan.user)
+        job.status = ScanJob.DONE
+        job.error = ''
+    except Exception:
+        job.status = ScanJob.FAILED
+        job.error = traceback.format_exc()
+        print(f"Scan job {job_id} failed:\n{job.error}")
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'attempts', 'finished_at'])
+    return job
+
+
+def next_queued_job_ids(limit):
+    return list(
+        ScanJob.objects
+        .filter(status=ScanJob.QUEUED)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def requeue_stale_jobs(older_than):
+    """Put jobs left 'running' by a crashed worker back on the queue."""
+    return (ScanJob.objects
+            .filter(status=ScanJob.RUNNING, started_at__lt=timezone.now() - older_than)
+            .update(status=ScanJob.QUEUED, started_at=None))
+
+
+def retry_failed_jobs():
+    """Put failed jobs that have attempts left back on the queue."""
+    return (ScanJob.objects
+            .filter(status=ScanJob.FAILED, attempts__lt=max_attempts())
+            .update(status=ScanJob.QUEUED, started_at=None, finished_at=None))
+
+
+def resume_job(job):
+    """
+    Get an unfinished job moving again if it has stalled: requeue it if it
+    failed with attempts left or has been 'running' for SCAN_JOB_STALE_AFTER
+    seconds, and with the thread backend resubmit it if it has been queued
+    for SCAN_JOB_RESUBMIT_AFTER seconds (its submission may have died with a
+    restarted process; claim_job() makes a duplicate harmless). Updates and
+    returns `job.status`.
+    """
+    now = timezone.now()
+    stale_after = timedelta(seconds=getattr(settings, 'SCAN_JOB_STALE_AFTER', 300))
+    resubmit_after = timedelta(seconds=getattr(settings, 'SCAN_JOB_RESUBMIT_AFTER', 30))
+    requeue = (
+        (job.status == ScanJob.FAILED and job.attempts < max_attempts())
+        or (job.status == ScanJob.RUNNING and job.started_at and job.started_at < now - stale_after)
+    )
+    if requeue and ScanJob.objects.filter(pk=job.pk, status=job.status).update(
+            status=ScanJob.QUEUED, started_at=None, finished_at=None):
+        job.status = ScanJob.QUEUED
+        if _uses_threads():
+            _get_executor().submit(_run_in_thread, job.pk)
+    elif job.status == ScanJob.QUEUED and job.created_at < now - resubmit_after and _uses_threads():
+        _get_executor().submit(_run_in_thread, job.pk)
+    return job.status
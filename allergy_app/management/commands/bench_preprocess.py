@@ -0,0 +1,65 @@
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from allergy_app.ml_model.preprocess import IMG_SIZE, decode_image, normalize, preprocess_batch
+
+
+def legacy_decode(path):
+    # What predict_food used to do: full-resolution decode, default resize filter
+    return np.array(Image.open(path).convert('RGB').resize(IMG_SIZE))
+
+
+def legacy_normalize(pixels):
+    return pixels / 255.0  # float64
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark per-image decode and preprocessing time on the images in media/scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=os.path.join(settings.MEDIA_ROOT, 'scans'))
+        parser.add_argument('--repeat', type=int, default=5, help='Passes over the image set.')
+
+    def handle(self, *args, **options):
+        paths = sorted(
+            os.path.join(options['dir'], name) for name in os.listdir(options['dir'])
+            if name.lower().endswith(('.jpg', '.jpeg'))
+        )
+        if not paths:
+            self.stderr.write('No JPEG images found.')
+            return
+        repeat = options['repeat']
+        count = len(paths) * repeat
+        self.stdout.write(f"{len(paths)} images x {repeat} passes\n")
+
+        def timed(fn):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                result = fn()
+            return 1000.0 * (time.perf_counter() - start) / count, result
+
+        legacy_decode_ms, legacy_pixels = timed(lambda: [legacy_decode(p) for p in paths])
+        legacy_norm_ms, _ = timed(lambda: [legacy_normalize(px) for px in legacy_pixels])
+        draft_decode_ms, draft_pixels = timed(lambda: [decode_image(p) for p in paths])
+        stacked = np.stack(draft_pixels)
+        vector_norm_ms, _ = timed(lambda: normalize(stacked))
+        batch_ms, _ = timed(lambda: preprocess_batch(paths))
+
+        rows = [
+            ('legacy decode (full size)', legacy_decode_ms),
+            ('legacy /255 (float64)', legacy_norm_ms),
+            ('draft decode', draft_decode_ms),
+            ('vectorized normalize (float32)', vector_norm_ms),
+            ('preprocess_batch end-to-end', batch_ms),
+        ]
+        for label, ms in rows:
+            self.stdout.write(f"{label:<32} {ms:8.3f} ms/image")
+        self.stdout.write(
+            f"\nSpeed-up (decode + normalize): "
+            f"{(legacy_decode_ms + legacy_norm_ms) / batch_ms:.1f}x"
+        )
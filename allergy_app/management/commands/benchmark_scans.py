@@ -0,0 +1,79 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from allergy_app import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Load-test scan_food, home, dashboard and scan_list with concurrent clients on a "
+            "seeded throwaway database and a stub classifier; compare with the stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Synthetic users to seed.')
+        parser.add_argument('--scans-per-user', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=4, help='Concurrent clients per view.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client.')
+        parser.add_argument('--model-cost-ms', type=float, default=20.0,
+                            help='Fixed cost of one stub forward pass.')
+        parser.add_argument('--view', action='append', dest='views',
+                            help='Only benchmark this view (repeatable).')
+        parser.add_argument('--baseline', default=str(benchmark.BASELINE_PATH))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed p95 / throughput slowdown before failing (0.5 = 50%%).')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='safebite-bench-')
+        # A file database, so client threads share the seeded data
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(media_root, 'bench.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root, METRICS_ENABLED=False):
+                results = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(f"\n{'view':<12}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'queries':>9}{'errors':>8}")
+        for r in results:
+            self.stdout.write(f"{r.view:<12}{r.throughput:>9.1f}{r.p50_ms:>9.1f}{r.p95_ms:>9.1f}"
+                              f"{r.p99_ms:>9.1f}{r.queries:>9.1f}{r.errors:>8}")
+
+        config = {k: options[k] for k in ('users', 'scans_per_user', 'clients', 'requests', 'model_cost_ms')}
+        if options['save_baseline']:
+            benchmark.save_baseline(results, config, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"\nBaseline saved to {options['baseline']}"))
+            return
+
+        baseline = benchmark.load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(f"\nNo baseline at {options['baseline']}; run with --save-baseline to store one.")
+            return
+        if baseline.get('config') != config:
+            self.stdout.write(self.style.WARNING(f"\nBaseline was recorded with {baseline.get('config')}."))
+        problems = benchmark.compare(results, baseline, options['tolerance'])
+        if problems:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(problems))
+        self.stdout.write(self.style.SUCCESS('\nNo regressions against the baseline.'))
+
+    def _run(self, options):
+        self.stdout.write(f"Seeding {options['users']} users x {options['scans_per_user']} scans...")
+        staff = benchmark.seed(options['users'], options['scans_per_user'])
+        call_command('recompute_stats', stdout=io.StringIO())  # bulk inserts skip the stats signals
+        benchmark.install_stub(options['model_cost_ms'])
+        users = list(User.objects.filter(is_staff=False).order_by('pk')[:options['clients']])
+        self.stdout.write(f"Running {options['clients']} clients x {options['requests']} requests per view...")
+        return benchmark.run(users, staff, options['clients'], options['requests'], options['views'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from allergy_app.catalogue import FORMATS, CatalogueError, export_chunks, format_for
+
+
+class Command(BaseCommand):
+    help = "Export allergens and foods in a format import_catalogue reads back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', help='File to write; default: stdout.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Default: from the output file extension, or csv.')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        try:
+            fmt = options['format'] or (format_for(output) if output else 'csv')
+        except CatalogueError as e:
+            raise CommandError(str(e))
+
+        if not output:
+            for piece in export_chunks(fmt):
+                self.stdout.write(piece, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            for piece in export_chunks(fmt):
+                f.write(piece)
+        self.stdout.write(self.style.SUCCESS(f"Catalogue written to {output}."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from allergy_app.catalogue import CHUNK_SIZE, FORMATS, CatalogueError, format_for, import_catalogue
+
+
+class Command(BaseCommand):
+    help = ("Import allergens and foods from a CSV, JSON or JSON Lines catalogue file "
+            "(see allergy_app/catalogue.py for the layout) in one transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count, then roll back.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or format_for(options['path'])
+            with open(options['path'], 'rb') as f:
+                report = import_catalogue(f, fmt, dry_run=options['dry_run'],
+                                          chunk_size=options['chunk_size'])
+        except (OSError, CatalogueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{report.rows} rows: {report.allergens_created} allergens created, "
+            f"{report.foods_created} foods created, {report.foods_updated} updated, "
+            f"{report.links_written} allergen links written, {report.classes_linked} classifier classes linked."
+        )
+        summary = f"{report.rows} rows in {report.seconds:.2f}s ({report.rows_per_second:.0f} rows/s)"
+        if report.dry_run:
+            self.stdout.write(self.style.WARNING(f"Dry run, nothing saved: {summary}."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {summary}."))
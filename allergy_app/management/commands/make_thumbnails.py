@@ -0,0 +1,30 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from allergy_app.models import ScanHistory
+from allergy_app.thumbnails import THUMBNAIL_SIZES, create_thumbnails, thumbnail_name
+
+
+class Command(BaseCommand):
+    help = ("Render the thumbnails of stored scans that have none, e.g. scans stored "
+            "before thumbnails were made at upload time or after THUMBNAIL_FORMAT changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render existing thumbnails too.')
+
+    def handle(self, *args, **options):
+        image_names = (ScanHistory.objects.exclude(image='').order_by()
+                       .values_list('image', flat=True).distinct().iterator())
+        rendered = failed = 0
+        for image_name in image_names:
+            if not options['force'] and all(
+                default_storage.exists(thumbnail_name(image_name, size)) for size in THUMBNAIL_SIZES
+            ):
+                continue
+            if create_thumbnails(image_name):
+                rendered += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered thumbnails for {rendered} images."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} images could not be read."))
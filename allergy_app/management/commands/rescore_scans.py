@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from allergy_app.allergen_index import allergen_index
+from allergy_app.ml_model.calibrate import apply_temperature
+from allergy_app.ml_model.load_model import TOP_K, get_backend, get_temperature, model_file_path
+from allergy_app.ml_model.prediction_cache import file_fingerprint
+from allergy_app.ml_model.preprocess import decode_image, normalize
+from allergy_app.models import ScanHistory
+from allergy_app.constants import CONFIDENCE_THRESHOLD
+from allergy_app.services import resolve_candidates, shortlist
+from allergy_app.signals import scans_bulk_saved
+
+DEFAULT_CHECKPOINT = os.path.join(settings.BASE_DIR, 'rescore_checkpoint.json')
+
+
+def _decode(path):
+    # Runs in a pool worker; returns None for missing / unreadable files
+    try:
+        return decode_image(path)
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Re-classify stored scan images with the current model and update "
+            "food_item, confidence, candidates and allergen_detected in resumable chunks.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=256, help='Rows fetched and updated per chunk.')
+        parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass.')
+        parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help='Processes decoding images.')
+        parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--limit', type=int, help='Stop after this many rows.')
+        parser.add_argument('--dry-run', action='store_true', help='Classify but do not write.')
+
+    def handle(self, *args, **options):
+        fingerprint = file_fingerprint(model_file_path())
+        state = self._load_checkpoint(options['checkpoint'], fingerprint, options['restart'])
+        if state['last_pk']:
+            self.stdout.write(f"Resuming after scan #{state['last_pk']} ({state['processed']} done).")
+
+        started = time.perf_counter()
+        processed = 0
+
+        # Start the decode pool before the model is loaded so workers do not inherit it
+        with multiprocessing.Pool(options['workers']) as pool:
+            backend = get_backend()
+            while options['limit'] is None or processed < options['limit']:
+                size = options['chunk_size']
+                if options['limit'] is not None:
+                    size = min(size, options['limit'] - processed)
+                # Keyset chunking: no long-lived cursor, constant memory
+                rows = list(
+                    ScanHistory.objects
+                    .filter(pk__gt=state['last_pk'])
+                    .order_by('pk')
+                    .only('pk', 'user_id', 'image', 'food_item_id', 'confidence', 'candidates',
+                          'allergen_detected')[:size]
+                )
+                if not rows:
+                    break
+
+                chunk_started = time.perf_counter()
+                pixels = pool.map(_decode, [row.image.path for row in rows], chunksize=8)
+                changed, missing = self._rescore(rows, pixels, backend, options['batch_size'])
+                if not options['dry_run']:
+                    ScanHistory.objects.bulk_update(
+                        changed, ['food_item', 'confidence', 'candidates', 'allergen_detected'], batch_size=500
+                    )
+                    scans_bulk_saved.send(sender=ScanHistory, scans=changed, created=False)
+
+                processed += len(rows)
+                state['last_pk'] = rows[-1].pk
+                state['processed'] += len(rows)
+                state['updated'] += len(changed)
+                state['missing'] += missing
+                if not options['dry_run']:
+                    self._save_checkpoint(options['checkpoint'], state)
+
+                elapsed = time.perf_counter() - chunk_started
+                self.stdout.write(
+                    f"… up to #{state['last_pk']}: {len(rows)} rows, {len(changed)} changed, "
+                    f"{missing} missing, {len(rows) / elapsed:.1f} img/s"
+                )
+
+        total = time.perf_counter() - started
+        rate = processed / total if total else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescored {processed} scans in {total:.1f}s ({rate:.1f} img/s); "
+            f"totals: {state['processed']} processed, {state['updated']} updated, "
+            f"{state['missing']} missing images."
+        ))
+
+    def _rescore(self, rows, pixels, backend, batch_size):
+        readable = [(row, px) for row, px in zip(rows, pixels) if px is not None]
+        changed = []
+        for start in range(0, len(readable), batch_size):
+            batch = readable[start:start + batch_size]
+            scores = apply_temperature(backend.predict(normalize(np.stack([px for _, px in batch]))),
+                                       get_temperature())
+            for (row, _), row_scores in zip(batch, scores):
+                ranked = np.argsort(row_scores)[::-1][:TOP_K]
+                top = shortlist([(int(i), float(row_scores[i])) for i in ranked])
+                confidence_raw = top[0][1]
+                user_mask = allergen_index.user_mask(row.user_id)
+                candidates, union = resolve_candidates(top, user_mask)
+                food_id = None
+                if confidence_raw >= CONFIDENCE_THRESHOLD:
+                    food_id = candidates[0]['food_id']
+                    detected = bool(food_id and user_mask and allergen_index.food_mask(food_id) & user_mask)
+                else:
+                    detected = bool(union)  # unsure which food: any candidate's allergens count
+                confidence = round(confidence_raw * 100, 2)
+                stored = [[c, round(p, 4)] for c, p in top]
+
+                if (row.food_item_id, row.allergen_detected, row.candidates) != (food_id, detected, stored) or \
+                        row.confidence is None or float(row.confidence) != confidence:
+                    row.food_item_id = food_id
+                    row.confidence = confidence
+                    row.candidates = stored
+                    row.allergen_detected = detected
+                    changed.append(row)
+        return changed, len(rows) - len(readable)
+
+    def _load_checkpoint(self, path, fingerprint, restart):
+        fresh = {'model': fingerprint, 'last_pk': 0, 'processed': 0, 'updated': 0, 'missing': 0}
+        if restart or not os.path.exists(path):
+            return fresh
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('model') != fingerprint:
+            self.stdout.write(self.style.WARNING('Model changed since the checkpoint was written; starting over.'))
+            return fresh
+        return state
+
+    def _save_checkpoint(self, path, state):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, path)  # atomic, so an interrupted run never leaves a torn file
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from allergy_app.jobs import next_queued_job_ids, process_job, requeue_stale_jobs, retry_failed_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued asynchronous scan jobs from the ScanJob table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Jobs processed concurrently.')
+        parser.add_argument('--poll-interval', type=float, default=0.5, help='Seconds between polls when idle.')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Requeue jobs stuck in "running" for this many seconds.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit.')
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        requeued = requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        threads = options['threads']
+        processed = 0
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='safebite-scan') as pool:
+            while True:
+                job_ids = next_queued_job_ids(threads * 2)
+                if not job_ids and retry_failed_jobs():  # failures with attempts left
+                    continue
+                if not job_ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for job in pool.map(self._process, job_ids):
+                    if job is not None:
+                        processed += 1
+                        self.stdout.write(f"Job {job.pk} (scan {job.scan_id}): {job.status}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
+
+    def _process(self, job_id):
+        close_old_connections()
+        try:
+            return process_job(job_id)
+        finally:
+            close_old_connections()
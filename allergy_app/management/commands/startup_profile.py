@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter so nothing already imported by manage.py skews the numbers
+PROBE = r"""
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', %(settings)r)
+import django
+django.setup()
+import allergy_app.views
+result = {'setup_s': time.perf_counter() - t0}
+if %(load_model)r:
+    t1 = time.perf_counter()
+    from allergy_app.ml_model.load_model import preload_model
+    preload_model()
+    result['model_load_s'] = time.perf_counter() - t1
+result['total_s'] = time.perf_counter() - t0
+result['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+result['tensorflow_imported'] = 'tensorflow' in sys.modules
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure Django startup time and peak RSS, with and without loading the classifier."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per scenario.')
+        parser.add_argument('--skip-model', action='store_true',
+                            help='Only measure the lazy (no model) startup.')
+
+    def handle(self, *args, **options):
+        scenarios = [('lazy (views imported, no model)', False)]
+        if not options['skip_model']:
+            scenarios.append(('eager (model preloaded)', True))
+
+        for label, load_model in scenarios:
+            samples = [self._probe(load_model) for _ in range(options['runs'])]
+            samples = [s for s in samples if s]
+            if not samples:
+                self.stderr.write(f"{label}: probe failed")
+                continue
+            best = min(samples, key=lambda s: s['total_s'])
+            self.stdout.write(
+                f"{label}: startup {best['total_s']:.2f}s "
+                f"(best of {len(samples)}), peak RSS {best['max_rss_mb']:.0f} MB, "
+                f"tensorflow imported: {best['tensorflow_imported']}"
+            )
+
+    def _probe(self, load_model):
+        code = PROBE % {'settings': os.environ['DJANGO_SETTINGS_MODULE'], 'load_model': load_model}
+        proc = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            self.stderr.write(proc.stderr.strip().splitlines()[-1] if proc.stderr else 'unknown error')
+            return None
+        return json.loads(proc.stdout.strip().splitlines()[-1])
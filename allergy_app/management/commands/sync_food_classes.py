@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from allergy_app import food_classes
+
+
+class Command(BaseCommand):
+    help = ("Create a FoodClass row for every classifier class in food_classes.json, "
+            "link unmapped classes to the food whose name matches, and report classes "
+            "that still have no food.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report only, write nothing.')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with an error if any class is left unmapped (for CI / deploys).')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run'] or options['check']
+        report = food_classes.sync(dry_run=dry_run)
+
+        if report.created:
+            self.stdout.write(f"{'Would create' if dry_run else 'Created'} {report.created} class rows.")
+        for index, label, food_name in report.unlinked:
+            self.stdout.write(self.style.WARNING(
+                f"Class {index} is now '{label}': {'would unlink' if dry_run else 'unlinked'} {food_name}"
+            ))
+        for index, label, food_name in report.linked:
+            self.stdout.write(f"{'Would link' if dry_run else 'Linked'} class {index} '{label}' -> {food_name}")
+        for index, label in report.stale:
+            self.stdout.write(self.style.WARNING(
+                f"Class {index} '{label}' is not produced by the current model."
+            ))
+        if report.unused_foods:
+            self.stdout.write(f"{len(report.unused_foods)} foods have no class: "
+                              + ', '.join(report.unused_foods))
+
+        unmapped = report.unmapped
+        if options['check']:  # links a sync would add are not there yet
+            unmapped = sorted(unmapped + [(index, label) for index, label, _ in report.linked])
+        if unmapped:
+            lines = '\n'.join(f"  {index}: {label}" for index, label in unmapped)
+            message = (f"{len(unmapped)} classes are not mapped to a food "
+                       f"(link them in the admin under Food classes):\n{lines}")
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All {len(food_classes.food_classes)} classes are mapped."))
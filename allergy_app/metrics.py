@@ -0,0 +1,250 @@
+# allergy_app/metrics.py
+#
+# Hot-path timing for scans. Each stage of a scan (upload decode, upload save,
+# preprocessing, inference wait, catalogue lookup, allergen matching,
+# alternatives, ...) runs inside span('<stage>'), which records its duration in
+# a per-stage histogram; inc() counts events such as scan outcomes. The
+# /metrics/ endpoint renders them, together with the batching engine and
+# prediction cache numbers from inference_metrics(), in the Prometheus text
+# format. With METRICS_LOG on, every scan also logs one JSON line with its
+# stage timings to the 'safebite.metrics' logger.
+#
+# 'inference_wait' is what the request sees: time queued on the batching engine
+# plus the shared batch's forward pass. The forward pass alone is recorded per
+# batch in safebite_model_predict_seconds by the engine's worker thread.
+#
+# Metrics live in process memory: with several workers, scrape each one.
+#
+# With METRICS_ENABLED off (the default) span() hands back one shared no-op
+# context manager and inc() returns at once, so the instrumentation costs a
+# settings lookup per call.
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('safebite.metrics')
+
+_NOOP = contextlib.nullcontext()
+_trace = contextvars.ContextVar('safebite_metrics_trace', default=None)
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms keyed by (name, sorted label items)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+# --- recording --------------------------------------------------------------
+
+class _Span:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        registry.observe('safebite_stage_seconds', elapsed, stage=self.stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace['stages'][self.stage] = trace['stages'].get(self.stage, 0.0) + elapsed
+        return False
+
+
+def span(stage):
+    """Context manager timing one stage of the current request."""
+    if not enabled():
+        return _NOOP
+    return _Span(stage)
+
+
+def inc(name, value=1, **labels):
+    if enabled():
+        registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    """Record a duration measured outside any request (e.g. on a worker thread)."""
+    if enabled():
+        registry.observe(name, seconds, **labels)
+
+
+@contextlib.contextmanager
+def request_trace(endpoint):
+    """
+    Time a whole request and collect the spans run inside it, for the
+    per-endpoint latency histogram and the METRICS_LOG line.
+    """
+    if not enabled():
+        yield None
+        return
+    trace = {'endpoint': endpoint, 'stages': {}}
+    token = _trace.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - started
+        _trace.reset(token)
+        registry.observe('safebite_request_seconds', elapsed, endpoint=endpoint)
+        if getattr(settings, 'METRICS_LOG', False):
+            logger.info(json.dumps({
+                'event': 'request',
+                'endpoint': endpoint,
+                'ms': round(elapsed * 1000, 3),
+                'stages_ms': {k: round(v * 1000, 3) for k, v in trace['stages'].items()},
+                **{k: v for k, v in trace.items() if k not in ('endpoint', 'stages')},
+            }))
+
+
+def traced(endpoint):
+    """View decorator (sync or async): run the view inside request_trace(endpoint), per HTTP method."""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not enabled():
+                    return await view(request, *args, **kwargs)
+                with request_trace(f'{endpoint} {request.method}'):
+                    return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not enabled():
+                return view(request, *args, **kwargs)
+            with request_trace(f'{endpoint} {request.method}'):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**fields):
+    """Attach fields (e.g. the predicted food) to the current request's log line."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+# --- exposition -------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(items):
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _flatten(prefix, value, out):
+    """Numeric leaves of inference_metrics() as (metric name, labels, value)."""
+    if isinstance(value, dict):
+        if value and all(isinstance(k, int) for k in value):  # histogram by size
+            for k, v in value.items():
+                out.append((prefix, (('size', k),), v))
+        else:
+            for k, v in value.items():
+                _flatten(f'{prefix}_{k}', v, out)
+    elif isinstance(value, bool):
+        out.append((prefix, (), int(value)))
+    elif isinstance(value, (int, float)):
+        out.append((prefix, (), value))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from .inference_pool import inference_pool
+    from .ml_model.load_model import inference_metrics
+
+    lines = []
+    with registry._lock:
+        counters = sorted(registry.counters.items())
+        histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                            for key, h in registry.histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{_labels(labels)} {value}')
+
+    for (name, labels), (buckets, counts, total, count) in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, n in zip(buckets + (float('inf'),), counts):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+
+    gauges = []
+    _flatten('safebite_inference', inference_metrics(), gauges)
+    _flatten('safebite_inference_pool', inference_pool.stats(), gauges)
+    for name, labels, value in gauges:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('allergy_app', '0004_scanjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scanhistory',
+            index=models.Index(fields=['user', '-scanned_at', '-id'], name='scan_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanhistory',
+            index=models.Index(fields=['-scanned_at', '-id'], name='scan_recent_idx'),
+        ),
+    ]
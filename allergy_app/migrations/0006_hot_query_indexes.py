@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:30
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('allergy_app', '0005_scanhistory_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='fooditem_name_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanhistory',
+            index=models.Index(condition=models.Q(('allergen_detected', True)), fields=['-scanned_at'], name='scan_alert_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:31
+
+import json
+import os
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CLASSES_PATH = os.path.join(os.path.dirname(__file__), '..', 'ml_model', 'food_classes.json')
+
+
+def populate_classes(apps, schema_editor):
+    # Same matching as food_classes.match_key(), frozen for this migration
+    FoodClass = apps.get_model('allergy_app', 'FoodClass')
+    FoodItem = apps.get_model('allergy_app', 'FoodItem')
+
+    def key(name):
+        return re.sub(r'[^a-z0-9]', '', name.lower())
+
+    foods = {}
+    for pk, name in FoodItem.objects.values_list('pk', 'name'):
+        foods.setdefault(key(name), pk)
+    with open(CLASSES_PATH) as f:
+        labels = json.load(f)
+    FoodClass.objects.bulk_create(
+        FoodClass(index=index, label=label, food_item_id=foods.get(key(label)))
+        for index, label in enumerate(labels)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('allergy_app', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(unique=True)),
+                ('label', models.CharField(max_length=100)),
+                ('food_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='classes', to='allergy_app.fooditem')),
+            ],
+            options={
+                'verbose_name_plural': 'food classes',
+                'ordering': ['index'],
+            },
+        ),
+        migrations.RunPython(populate_classes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('allergy_app', '0007_foodclass'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanhistory',
+            name='candidates',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
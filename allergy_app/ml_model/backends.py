@@ -0,0 +1,125 @@
+# allergy_app/ml_model/backends.py
+#
+# Interchangeable inference backends. Each one takes a float32 batch of
+# preprocessed images (N, 224, 224, 3) and returns softmax scores (N, classes).
+# TensorFlow / the TFLite runtime are imported inside the constructors so that
+# merely importing this module stays cheap. ServiceBackend loads no model at
+# all: it forwards batches to the shared inference service
+# (inference_service.py).
+import importlib
+import os
+import threading
+
+import numpy as np
+
+MODEL_DIR = os.path.dirname(__file__)
+KERAS_MODEL_PATH = os.path.join(MODEL_DIR, 'food_model_full.h5')
+TFLITE_MODEL_PATH = os.path.join(MODEL_DIR, 'food_model_int8.tflite')
+
+
+class KerasBackend:
+    """The full Keras graph exported by train_model.py."""
+    name = 'keras'
+    default_path = KERAS_MODEL_PATH
+
+    def __init__(self, model_path=None, num_threads=None):
+        import tensorflow as tf
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        self.model_path = model_path or self.default_path
+        self.model = tf.keras.models.load_model(self.model_path)
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class TFLiteBackend:
+    """Quantized TFLite model produced by export_model.py."""
+    name = 'tflite'
+    default_path = TFLITE_MODEL_PATH
+
+    def __init__(self, model_path=None, num_threads=None):
+        try:
+            # The standalone runtime is much lighter than full TensorFlow
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.model_path = model_path or self.default_path
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # An interpreter instance must not be invoked from two threads at once
+        self._lock = threading.Lock()
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = int(batch.shape[0])
+            self.interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']).copy())
+
+
+class ServiceBackend:
+    """
+    Client of the inference service: batches go to its model processes through
+    shared memory. The model (and TensorFlow) live there, not in this process;
+    `model_path` and `num_threads` are the service's command-line options.
+    """
+    name = 'service'
+    # Only used to fingerprint the model for the prediction cache: point
+    # INFERENCE_MODEL_PATH at the file the service serves if it is not this one
+    default_path = KERAS_MODEL_PATH
+
+    def __init__(self, model_path=None, num_threads=None, address=None, authkey=None):
+        from .inference_service import DEFAULT_ADDRESS, ServiceClient
+        self.model_path = model_path or self.default_path
+        # Standalone scripts (compare_backends, calibrate) read the same variables as the settings
+        address = address or os.environ.get('SAFEBITE_INFERENCE_SERVICE_ADDRESS') or DEFAULT_ADDRESS
+        self.client = ServiceClient(address, authkey or os.environ.get('SAFEBITE_INFERENCE_SERVICE_AUTHKEY'))
+
+    def predict(self, batch):
+        return self.client.predict(batch)
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    ServiceBackend.name: ServiceBackend,
+}
+
+
+def backend_class(name):
+    """A registered backend, or any class given as 'package.module:ClassName'."""
+    if ':' in name:
+        module, _, attr = name.partition(':')
+        return getattr(importlib.import_module(module), attr)
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+
+
+def load_backend(name, model_path=None, num_threads=None, **options):
+    return backend_class(name)(model_path=model_path, num_threads=num_threads, **options)
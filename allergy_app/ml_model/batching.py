@@ -0,0 +1,205 @@
+# allergy_app/ml_model/batching.py
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class QueueFull(Exception):
+    """Raised when the inference queue is at capacity."""
+
+
+class _Request:
+    __slots__ = ('inputs', 'enqueued_at', 'done', 'result', 'error', 'cancelled')
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False  # caller gave up waiting; never run it
+
+
+class BatchMetrics:
+    """Running counters for queue depth and batch fill, safe to read from any thread."""
+
+    def __init__(self, max_batch_size):
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.items_batched = 0
+        self.total_wait_s = 0.0
+        self.total_predict_s = 0.0
+        self.batch_sizes = [0] * (max_batch_size + 1)  # histogram indexed by batch size
+
+    def record_enqueue(self, depth):
+        with self._lock:
+            self.requests += 1
+            self.queue_depth = depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_cancel(self, count, depth):
+        with self._lock:
+            self.cancelled += count
+            self.queue_depth = depth
+
+    def record_batch(self, size, depth, wait_s, predict_s, failed=False):
+        with self._lock:
+            self.batches += 1
+            self.items_batched += size
+            self.queue_depth = depth
+            self.total_wait_s += wait_s
+            self.total_predict_s += predict_s
+            self.batch_sizes[size] += 1
+            if failed:
+                self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            batches = self.batches or 1
+            items = self.items_batched or 1
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'errors': self.errors,
+                'cancelled': self.cancelled,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'max_batch_size': self.max_batch_size,
+                'avg_batch_size': self.items_batched / batches,
+                'avg_batch_fill': self.items_batched / (batches * self.max_batch_size),
+                'avg_wait_ms': 1000.0 * self.total_wait_s / items,
+                'avg_predict_ms': 1000.0 * self.total_predict_s / batches,
+                'batch_size_histogram': {
+                    size: count for size, count in enumerate(self.batch_sizes) if count
+                },
+            }
+
+
+class BatchingEngine:
+    """
+    Dynamic micro-batching in front of a model's predict function.
+
+    Callers submit one preprocessed image at a time; a single worker thread
+    gathers whatever is queued (up to ``max_batch_size``, waiting at most
+    ``max_wait_ms`` for the batch to fill), runs one forward pass on the stacked
+    batch and hands every caller its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5, max_queue_size=256,
+                 timeout_s=30.0):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(max_wait_ms, 0) / 1000.0
+        self.max_queue_size = max_queue_size
+        self.timeout_s = timeout_s
+        self.metrics = BatchMetrics(max_batch_size)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def predict(self, inputs):
+        """Run one sample (no batch dimension) through the model; returns its output row."""
+        return self.predict_many([inputs])[0]
+
+    def predict_many(self, inputs_list):
+        """
+        Enqueue several samples at once and wait for all of their outputs.
+        More samples than the queue can hold are sent in batch-sized pieces.
+        """
+        inputs_list = list(inputs_list)
+        if self.max_queue_size and len(inputs_list) > self.max_queue_size:
+            step = min(self.max_batch_size, self.max_queue_size)
+            results = []
+            for start in range(0, len(inputs_list), step):
+                results.extend(self._submit(inputs_list[start:start + step]))
+            return results
+        return self._submit(inputs_list)
+
+    def _submit(self, inputs_list):
+        requests = [_Request(inputs) for inputs in inputs_list]
+        with self._cond:
+            if self.max_queue_size and len(self._queue) + len(requests) > self.max_queue_size:
+                raise QueueFull(f'Inference queue is full ({len(self._queue)} pending).')
+            self._queue.extend(requests)
+            self.metrics.record_enqueue(len(self._queue))
+            self._ensure_worker()
+            self._cond.notify()
+
+        results = []
+        deadline = time.monotonic() + self.timeout_s
+        for request in requests:
+            if not request.done.wait(max(deadline - time.monotonic(), 0)):
+                self._cancel(requests)
+                raise TimeoutError('Timed out waiting for inference result.')
+            if request.error is not None:
+                raise request.error
+            results.append(request.result)
+        return results
+
+    def _cancel(self, requests):
+        """Drop a timed-out caller's requests that have not been run yet."""
+        with self._cond:
+            for request in requests:
+                request.cancelled = True
+            depth = len(self._queue)
+            self._queue = deque(r for r in self._queue if not r.cancelled)
+            self.metrics.record_cancel(depth - len(self._queue), len(self._queue))
+
+    def _ensure_worker(self):
+        # Called with self._cond held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='safebite-inference-batcher', daemon=True
+            )
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Give concurrent callers a short window to join this batch
+            deadline = self._queue[0].enqueued_at + self.max_wait_s
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                request = self._queue.popleft()
+                if not request.cancelled:  # _cancel() drops these; skip any left behind
+                    batch.append(request)
+            return batch, len(self._queue)
+
+    def _run(self):
+        while True:
+            batch, depth = self._next_batch()
+            if not batch:
+                continue
+            started = time.monotonic()
+            wait_s = sum(started - r.enqueued_at for r in batch)
+            failed = False
+            try:
+                outputs = self.predict_fn(np.stack([r.inputs for r in batch]))
+                for request, output in zip(batch, outputs):
+                    request.result = output
+            except Exception as e:
+                failed = True
+                for request in batch:
+                    request.error = e
+            finally:
+                self.metrics.record_batch(
+                    len(batch), depth, wait_s, time.monotonic() - started, failed=failed
+                )
+                for request in batch:
+                    request.done.set()
@@ -0,0 +1,128 @@
+# allergy_app/ml_model/calibrate.py
+#
+# Temperature scaling for the classifier's confidences. A softmax network is
+# usually over-confident on some photos and under-confident on others; dividing
+# its logits by one temperature T, fitted on held-out images, makes "70%" mean
+# right about 70% of the time without changing which class ranks first.
+# Run from the project root after training (or after switching backends):
+#
+#   python -m allergy_app.ml_model.calibrate [--backend keras] [--samples 2000]
+#
+# It writes calibration.json next to the model; load_model.py applies it to
+# every prediction. Without the file T = 1 and scores are used as they are.
+import argparse
+import json
+import os
+
+import numpy as np
+
+from .backends import MODEL_DIR
+
+CALIBRATION_PATH = os.path.join(MODEL_DIR, 'calibration.json')
+
+
+def apply_temperature(scores, temperature):
+    """Softmax scores (..., classes) recomputed from their logits divided by `temperature`."""
+    scores = np.asarray(scores, dtype=np.float32)
+    if temperature == 1.0:
+        return scores
+    # The model outputs softmax scores; their log is the logits up to a constant
+    logits = np.log(np.maximum(scores, 1e-12)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    out = np.exp(logits)
+    out /= out.sum(axis=-1, keepdims=True)
+    return out
+
+
+def nll(scores, labels):
+    """Mean negative log-likelihood of the true labels."""
+    return float(-np.mean(np.log(np.maximum(scores[np.arange(len(labels)), labels], 1e-12))))
+
+
+def expected_calibration_error(scores, labels, bins=15):
+    """Gap between top-1 confidence and accuracy, averaged over confidence bins."""
+    confidence = scores.max(axis=1)
+    correct = scores.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    ece = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        in_bin = (confidence > lo) & (confidence <= hi)
+        if in_bin.any():
+            ece += in_bin.mean() * abs(confidence[in_bin].mean() - correct[in_bin].mean())
+    return float(ece)
+
+
+def fit_temperature(scores, labels, low=0.05, high=20.0, iterations=60):
+    """Temperature minimising the NLL of `labels`, by golden-section search on log T."""
+    a, b = np.log(low), np.log(high)
+    ratio = (np.sqrt(5.0) - 1.0) / 2.0
+    loss = lambda log_t: nll(apply_temperature(scores, float(np.exp(log_t))), labels)
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = loss(c), loss(d)
+    for _ in range(iterations):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = loss(c)
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = loss(d)
+    return float(np.exp((a + b) / 2.0))
+
+
+def load_temperature(path=CALIBRATION_PATH):
+    """The fitted temperature, or 1.0 (no scaling) if calibrate has not been run."""
+    try:
+        with open(path) as f:
+            return float(json.load(f)['temperature'])
+    except FileNotFoundError:
+        return 1.0
+
+
+def main():
+    from .backends import load_backend
+    from .compare_backends import DATA_DIR, held_out_sample
+    from .load_model import prepare_image
+
+    parser = argparse.ArgumentParser(description='Fit the temperature that calibrates model confidences.')
+    parser.add_argument('--backend', default='keras')
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--skip', type=int, default=5000,
+                        help="Test-split images left out (compare_backends evaluates on the first ones).")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default=CALIBRATION_PATH)
+    args = parser.parse_args()
+
+    backend = load_backend(args.backend, model_path=args.model_path)
+    sample = held_out_sample(args.data_dir, args.samples, skip=args.skip)
+    labels = np.array([label for _, label in sample])
+    scores = []
+    for start in range(0, len(sample), args.batch_size):
+        batch = np.stack([prepare_image(path) for path, _ in sample[start:start + args.batch_size]])
+        scores.append(np.asarray(backend.predict(batch), dtype=np.float32))
+    scores = np.concatenate(scores)
+
+    temperature = fit_temperature(scores, labels)
+    calibrated = apply_temperature(scores, temperature)
+    report = {
+        'temperature': round(temperature, 4),
+        'backend': backend.name,
+        'samples': len(sample),
+        'nll_before': round(nll(scores, labels), 4),
+        'nll_after': round(nll(calibrated, labels), 4),
+        'ece_before': round(expected_calibration_error(scores, labels), 4),
+        'ece_after': round(expected_calibration_error(calibrated, labels), 4),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    print(f"✅ T = {report['temperature']}: NLL {report['nll_before']} -> {report['nll_after']}, "
+          f"ECE {report['ece_before']} -> {report['ece_after']} on {len(sample)} images. "
+          f"Saved {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
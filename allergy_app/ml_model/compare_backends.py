@@ -0,0 +1,107 @@
+# allergy_app/ml_model/compare_backends.py
+#
+# Accuracy-vs-latency comparison of the inference backends on a held-out
+# sample of the Food-101 test split. Run from the project root:
+#
+#   python -m allergy_app.ml_model.compare_backends [--samples 500] [--backends keras tflite]
+#
+# Reports top-1 / top-5 accuracy, top-1 agreement with the first backend,
+# single-image latency (p50 / p95) and batched throughput for each backend.
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from .backends import BACKENDS, load_backend
+from .load_model import food_classes, prepare_image
+
+DATA_DIR = 'data/food-101'
+
+
+def held_out_sample(data_dir, samples, seed=1337, skip=0):
+    """(path, class index) pairs drawn from Food-101's meta/test.txt, after the first `skip`."""
+    test_list = os.path.join(data_dir, 'meta', 'test.txt')
+    if not os.path.exists(test_list):
+        raise FileNotFoundError(f"Test split not found: {test_list}")
+    class_index = {name: i for i, name in enumerate(food_classes)}
+    with open(test_list) as f:
+        entries = [line.strip() for line in f if line.strip()]
+    random.Random(seed).shuffle(entries)
+    return [
+        (os.path.join(data_dir, 'images', entry + '.jpg'), class_index[entry.split('/')[0]])
+        for entry in entries[skip:skip + samples]
+    ]
+
+
+def evaluate(backend, images, labels, batch_size):
+    # Warm up so one-off graph tracing / allocation is not counted
+    backend.predict(images[:1])
+
+    latencies = []
+    for i in range(len(images)):
+        start = time.perf_counter()
+        backend.predict(images[i:i + 1])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scores = np.concatenate([
+        backend.predict(images[i:i + batch_size]) for i in range(0, len(images), batch_size)
+    ])
+    batched_s = time.perf_counter() - start
+
+    top5 = np.argsort(scores, axis=1)[:, -5:]
+    return {
+        'predictions': scores.argmax(axis=1),
+        'top1_accuracy': float(np.mean(scores.argmax(axis=1) == labels)),
+        'top5_accuracy': float(np.mean([label in row for label, row in zip(labels, top5)])),
+        'latency_p50_ms': 1000.0 * float(np.percentile(latencies, 50)),
+        'latency_p95_ms': 1000.0 * float(np.percentile(latencies, 95)),
+        'batched_images_per_s': len(images) / batched_s,
+        'model_size_mb': os.path.getsize(backend.model_path) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inference backends on held-out images.')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS),
+                        default=[name for name in BACKENDS if name != 'service'],
+                        help="In-process backends by default; 'service' needs a running inference service.")
+    parser.add_argument('--json', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    sample = held_out_sample(args.data_dir, args.samples)
+    images = np.stack([prepare_image(path) for path, _ in sample])
+    labels = np.array([label for _, label in sample])
+    print(f"Evaluating on {len(sample)} held-out images.\n")
+
+    report = {}
+    reference = None
+    for name in args.backends:
+        result = evaluate(load_backend(name), images, labels, args.batch_size)
+        predictions = result.pop('predictions')
+        if reference is None:
+            reference = predictions
+        result['top1_agreement'] = float(np.mean(predictions == reference))
+        report[name] = result
+
+    header = f"{'backend':<8} {'top1':>6} {'top5':>6} {'agree':>6} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'MB':>6}"
+    print(header)
+    print('-' * len(header))
+    for name, r in report.items():
+        print(f"{name:<8} {r['top1_accuracy']:>6.3f} {r['top5_accuracy']:>6.3f} {r['top1_agreement']:>6.3f} "
+              f"{r['latency_p50_ms']:>8.1f} {r['latency_p95_ms']:>8.1f} "
+              f"{r['batched_images_per_s']:>8.1f} {r['model_size_mb']:>6.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# allergy_app/ml_model/export_embeddings.py
+#
+# Export one embedding per classifier class for the alternatives recommender
+# (allergy_app/recommender.py). Run from the project root after train_model.py:
+#
+#   python -m allergy_app.ml_model.export_embeddings [--keras-model PATH]
+#
+# A class's embedding is its column of the final Dense layer: the direction in
+# the penultimate (pooled MobileNetV2 feature) space the classifier scores that
+# class along. Classes the network confuses -- visually similar dishes -- end up
+# close together. Rows are L2-normalized and stored as float16 (~260 KB).
+import argparse
+import os
+
+import numpy as np
+
+from .backends import KERAS_MODEL_PATH, MODEL_DIR
+
+CLASS_EMBEDDINGS_PATH = os.path.join(MODEL_DIR, 'food_embeddings.npy')
+
+
+def load_class_embeddings(path=CLASS_EMBEDDINGS_PATH):
+    """(classes, dim) float32 matrix, or None if it has not been exported."""
+    if not os.path.exists(path):
+        return None
+    return np.load(path).astype(np.float32)
+
+
+def export(keras_path=KERAS_MODEL_PATH, output_path=CLASS_EMBEDDINGS_PATH):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    dense = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)][-1]
+    kernel = dense.get_weights()[0].T  # (classes, features)
+    norms = np.linalg.norm(kernel, axis=1, keepdims=True)
+    embeddings = (kernel / np.maximum(norms, 1e-12)).astype(np.float16)
+    np.save(output_path, embeddings)
+    print(f"✅ Saved {output_path}: {embeddings.shape[0]} classes x {embeddings.shape[1]} dims "
+          f"({os.path.getsize(output_path) / 1e3:.0f} KB).")
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export per-class embeddings for the recommender.')
+    parser.add_argument('--keras-model', default=KERAS_MODEL_PATH)
+    parser.add_argument('--output', default=CLASS_EMBEDDINGS_PATH)
+    args = parser.parse_args()
+    export(args.keras_model, args.output)
@@ -0,0 +1,72 @@
+# allergy_app/ml_model/export_model.py
+#
+# Convert the trained Keras model into an int8-quantized TFLite model for the
+# CPU-only "tflite" backend. Run from the project root after train_model.py:
+#
+#   python -m allergy_app.ml_model.export_model [--samples 300] [--data-dir data/food-101]
+#
+# Weights and activations are quantized to int8 using calibration images from
+# the Food-101 training split (falling back to media/scans). Input and output
+# stay float32 so the backend contract is unchanged.
+import argparse
+import os
+import random
+
+import numpy as np
+
+from .backends import KERAS_MODEL_PATH, TFLITE_MODEL_PATH
+from .load_model import prepare_image
+
+DATA_DIR = 'data/food-101'
+FALLBACK_DIR = 'media/scans'
+
+
+def calibration_images(data_dir, samples, seed=1337):
+    """Paths of images used to calibrate activation ranges."""
+    train_list = os.path.join(data_dir, 'meta', 'train.txt')
+    if os.path.exists(train_list):
+        with open(train_list) as f:
+            paths = [os.path.join(data_dir, 'images', line.strip() + '.jpg') for line in f if line.strip()]
+    else:
+        print(f"⚠️ {train_list} not found, calibrating on {FALLBACK_DIR} instead.")
+        paths = [os.path.join(FALLBACK_DIR, name) for name in sorted(os.listdir(FALLBACK_DIR))
+                 if name.lower().endswith(('.jpg', '.jpeg'))]
+    random.Random(seed).shuffle(paths)
+    return paths[:samples]
+
+
+def export(keras_path=KERAS_MODEL_PATH, output_path=TFLITE_MODEL_PATH, data_dir=DATA_DIR, samples=300):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    paths = calibration_images(data_dir, samples)
+    if not paths:
+        raise FileNotFoundError('No calibration images found.')
+
+    def representative_dataset():
+        for path in paths:
+            yield [np.expand_dims(prepare_image(path), 0)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    tflite_model = converter.convert()
+
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    keras_mb = os.path.getsize(keras_path) / 1e6
+    tflite_mb = len(tflite_model) / 1e6
+    print(f"✅ Saved {output_path} ({tflite_mb:.1f} MB, Keras model was {keras_mb:.1f} MB), "
+          f"calibrated on {len(paths)} images.")
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export an int8 TFLite model for CPU inference.')
+    parser.add_argument('--keras-model', default=KERAS_MODEL_PATH)
+    parser.add_argument('--output', default=TFLITE_MODEL_PATH)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--samples', type=int, default=300, help='Calibration images.')
+    args = parser.parse_args()
+    export(args.keras_model, args.output, args.data_dir, args.samples)
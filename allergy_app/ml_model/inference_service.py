@@ -0,0 +1,452 @@
+# allergy_app/ml_model/inference_service.py
+#
+# Local inference service: a fixed pool of model processes shared by every web
+# worker on the host. Start it next to the web server:
+#
+#   SAFEBITE_INFERENCE_SERVICE_AUTHKEY=<secret> \
+#   python -m allergy_app.ml_model.inference_service [--workers 2] [--threads 2]
+#       [--backend keras|tflite] [--address /run/safebite/inference.sock]
+#
+# and set SAFEBITE_INFERENCE_BACKEND=service and the same key in the web
+# workers. Each model process loads one copy of the model, runs with --threads
+# intra-op threads and is pinned to its own cores, so model memory follows
+# --workers instead of the number of web workers, and web workers never import
+# TensorFlow.
+#
+# Web workers (ServiceClient, used by backends.ServiceBackend) write each
+# preprocessed batch into a memory-mapped buffer file of their own (in /dev/shm
+# where available) and send only its path, shape and dtype over a Unix socket;
+# the model process maps the same file and reads the tensor in place. Only the
+# small score matrix travels back through the socket.
+#
+# The socket lives in a directory only the service's user can enter (0700,
+# created if missing) and both sides authenticate with the key in
+# SAFEBITE_INFERENCE_SERVICE_AUTHKEY, which has no default. Messages are a JSON
+# header plus the raw bytes of at most one array, so nothing received is
+# unpickled, and model processes only map safebite-infer-*.buf files directly
+# inside buffer_dir(). Buffers left by web workers that died are swept when the
+# service starts and whenever a client disconnects.
+import argparse
+import atexit
+import json
+import math
+import mmap
+import os
+import queue
+import socket
+import stat
+import tempfile
+import threading
+import weakref
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), f'safebite-inference-{os.getuid()}', 'inference.sock')
+BUFFER_PREFIX = 'safebite-infer-'
+BUFFER_SUFFIX = '.buf'
+INPUT_DTYPES = ('|u1', '<f4')  # raw pixels or normalized input
+MAX_HEADER_BYTES = 64 * 1024
+
+
+def buffer_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def send_message(conn, message):
+    """Send a dict as a JSON header; an ndarray under 'array' follows as raw bytes."""
+    header, array = dict(message), message.get('array')
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        header['array'] = [list(array.shape), array.dtype.str]
+    conn.send_bytes(json.dumps(header).encode())
+    if array is not None:
+        conn.send_bytes(array.tobytes())
+
+
+def recv_message(conn):
+    """The dict sent by send_message(). Raises ValueError for anything malformed."""
+    message = json.loads(conn.recv_bytes(MAX_HEADER_BYTES))
+    if not isinstance(message, dict):
+        raise ValueError('malformed message')
+    if 'array' in message:
+        shape, dtype = message['array']
+        if dtype != '<f4':
+            raise ValueError(f'unexpected array dtype {dtype!r}')
+        message['array'] = np.frombuffer(conn.recv_bytes(), dtype=np.float32).reshape(shape)
+    return message
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # someone else's process
+        return True
+    return True
+
+
+def sweep_buffers(directory=None):
+    """Delete buffer files of processes that no longer exist; returns how many."""
+    directory = directory or buffer_dir()
+    removed = 0
+    for name in os.listdir(directory):
+        if not (name.startswith(BUFFER_PREFIX) and name.endswith(BUFFER_SUFFIX)):
+            continue
+        pid = name[len(BUFFER_PREFIX):].split('-', 1)[0]
+        if not pid.isdigit() or int(pid) <= 0 or _pid_alive(int(pid)):
+            continue
+        try:
+            os.unlink(os.path.join(directory, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# --- client side (web workers) -----------------------------------------------
+
+class SharedBuffer:
+    """A growable memory-mapped file holding the batch being sent."""
+
+    def __init__(self):
+        self.path = None
+        self._map = None
+        self._size = 0
+        self._finalizer = None
+
+    def write(self, batch):
+        """Copy `batch` into the buffer; returns (path, shape, dtype) for the request."""
+        batch = np.ascontiguousarray(batch)
+        if batch.nbytes > self._size:
+            self._grow(batch.nbytes)
+        np.frombuffer(self._map, dtype=batch.dtype, count=batch.size).reshape(batch.shape)[...] = batch
+        return self.path, batch.shape, batch.dtype.str
+
+    def _grow(self, nbytes):
+        # A new file (new inode) tells the model process to re-map it
+        self.close()
+        size = max(nbytes, 1 << 20)
+        fd, self.path = tempfile.mkstemp(prefix=f'{BUFFER_PREFIX}{os.getpid()}-', suffix=BUFFER_SUFFIX,
+                                         dir=buffer_dir())
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._size = size
+        self._finalizer = weakref.finalize(self, SharedBuffer._release, self._map, self.path)
+
+    @staticmethod
+    def _release(mapped, path):
+        try:
+            mapped.close()
+        except BufferError:  # an array view is still alive; the mapping goes with the process
+            pass
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        self._map, self._size, self._finalizer = None, 0, None
+
+
+class ServiceClient:
+    """Connection to the inference service; one socket and buffer per calling thread."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        if not authkey:
+            raise ValueError('The inference service needs a shared key: set SAFEBITE_INFERENCE_SERVICE_AUTHKEY '
+                             'for the service and the web workers.')
+        self.address = address
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self._local = threading.local()
+        self._buffers = []
+        atexit.register(self.close)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:  # kept across reconnects: a restarted service maps the same file
+            buffer = self._local.buffer = SharedBuffer()
+            self._buffers.append(buffer)
+        return conn, buffer
+
+    def _disconnect(self):
+        conn, self._local.conn = self._local.conn, None
+        conn.close()
+
+    def predict(self, batch):
+        for attempt in (1, 2):  # reconnect once if the service was restarted
+            conn, buffer = self._connection()
+            path, shape, dtype = buffer.write(batch)
+            try:
+                send_message(conn, {'op': 'predict', 'path': path, 'shape': shape, 'dtype': dtype})
+                reply = recv_message(conn)
+                break
+            except (EOFError, OSError):
+                self._disconnect()
+                if attempt == 2:
+                    raise
+        if reply.get('status') != 'ok':
+            raise RuntimeError(f"Inference service error: {reply.get('message')}")
+        return reply['array']
+
+    def stats(self):
+        conn, _ = self._connection()
+        send_message(conn, {'op': 'stats'})
+        return recv_message(conn)['stats']
+
+    def close(self):
+        for buffer in self._buffers:
+            buffer.close()
+        self._buffers = []
+
+
+# --- model processes -----------------------------------------------------------
+
+def _buffer_path(path):
+    """`path` resolved, if it is a buffer file directly inside buffer_dir(); else ValueError."""
+    real = os.path.realpath(path)
+    name = os.path.basename(real)
+    if (os.path.dirname(real) != os.path.realpath(buffer_dir())
+            or not name.startswith(BUFFER_PREFIX) or not name.endswith(BUFFER_SUFFIX)):
+        raise ValueError(f'not an inference buffer: {path}')
+    return real
+
+
+def _map_buffer(maps, path):
+    """Read-only mapping of a buffer file, re-mapped when the client replaced it."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f'not an inference buffer: {path}')
+        key = (st.st_ino, st.st_size)
+        cached = maps.get(path)
+        if cached is None or cached[0] != key:
+            if cached is not None:
+                cached[1].close()
+            maps[path] = cached = (key, mmap.mmap(fd, 0, access=mmap.ACCESS_READ))
+    finally:
+        os.close(fd)
+    return cached[1]
+
+
+def _worker_main(conn, backend_name, model_path, num_threads, cores):
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    from .backends import load_backend
+    from .preprocess import normalize
+
+    model = load_backend(backend_name, model_path=model_path, num_threads=num_threads)
+    maps = {}  # buffer path -> ((inode, size), mmap)
+    send_message(conn, {'status': 'ready', 'pid': os.getpid()})
+    while True:
+        try:
+            message = recv_message(conn)
+        except EOFError:
+            break
+        if message.get('op') == 'stop':
+            break
+        try:
+            if message.get('dtype') not in INPUT_DTYPES:
+                raise ValueError(f"unsupported dtype {message.get('dtype')!r}")
+            shape = tuple(int(n) for n in message['shape'])
+            mapped = _map_buffer(maps, _buffer_path(message['path']))
+            batch = np.frombuffer(mapped, dtype=np.dtype(message['dtype']), count=math.prod(shape)).reshape(shape)
+            if batch.dtype == np.uint8:  # raw pixels: normalize here rather than in the web worker
+                batch = normalize(batch)
+            send_message(conn, {'status': 'ok', 'array': np.asarray(model.predict(batch), dtype=np.float32)})
+        except Exception as e:
+            send_message(conn, {'status': 'error', 'message': f'{type(e).__name__}: {e}'})
+        # Forget buffers of web workers that went away
+        for gone in [p for p in maps if not os.path.exists(p)]:
+            maps.pop(gone)[1].close()
+
+
+class _Worker:
+    def __init__(self, index, conn, process):
+        self.index, self.conn, self.process = index, conn, process
+
+
+def prepare_address(address):
+    """
+    Create the socket's private directory and remove a stale socket left by a
+    service that is gone. Raises RuntimeError rather than touch anything else.
+    """
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f'{directory} must be a directory owned by this user with mode 0700.')
+    try:
+        st = os.lstat(address)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise RuntimeError(f'{address} exists and is not a socket.')
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    except ConnectionRefusedError:
+        os.unlink(address)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f'Another inference service is listening on {address}.')
+
+
+class InferenceService:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, workers=2, threads=2,
+                 backend='keras', model_path=None, pin=True, context=None):
+        if not authkey:
+            raise ValueError('The inference service needs a shared key (SAFEBITE_INFERENCE_SERVICE_AUTHKEY).')
+        self.address = address
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self.workers = workers
+        self.threads = threads
+        self.backend = backend
+        self.model_path = model_path
+        self.pin = pin
+        self._ctx = context or get_context('spawn')  # no inherited Django / TensorFlow state
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self.ready = threading.Event()
+        self._stopping = threading.Event()
+
+    def _cores(self, index):
+        if not self.pin or not hasattr(os, 'sched_getaffinity'):
+            return None
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < self.workers * self.threads:
+            return None  # not enough cores to give each worker its own
+        return cores[index * self.threads:(index + 1) * self.threads]
+
+    def _spawn(self, index):
+        parent, child = self._ctx.Pipe()
+        cores = self._cores(index)
+        process = self._ctx.Process(
+            target=_worker_main, name=f'safebite-inference-{index}', daemon=True,
+            args=(child, self.backend, self.model_path, self.threads, cores),
+        )
+        process.start()
+        child.close()
+        pid = recv_message(parent)['pid']
+        print(f"Model worker {index} ready (pid {pid}, {self.threads} threads"
+              f"{f', cores {cores}' if cores else ''}).")
+        return _Worker(index, parent, process)
+
+    def _predict(self, message):
+        # Forward only the known fields
+        request = {'op': 'predict', 'path': message.get('path'), 'shape': message.get('shape'),
+                   'dtype': message.get('dtype')}
+        worker = self._idle.get()
+        try:
+            send_message(worker.conn, request)
+            reply = recv_message(worker.conn)
+        except (EOFError, OSError) as e:
+            print(f"Model worker {worker.index} died ({e}); restarting it.")
+            worker.process.join(timeout=1)
+            worker = self._spawn(worker.index)
+            reply = {'status': 'error', 'message': 'model worker restarted'}
+        finally:
+            self._idle.put(worker)
+        with self._lock:
+            self._requests += 1
+            self._errors += reply['status'] != 'ok'
+        return reply
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = recv_message(conn)
+                except (EOFError, OSError, ValueError):
+                    break
+                if message.get('op') == 'predict':
+                    send_message(conn, self._predict(message))
+                elif message.get('op') == 'stats':
+                    with self._lock:
+                        send_message(conn, {'status': 'ok', 'stats': {
+                            'workers': self.workers, 'threads': self.threads, 'requests': self._requests,
+                            'errors': self._errors, 'idle': self._idle.qsize(),
+                        }})
+                else:
+                    send_message(conn, {'status': 'error', 'message': f"unknown op {message.get('op')!r}"})
+        sweep_buffers()  # the client may have exited without removing its buffer
+
+    def serve_forever(self):
+        prepare_address(self.address)
+        sweep_buffers()
+        workers = [self._spawn(i) for i in range(self.workers)]
+        for worker in workers:
+            self._idle.put(worker)
+        listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        print(f"Inference service listening on {self.address} with {self.workers} "
+              f"{self.backend} worker(s).")
+        self.ready.set()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:  # failed handshake
+                    print(f"Rejected connection: {e}")
+                    continue
+                if self._stopping.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            while not self._idle.empty():
+                worker = self._idle.get()
+                send_message(worker.conn, {'op': 'stop'})
+                worker.process.join(timeout=5)
+
+    def shutdown(self):
+        """Stop accepting connections and stop the model workers."""
+        self._stopping.set()
+        try:
+            Client(self.address, family='AF_UNIX', authkey=self.authkey).close()  # wake accept()
+        except (OSError, EOFError):  # the loop saw the flag first and closed the listener
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the shared SafeBite inference service.')
+    parser.add_argument('--address', default=os.environ.get('SAFEBITE_INFERENCE_SERVICE_ADDRESS', DEFAULT_ADDRESS),
+                        help='Unix socket path; its directory must be private (0700).')
+    parser.add_argument('--workers', type=int, default=2, help='Model processes (one model copy each).')
+    parser.add_argument('--threads', type=int, default=2, help='Intra-op threads per model process.')
+    parser.add_argument('--backend', default='keras', help="'keras', 'tflite' or 'package.module:Class'.")
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--no-pin', action='store_true', help='Do not pin model processes to cores.')
+    args = parser.parse_args()
+    authkey = os.environ.get('SAFEBITE_INFERENCE_SERVICE_AUTHKEY')
+    if not authkey:
+        parser.error('set SAFEBITE_INFERENCE_SERVICE_AUTHKEY to a secret shared with the web workers.')
+    service = InferenceService(
+        address=args.address, authkey=authkey,
+        workers=args.workers, threads=args.threads, backend=args.backend,
+        model_path=args.model_path, pin=not args.no_pin,
+    )
+    try:
+        service.serve_forever()
+    except RuntimeError as e:
+        parser.exit(1, f'{e}\n')
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# allergy_app/ml_model/input_pipeline.py
+#
+# tf.data input pipeline for train_model.py, replacing the Python-side
+# ImageDataGenerator.flow_from_directory:
+#
+# * JPEGs are decoded and resized in parallel inside the TF runtime
+#   (num_parallel_calls=AUTOTUNE) instead of one Python thread;
+# * decoded 224x224 uint8 images are cached to a local file on the first epoch
+#   (about 150 KB per image, ~11 GB for the Food-101 training split), so later
+#   epochs skip JPEG decoding entirely;
+# * augmentation runs as Keras preprocessing layers on whole batches;
+# * batches are prefetched with an autotuned buffer so input overlaps training.
+#
+# The train / validation split matches flow_from_directory(validation_split=...):
+# per class, the first `validation_split` of the sorted file names validate.
+import math
+import os
+import time
+
+import tensorflow as tf
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def split_files(images_dir, class_names, validation_split=0.2):
+    """((train_paths, train_labels), (val_paths, val_labels)) like flow_from_directory."""
+    train, val = ([], []), ([], [])
+    for label, name in enumerate(class_names):
+        class_dir = os.path.join(images_dir, name)
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+        n_val = int(validation_split * len(files))
+        for i, f in enumerate(files):
+            paths, labels = val if i < n_val else train
+            paths.append(os.path.join(class_dir, f))
+            labels.append(label)
+    return train, val
+
+
+class RandomShear(tf.keras.layers.Layer):
+    """
+    ImageDataGenerator's shear_range for whole batches: each image is sheared
+    by an angle drawn from [-degrees, degrees] about its centre, with edge
+    pixels repeated (fill_mode='nearest').
+    """
+
+    def __init__(self, degrees, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.degrees = degrees
+        self.seed = seed
+
+    def call(self, images, training=None):
+        if not training or not self.degrees:
+            return images
+        shape = tf.shape(images)
+        angle = tf.random.uniform([shape[0]], -self.degrees, self.degrees, seed=self.seed) * (math.pi / 180)
+        cx = tf.cast(shape[2], tf.float32) / 2
+        cos, sin = tf.cos(angle), tf.sin(angle)
+        zero, one = tf.zeros_like(angle), tf.ones_like(angle)
+        # Output (x, y) samples input (cos*(x-cx) + cx, y - sin*(x-cx)), as in
+        # ImageDataGenerator's shear matrix [[1, -sin, 0], [0, cos, 0]] on (row, col)
+        transforms = tf.stack([cos, zero, cx - cos * cx, -sin, one, sin * cx, zero, zero], axis=1)
+        return tf.raw_ops.ImageProjectiveTransformV3(
+            images=images, transforms=transforms, output_shape=shape[1:3],
+            fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST',
+        )
+
+    def get_config(self):
+        return {**super().get_config(), 'degrees': self.degrees, 'seed': self.seed}
+
+
+def augmentation():
+    """Vectorized counterpart of the ImageDataGenerator settings in train_model.py."""
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomRotation(20 / 360),
+        tf.keras.layers.RandomTranslation(0.2, 0.2),
+        RandomShear(0.1),  # shear_range is in degrees
+        tf.keras.layers.RandomFlip('horizontal'),
+        tf.keras.layers.RandomZoom(0.2),
+    ], name='augmentation')
+
+
+def _decode(path, label, img_size, num_classes):
+    data = tf.io.read_file(path)
+    image = tf.io.decode_image(data, channels=3, expand_animations=False)
+    image = tf.image.resize(image, img_size, method='bilinear')
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    return image, tf.one_hot(label, num_classes)
+
+
+def make_dataset(paths, labels, img_size, num_classes, batch_size, training,
+                 cache_file=None, augment=None, seed=1337):
+    """Batched (image, one-hot label) dataset, images scaled to [-1, 1] for MobileNetV2."""
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(lambda p, l: _decode(p, l, img_size, num_classes),
+                num_parallel_calls=AUTOTUNE, deterministic=not training)
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        ds = ds.cache(cache_file)
+    if training:
+        ds = ds.shuffle(4096, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size, drop_remainder=False)
+    if training and augment is not None:
+        ds = ds.map(lambda x, y: (augment(tf.cast(x, tf.float32), training=True), y),
+                    num_parallel_calls=AUTOTUNE)
+    preprocess = tf.keras.applications.mobilenet_v2.preprocess_input
+    ds = ds.map(lambda x, y: (preprocess(tf.cast(x, tf.float32)), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def cpu_supports_bf16():
+    """True if the CPU has native bfloat16 math (AVX512_BF16 or AMX)."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def configure_mixed_precision(mode='auto'):
+    """
+    Set the Keras global dtype policy and return its name: mixed_float16 on a
+    GPU, mixed_bfloat16 on CPUs with bf16 support, float32 otherwise.
+    """
+    policy = 'float32'
+    if mode != 'off':
+        if tf.config.list_physical_devices('GPU'):
+            policy = 'mixed_float16'
+        elif mode == 'on' or cpu_supports_bf16():
+            policy = 'mixed_bfloat16'
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Log training images per second each epoch, to compare input pipelines."""
+
+    def __init__(self, batch_size, label=''):
+        super().__init__()
+        self.batch_size = batch_size
+        self.label = label
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._batches += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._started
+        images = self._batches * self.batch_size
+        rate = images / elapsed if elapsed else 0.0
+        if logs is not None:
+            logs['images_per_sec'] = rate
+        print(f"\n⏱️ [{self.label}] epoch {epoch + 1}: {images} images in {elapsed:.1f}s "
+              f"({rate:.1f} images/s)")
+
+
+def benchmark_input(batches, num_batches, batch_size, label=''):
+    """Images/s of an input pipeline alone (no model), over `num_batches` batches."""
+    started = time.perf_counter()
+    n = 0
+    for _ in batches:
+        n += 1
+        if n >= num_batches:
+            break
+    elapsed = time.perf_counter() - started
+    rate = n * batch_size / elapsed if elapsed else 0.0
+    print(f"⏱️ [{label}] input only: {n} batches in {elapsed:.1f}s ({rate:.1f} images/s)")
+    return rate
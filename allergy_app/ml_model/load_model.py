@@ -1,39 +1,295 @@
 # allergy_app/ml_model/load_model.py
-import tensorflow as tf
+#
+# TensorFlow is only imported when the first prediction is made (or when
+# preload_model() is called), so importing this module -- and therefore the
+# views -- stays cheap for manage.py commands, migrations and tests.
+#
+# The backend serving predictions (full Keras graph or quantized TFLite) is
+# picked by settings.INFERENCE_BACKEND; see backends.py. With 'service' the
+# model runs in the shared inference service instead of this process.
+#
+# Scores are calibrated with the temperature fitted by calibrate.py before
+# they are ranked, so confidences (and the top-k candidates offered on the
+# result page) are probabilities rather than raw softmax outputs.
 import numpy as np
 from PIL import Image
+import io
 import os
 import json
+import threading
+import time
 
-# Load model
-model_path = os.path.join(os.path.dirname(__file__), 'food_model_full.h5')
-model = tf.keras.models.load_model(model_path)
+from django.conf import settings
 
-# Load class names
+from ..metrics import observe, span
+from .backends import ServiceBackend, backend_class, load_backend
+from .batching import BatchingEngine
+from .calibrate import CALIBRATION_PATH, apply_temperature, load_temperature
+from .prediction_cache import PredictionCache, content_hash, file_fingerprint, perceptual_hash
+from .preprocess import IMG_SIZE, normalize, preprocess_batch, preprocess_image
+
+TOP_K = 5
+
+# Load class names (small JSON file, safe to read at import time)
 classes_path = os.path.join(os.path.dirname(__file__), 'food_classes.json')
 with open(classes_path, 'r') as f:
     food_classes = json.load(f)
-print(f"Loaded {len(food_classes)} food classes.")
 
-def predict_food(image_path):
-    """Predict food class and confidence from image path."""
+_load_lock = threading.Lock()
+_backend = None
+_engine = None
+_prediction_cache = None
+_temperature = None
+_model_fingerprint = None  # of the model file when the backend loaded it
+
+
+def get_backend():
+    """Return the configured inference backend, loading the model on first use."""
+    global _backend, _model_fingerprint
+    if _backend is None:
+        with _load_lock:
+            if _backend is None:
+                name = getattr(settings, 'INFERENCE_BACKEND', 'keras')
+                options = {}
+                if name == ServiceBackend.name:
+                    options = {
+                        'address': getattr(settings, 'INFERENCE_SERVICE_ADDRESS', None),
+                        'authkey': getattr(settings, 'INFERENCE_SERVICE_AUTHKEY', None),
+                    }
+                _model_fingerprint = file_fingerprint(model_file_path())
+                _backend = load_backend(
+                    name,
+                    model_path=getattr(settings, 'INFERENCE_MODEL_PATH', None),
+                    num_threads=getattr(settings, 'INFERENCE_NUM_THREADS', None),
+                    **options,
+                )
+                print(f"Loaded {_backend.name} model with {len(food_classes)} food classes.")
+    return _backend
+
+
+def get_engine():
+    """Return the batching engine; concurrent requests share forward passes through it."""
+    global _engine
+    if _engine is None:
+        with _load_lock:
+            if _engine is None:
+                _engine = BatchingEngine(
+                    _forward,
+                    max_batch_size=getattr(settings, 'INFERENCE_MAX_BATCH_SIZE', 8),
+                    max_wait_ms=getattr(settings, 'INFERENCE_MAX_WAIT_MS', 5),
+                    max_queue_size=getattr(settings, 'INFERENCE_MAX_QUEUE_SIZE', 256),
+                )
+    return _engine
+
+
+def _forward(batch):
+    """One forward pass of the batching engine, timed on its own (without queueing)."""
+    backend = get_backend()
+    started = time.perf_counter()
+    outputs = backend.predict(batch)
+    observe('safebite_model_predict_seconds', time.perf_counter() - started)
+    return outputs
+
+
+def get_prediction_cache():
+    """Return the cache that answers repeat uploads of the same photo without inference."""
+    global _prediction_cache
+    if _prediction_cache is None:
+        with _load_lock:
+            if _prediction_cache is None:
+                _prediction_cache = PredictionCache(
+                    max_entries=getattr(settings, 'PREDICTION_CACHE_SIZE', 2048),
+                    phash_max_distance=getattr(settings, 'PREDICTION_CACHE_PHASH_DISTANCE', 0),
+                )
+    return _prediction_cache
+
+
+def get_temperature():
+    """Calibration temperature (settings.INFERENCE_CALIBRATION_PATH, read once); 1.0 if none."""
+    global _temperature
+    if _temperature is None:
+        _temperature = load_temperature(getattr(settings, 'INFERENCE_CALIBRATION_PATH', None) or CALIBRATION_PATH)
+    return _temperature
+
+
+def model_fingerprint():
+    """Fingerprint of the loaded model or, before it loads, of the file get_backend() will load."""
+    global _model_fingerprint
+    if _model_fingerprint is None:
+        _model_fingerprint = file_fingerprint(model_file_path())
+    return _model_fingerprint
+
+
+def model_file_path():
+    backend_name = getattr(settings, 'INFERENCE_BACKEND', 'keras')
+    return getattr(settings, 'INFERENCE_MODEL_PATH', None) or backend_class(backend_name).default_path
+
+
+def is_model_loaded():
+    return _backend is not None
+
+
+def preload_model():
+    """Load the model eagerly, e.g. in a WSGI worker before it starts serving."""
+    get_backend()
+    get_engine()
+
+
+def inference_metrics():
+    """Queue depth / batch fill counters of the batching engine and cache hit rates."""
+    metrics = {'prediction_cache': get_prediction_cache().stats()}
+    if _engine is not None:
+        metrics.update(_engine.metrics.snapshot())
+    return metrics
+
+
+def prepare_image(image_path):
+    """Load an image file (path or file object) as a float32 array of shape (224, 224, 3)."""
+    return preprocess_image(image_path, IMG_SIZE)
+
+
+def _cache_lookup(data, pixels=None, top_k=TOP_K):
+    """Return (digest, phash, cached_result) for raw image bytes (and their decoded pixels)."""
+    prediction_cache = get_prediction_cache()
+    digest = content_hash(data)
+    # Entries hold TOP_K candidates; asking for more skips the cache
+    if not prediction_cache.enabled or top_k > TOP_K:
+        return digest, None, None
+    # Entries belong to the model actually loaded (a replaced file is only served
+    # after a reload) and are calibrated: a new temperature invalidates them too
+    prediction_cache.check_model((model_fingerprint(), get_temperature()))
+    phash = None
+    if prediction_cache.phash_max_distance > 0:
+        image = Image.fromarray(pixels) if pixels is not None else Image.open(io.BytesIO(data))
+        phash = perceptual_hash(image)
+    cached = prediction_cache.get(digest, phash)
+    return digest, phash, _trim(cached, top_k) if cached is not None else None
+
+
+def _rank(predictions, top_k):
+    predictions = apply_temperature(predictions, get_temperature())
+    # Cached results keep at least TOP_K candidates, whatever this caller asked for
+    ranked = np.argsort(predictions)[::-1][:max(top_k, TOP_K)]
+    top = [(int(i), float(predictions[i])) for i in ranked]
+    return top[0][0], top[0][1], top
+
+
+def _trim(result, top_k):
+    class_idx, confidence, top = result
+    return class_idx, confidence, top[:top_k]
+
+
+def classify_bytes(data, top_k=TOP_K):
+    """
+    Classify raw image bytes and return (class_idx, confidence, top_k) where top_k is
+    a list of (class_idx, probability) pairs, best first. Results are cached by the
+    content hash of the bytes, so identical re-uploads skip inference.
+    """
+    with span('cache_lookup'):
+        digest, phash, cached = _cache_lookup(data, top_k=top_k)
+    if cached is not None:
+        return cached
+    with span('preprocess'):
+        image = prepare_image(io.BytesIO(data))
+    with span('inference_wait'):
+        predictions = get_engine().predict(image)
+    result = _rank(predictions, top_k)
+    get_prediction_cache().put(digest, result, phash)
+    return _trim(result, top_k)
+
+
+def classify_pixels(pixels, data, top_k=TOP_K):
+    """
+    classify_bytes() for an image that is already decoded: `pixels` is the uint8
+    (224, 224, 3) array and `data` the encoded bytes, used only as the cache key.
+    """
+    with span('cache_lookup'):
+        digest, phash, cached = _cache_lookup(data, pixels, top_k)
+    if cached is not None:
+        return cached
+    with span('preprocess'):
+        image = normalize(pixels)
+    with span('inference_wait'):
+        predictions = get_engine().predict(image)
+    result = _rank(predictions, top_k)
+    get_prediction_cache().put(digest, result, phash)
+    return _trim(result, top_k)
+
+
+def classify_image(image_path, top_k=TOP_K):
+    """classify_bytes() for an image file on disk."""
+    with open(image_path, 'rb') as f:
+        return classify_bytes(f.read(), top_k)
+
+
+def classify_batch(datas, top_k=TOP_K, pixels=None):
+    """
+    classify_bytes() for many images at once: cache misses are decoded together
+    and queued on the batching engine in one go, so they fill whole batches
+    (and share them with concurrent scans). If `pixels` (the
+    already-decoded uint8 arrays, one per image) is given nothing is decoded.
+    """
+    results = [None] * len(datas)
+    misses = []
+    with span('cache_lookup'):
+        for i, data in enumerate(datas):
+            digest, phash, cached = _cache_lookup(data, pixels[i] if pixels is not None else None, top_k)
+            if cached is not None:
+                results[i] = cached
+            else:
+                misses.append((i, digest, phash))
+
+    if misses:
+        with span('preprocess'):
+            if pixels is not None:
+                batch = normalize(np.stack([pixels[i] for i, _, _ in misses]))
+            else:
+                batch = preprocess_batch([io.BytesIO(datas[i]) for i, _, _ in misses], IMG_SIZE)
+        with span('inference_wait'):
+            predictions = get_engine().predict_many(list(batch))
+        prediction_cache = get_prediction_cache()
+        for (i, digest, phash), row in zip(misses, predictions):
+            result = _rank(row, top_k)
+            prediction_cache.put(digest, result, phash)
+            results[i] = _trim(result, top_k)
+    return results
+
+
+def display_name(class_idx):
+    # Convert snake_case to Title Case: 'apple_pie' → 'Apple Pie'
+    return ' '.join(word.capitalize() for word in food_classes[class_idx].split('_'))
+
+
+def predict_top_k(image_path=None, pixels=None, data=None):
+    """
+    The TOP_K most likely classes as (class_idx, calibrated probability) pairs,
+    best first, from image path or from already-decoded `pixels` plus the
+    encoded `data` they came from (see allergy_app/ingest.py).
+    Returns [] if the image cannot be classified.
+    """
     try:
-        # Load and preprocess image
-        img = Image.open(image_path).convert('RGB')  # Ensure 3-channel
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0  # Normalize to [0,1]
-        img_array = np.expand_dims(img_array, axis=0)  # Add batch dim
-
-        # Predict
-        predictions = model.predict(img_array, verbose=0)
-        class_idx = np.argmax(predictions, axis=1)[0]
-        confidence = float(predictions[0][class_idx])
-
-        # Convert snake_case to Title Case: 'apple_pie' → 'Apple Pie'
-        class_name = food_classes[class_idx]
-        display_name = ' '.join(word.capitalize() for word in class_name.split('_'))
-
-        return display_name, confidence
+        if pixels is not None:
+            _, _, top = classify_pixels(pixels, data)
+        else:
+            _, _, top = classify_image(image_path)
+        return top
     except Exception as e:
         print(f"Prediction error: {e}")
+        return []
+
+
+def predict_class(image_path=None, pixels=None, data=None):
+    """
+    Predict class index and confidence; see predict_top_k().
+    Returns (None, 0.0) if the image cannot be classified.
+    """
+    top = predict_top_k(image_path, pixels, data)
+    return top[0] if top else (None, 0.0)
+
+
+def predict_food(image_path=None, pixels=None, data=None):
+    """Predict food display name and confidence; see predict_class()."""
+    class_idx, confidence = predict_class(image_path, pixels, data)
+    if class_idx is None:
         return "Unknown", 0.0
+    return display_name(class_idx), confidence
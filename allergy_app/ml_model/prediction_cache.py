@@ -0,0 +1,124 @@
+# allergy_app/ml_model/prediction_cache.py
+#
+# In-process LRU cache of classifier results keyed by the SHA-256 of the
+# uploaded image bytes, so re-uploads of the same photo skip inference.
+# Optionally a 64-bit difference hash (dHash) also matches near-duplicates
+# (re-encoded / slightly resized copies) within a Hamming distance.
+# Entries are tagged with a fingerprint of the model the backend loaded and the
+# whole cache is dropped as soon as a different model is serving.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image):
+    """64-bit dHash of a PIL image: compares horizontally adjacent pixels of a 9x8 thumbnail."""
+    image.draft('L', (64, 64))  # cheap reduced-scale JPEG decode; no-op for other formats
+    pixels = list(image.convert('L').resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def file_fingerprint(path):
+    """Changes whenever the file is replaced or rewritten."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+class PredictionCache:
+    def __init__(self, max_entries=2048, phash_max_distance=0):
+        self.max_entries = max_entries
+        self.phash_max_distance = phash_max_distance
+        self._entries = OrderedDict()  # digest -> (result, phash)
+        self._phashes = {}  # phash -> digest
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def check_model(self, fingerprint):
+        """Drop every entry if they were stored for a different model than `fingerprint`."""
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._phashes.clear()
+                self._fingerprint = fingerprint
+
+    def get(self, digest, phash=None):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            if phash is not None and self.phash_max_distance > 0:
+                match = self._nearest(phash)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.near_hits += 1
+                    return self._entries[match][0]
+            self.misses += 1
+            return None
+
+    def _nearest(self, phash):
+        # Linear scan is fine for a few thousand entries (one XOR + popcount each)
+        best, best_distance = None, self.phash_max_distance + 1
+        for other, digest in self._phashes.items():
+            distance = (phash ^ other).bit_count()
+            if distance < best_distance:
+                best, best_distance = digest, distance
+        return best
+
+    def put(self, digest, result, phash=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[digest] = (result, phash)
+            self._entries.move_to_end(digest)
+            if phash is not None:
+                self._phashes[phash] = digest
+            while len(self._entries) > self.max_entries:
+                _, (_, old_phash) = self._entries.popitem(last=False)
+                if old_phash is not None and self._phashes.get(old_phash) not in self._entries:
+                    self._phashes.pop(old_phash, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._phashes.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,47 @@
+# allergy_app/ml_model/preprocess.py
+#
+# Image decoding and normalization for the classifier.
+#
+# * JPEGs are decoded with PIL's draft mode, which lets libjpeg decode at
+#   1/2, 1/4 or 1/8 scale directly, so a 12 MP phone photo never gets fully
+#   decompressed just to be shrunk to 224x224.
+# * Normalization matches training: train_model.py feeds images through
+#   mobilenet_v2.preprocess_input, which maps [0, 255] to [-1, 1].
+# * Batches are decoded into one preallocated uint8 buffer and normalized with
+#   a single vectorized float32 operation.
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)
+
+
+def decode_image(source, size=IMG_SIZE):
+    """Decode an image (path, file object or PIL image) to an RGB uint8 array of `size`."""
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    # Smallest JPEG scale that is still at least `size`; no-op for other formats
+    img.draft('RGB', size)
+    img = img.convert('RGB')
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.BILINEAR)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def normalize(pixels):
+    """MobileNetV2 preprocess_input ('tf' mode): uint8 [0, 255] -> float32 [-1, 1]."""
+    out = pixels.astype(np.float32)
+    out *= 1.0 / 127.5
+    out -= 1.0
+    return out
+
+
+def preprocess_image(source, size=IMG_SIZE):
+    """Model-ready float32 array of shape (H, W, 3) for a single image."""
+    return normalize(decode_image(source, size))
+
+
+def preprocess_batch(sources, size=IMG_SIZE):
+    """Model-ready float32 array of shape (N, H, W, 3) for several images."""
+    pixels = np.empty((len(sources), size[1], size[0], 3), dtype=np.uint8)
+    for i, source in enumerate(sources):
+        pixels[i] = decode_image(source, size)
+    return normalize(pixels)
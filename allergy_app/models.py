@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models.functions import Upper
 
 class Allergen(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -19,9 +20,32 @@ class FoodItem(models.Model):
     ingredients = models.TextField()
     allergens = models.ManyToManyField(Allergen, blank=True)
 
+    class Meta:
+        indexes = [
+            # name__iexact compiles to UPPER("name") = UPPER(%s) on PostgreSQL
+            models.Index(Upper('name'), name='fooditem_name_upper_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+class FoodClass(models.Model):
+    """
+    One output class of the classifier (an index into ml_model/food_classes.json)
+    and the catalogue food it stands for. Kept in sync by `manage.py sync_food_classes`.
+    """
+    index = models.PositiveIntegerField(unique=True)
+    label = models.CharField(max_length=100)  # class name, e.g. 'cup_cakes'
+    food_item = models.ForeignKey(FoodItem, null=True, blank=True, on_delete=models.SET_NULL,
+                                  related_name='classes')
+
+    class Meta:
+        ordering = ['index']
+        verbose_name_plural = 'food classes'
+
+    def __str__(self):
+        return f"{self.index}: {self.label}"
+
 class ScanHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     food_item = models.ForeignKey(FoodItem,null=True, blank=True, on_delete=models.CASCADE)
@@ -29,7 +53,44 @@ class ScanHistory(models.Model):
     scanned_at = models.DateTimeField(auto_now_add=True)
     allergen_detected = models.BooleanField(default=False)
     confidence = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True) 
+    # [class index, calibrated probability] pairs the user may pick from, best first
+    candidates = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history / of all scans, newest first
+            models.Index(fields=['user', '-scanned_at', '-id'], name='scan_user_recent_idx'),
+            models.Index(fields=['-scanned_at', '-id'], name='scan_recent_idx'),
+            # Allergen alerts are a small fraction of scans: index only those rows
+            models.Index(fields=['-scanned_at'], condition=models.Q(allergen_detected=True),
+                         name='scan_alert_idx'),
+        ]
 
     def __str__(self):
         food_name = self.food_item.name if self.food_item else "Unknown"
         return f"{self.user.username} - {food_name}"
+
+class ScanJob(models.Model):
+    """A queued inference job for a scan submitted in asynchronous mode."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    scan = models.OneToOneField(ScanHistory, on_delete=models.CASCADE, related_name='job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job for scan {self.scan_id} ({self.status})"
@@ -0,0 +1,89 @@
+# allergy_app/pagination.py
+#
+# Keyset (cursor) pagination for scan history, newest first. A page is fetched
+# with `WHERE (scanned_at, id) < (cursor)` + `LIMIT n` on the
+# (user, scanned_at, id) / (scanned_at, id) indexes, so page N costs the same
+# as page 1 however long the history is -- unlike OFFSET, which re-reads every
+# skipped row.
+import base64
+import binascii
+from dataclasses import dataclass
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(scan):
+    raw = f'{scan.scanned_at.isoformat()}|{scan.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(scanned_at, pk) from a cursor string, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        scanned_at, pk = raw.rsplit('|', 1)
+        scanned_at = parse_datetime(scanned_at)
+        return (scanned_at, int(pk)) if scanned_at else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def page_size_from(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        return max(1, min(int(request.GET.get('size', default)), MAX_PAGE_SIZE))
+    except ValueError:
+        return default
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """One page of `queryset` ordered by (-scanned_at, -id), starting after `cursor`."""
+    queryset = queryset.order_by('-scanned_at', '-pk')
+    position = decode_cursor(cursor)
+    if position:
+        scanned_at, pk = position
+        queryset = queryset.filter(Q(scanned_at__lt=scanned_at) | Q(scanned_at=scanned_at, pk__lt=pk))
+    # Fetch one extra row to learn whether another page exists
+    items = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(items[page_size - 1]) if len(items) > page_size else None
+    return KeysetPage(items[:page_size], next_cursor)
+
+
+def page_response(request, page, template, context=None):
+    """
+    JSON for infinite scroll: the rendered rows (same partial as the full page),
+    the cursor for the next request and a plain summary of each scan.
+    """
+    context = dict(context or {}, scans=page.items)
+    return JsonResponse({
+        'html': render_to_string(template, context, request=request),
+        'next_cursor': page.next_cursor,
+        'results': [
+            {
+                'id': scan.pk,
+                'scanned_at': scan.scanned_at.isoformat(),
+                'food': scan.food_item.name if scan.food_item_id else None,
+                'confidence': float(scan.confidence) if scan.confidence is not None else None,
+                'allergen_detected': scan.allergen_detected,
+                'image': scan.image.url if scan.image else None,
+            }
+            for scan in page.items
+        ],
+    })
@@ -0,0 +1,156 @@
+# allergy_app/recommender.py
+#
+# Safe alternatives for a scanned food: the catalogue foods most similar to it
+# that share no allergen with the user's profile.
+#
+# Every food is one row of a float32 embedding matrix:
+# * the words of its name, ingredients and allergens, TF-IDF weighted and
+#   hashed into RECOMMENDER_DIM buckets (dishes sharing allergens tend to be
+#   the same kind of dish);
+# * if ml_model/export_embeddings.py has been run, followed by the classifier's
+#   embedding of the Food-101 class the food is mapped to.
+# Rows are L2-normalized, so one matrix-vector product gives the cosine
+# similarity of the scanned food to every food, and the allergen masks (split
+# into 64-bit words) drop unsafe foods in the same vectorized pass.
+#
+# The matrix is rebuilt (one query) whenever the allergen index reports a
+# catalogue change; results are cached per (food, allergen mask) until then.
+import math
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .allergen_index import allergen_index
+from .ml_model.export_embeddings import load_class_embeddings
+from .models import FoodItem
+
+STOPWORDS = {'and', 'with', 'the', 'for', 'see', 'allergens', 'contains', 'may', 'from'}
+NAME_WEIGHT = 2.0
+
+
+def _tokens(text):
+    return [t for t in re.findall(r'[a-z]+', text.lower()) if len(t) > 2 and t not in STOPWORDS]
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _mask_words(mask, words):
+    """A Python int bitmask as `words` uint64 words, lowest bits first."""
+    return np.array([(mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(words)], dtype=np.uint64)
+
+
+def text_embeddings(texts, dim):
+    """
+    (len(texts), dim) float32 TF-IDF matrix of hashed words; each text is a
+    (name, details) pair and name words count NAME_WEIGHT times.
+    """
+    counts = []
+    for name, details in texts:
+        c = Counter()
+        for t in _tokens(name):
+            c[t] += NAME_WEIGHT
+        for t in _tokens(details):
+            c[t] += 1
+        counts.append(c)
+    df = Counter(t for c in counts for t in c)
+    n = len(counts)
+    idf = {t: math.log((1 + n) / (1 + d)) + 1 for t, d in df.items()}
+    bucket = {t: zlib.crc32(t.encode()) % dim for t in df}
+
+    rows, cols, vals = [], [], []
+    for i, c in enumerate(counts):
+        for t, tf in c.items():
+            rows.append(i)
+            cols.append(bucket[t])
+            vals.append((1 + math.log(tf)) * idf[t])
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    np.add.at(matrix, (rows, cols), vals)
+    return _normalize(matrix)
+
+
+class Recommender:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._class_embeddings = None
+        self._cache = OrderedDict()
+        self._state = None  # (version, food ids, row by food id, names, embeddings, mask words)
+
+    def _ensure_built(self):
+        version = allergen_index.version()
+        with self._lock:
+            if version == self._version:
+                return self._state
+        version, names, masks, classes = allergen_index.foods_view()
+        ingredients = dict(FoodItem.objects.values_list('pk', 'ingredients'))
+        state = (version,) + self._build(names, masks, classes, ingredients)
+        with self._lock:
+            self._state, self._version = state, version
+            self._cache.clear()
+        return state
+
+    def _build(self, names, masks, classes, ingredients):
+        food_ids = list(names)
+        dim = getattr(settings, 'RECOMMENDER_DIM', 256)
+        texts = [(names[f], ' '.join([ingredients.get(f, '')] + allergen_index.names(masks[f])))
+                 for f in food_ids]
+        matrix = text_embeddings(texts, dim)
+
+        if self._class_embeddings is None:
+            self._class_embeddings = load_class_embeddings()
+            if self._class_embeddings is None:
+                self._class_embeddings = False
+        if self._class_embeddings is not False and food_ids:
+            class_of = {food_id: idx for idx, food_id in classes.items()}
+            visual = np.zeros((len(food_ids), self._class_embeddings.shape[1]), dtype=np.float32)
+            for row, food_id in enumerate(food_ids):
+                idx = class_of.get(food_id)
+                if idx is not None and idx < len(self._class_embeddings):
+                    visual[row] = self._class_embeddings[idx]
+            matrix = _normalize(np.hstack([matrix, visual]))
+
+        words = max(1, (max((m.bit_length() for m in masks.values()), default=0) + 63) // 64)
+        mask_words = np.array([_mask_words(masks[f], words) for f in food_ids],
+                              dtype=np.uint64).reshape(len(food_ids), words)
+        rows = {food_id: row for row, food_id in enumerate(food_ids)}
+        return food_ids, rows, [names[f] for f in food_ids], matrix, mask_words
+
+    def alternatives(self, food_id, user_mask, limit=3):
+        """Names of up to `limit` foods closest to `food_id` sharing no allergen with `user_mask`."""
+        version, food_ids, rows, names, matrix, mask_words = self._ensure_built()
+        key = (version, food_id, user_mask, limit)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return list(self._cache[key])
+
+        safe = ~(mask_words & _mask_words(user_mask, mask_words.shape[1])).any(axis=1)
+        row = rows.get(food_id)
+        if row is not None:
+            safe[row] = False
+            scores = matrix @ matrix[row]
+        else:
+            scores = np.zeros(len(food_ids), dtype=np.float32)
+        candidates = np.flatnonzero(safe)
+        if len(candidates) > limit > 0:
+            # Keep everything tied with the limit-th best so ties break by name
+            kth = np.partition(-scores[candidates], limit - 1)[limit - 1]
+            candidates = candidates[-scores[candidates] <= kth]
+        ranked = sorted(candidates, key=lambda i: (-scores[i], names[i]))
+        result = [names[i] for i in ranked[:limit]]
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > getattr(settings, 'RECOMMENDER_CACHE_SIZE', 4096):
+                self._cache.popitem(last=False)
+        return list(result)
+
+
+recommender = Recommender()
@@ -0,0 +1,100 @@
+# allergy_app/seed_data.py
+#
+# The starter catalogue: common allergens, the Food-101 foods the classifier
+# recognizes and an approximate allergen list for each. seed_catalogue() loads
+# it (idempotent) and maps the classifier's classes to the foods; run it from
+# `python manage.py shell < shell.txt` on a fresh database. The benchmark
+# (benchmark.py) seeds its test database the same way.
+from . import food_classes
+from .models import Allergen, FoodItem
+
+ALLERGENS = [
+    'Peanuts', 'Tree Nuts', 'Milk', 'Eggs', 'Wheat', 'Soy', 'Fish', 'Shellfish', 'Sesame',
+]
+
+FOODS = [
+    'Apple pie', 'Baby back ribs', 'Baklava', 'Beef carpaccio', 'Beef tartare', 'Beet salad',
+    'Beignets', 'Bibimbap', 'Bread pudding', 'Breakfast burrito', 'Bruschetta', 'Caesar salad',
+    'Cannoli', 'Caprese salad', 'Carrot cake', 'Ceviche', 'Cheesecake', 'Cheese plate',
+    'Chicken curry', 'Chicken quesadilla', 'Chicken wings', 'Chocolate cake', 'Chocolate mousse',
+    'Churros', 'Clam chowder', 'Club sandwich', 'Crab cakes', 'Creme brulee', 'Croque madame',
+    'Cup cakes', 'Deviled eggs', 'Donuts', 'Dumplings', 'Edamame', 'Eggs benedict', 'Escargots',
+    'Falafel', 'Filet mignon', 'Fish and chips', 'Foie gras', 'French fries', 'French onion soup',
+    'French toast', 'Fried calamari', 'Fried rice', 'Frozen yogurt', 'Garlic bread', 'Gnocchi',
+    'Greek salad', 'Grilled cheese sandwich', 'Grilled salmon', 'Guacamole', 'Gyoza', 'Hamburger',
+    'Hot and sour soup', 'Hot dog', 'Huevos rancheros', 'Hummus', 'Ice cream', 'Lasagna',
+    'Lobster bisque', 'Lobster roll sandwich', 'Macaroni and cheese', 'Macarons', 'Miso soup',
+    'Mussels', 'Nachos', 'Omelette', 'Onion rings', 'Oysters', 'Pad thai', 'Paella', 'Pancakes',
+    'Panna cotta', 'Peking duck', 'Pho', 'Pizza', 'Pork chop', 'Poutine', 'Prime rib',
+    'Pulled pork sandwich', 'Ramen', 'Ravioli', 'Red velvet cake', 'Risotto', 'Samosa', 'Sashimi',
+    'Scallops', 'Seaweed salad', 'Shrimp and grits', 'Spaghetti bolognese', 'Spaghetti carbonara',
+    'Spring rolls', 'Steak', 'Strawberry shortcake', 'Sushi', 'Tacos', 'Takoyaki', 'Tiramisu',
+    'Tuna tartare', 'Waffles',
+]
+
+# Approximate allergens per food; foods not listed have none
+FOOD_ALLERGENS = {
+    'Apple pie': ['Wheat', 'Milk', 'Eggs'],
+    'Baklava': ['Tree Nuts', 'Wheat', 'Milk'],
+    'Beef tartare': ['Eggs'],
+    'Beignets': ['Wheat', 'Milk', 'Eggs'],
+    'Bibimbap': ['Soy', 'Sesame'],
+    'Bread pudding': ['Wheat', 'Milk', 'Eggs'],
+    'Bruschetta': ['Wheat'],
+    'Caesar salad': ['Fish', 'Eggs', 'Milk'],
+    'Cannoli': ['Wheat', 'Milk', 'Eggs'],
+    'Carrot cake': ['Wheat', 'Milk', 'Eggs', 'Tree Nuts'],
+    'Cheesecake': ['Wheat', 'Milk', 'Eggs'],
+    'Chicken quesadilla': ['Wheat', 'Milk'],
+    'Chocolate cake': ['Wheat', 'Milk', 'Eggs'],
+    'Chocolate mousse': ['Milk', 'Eggs'],
+    'Clam chowder': ['Milk', 'Shellfish'],
+    'Crab cakes': ['Shellfish', 'Eggs', 'Wheat'],
+    'Creme brulee': ['Milk', 'Eggs'],
+    'Cup cakes': ['Wheat', 'Milk', 'Eggs'],
+    'Donuts': ['Wheat', 'Milk', 'Eggs'],
+    'Edamame': ['Soy'],
+    'Eggs benedict': ['Eggs', 'Wheat', 'Milk'],
+    'Falafel': ['Sesame', 'Wheat'],
+    'Fish and chips': ['Fish', 'Wheat'],
+    'French toast': ['Wheat', 'Milk', 'Eggs'],
+    'Frozen yogurt': ['Milk'],
+    'Gnocchi': ['Wheat', 'Eggs'],
+    'Grilled cheese sandwich': ['Wheat', 'Milk'],
+    'Hamburger': ['Wheat'],
+    'Hot dog': ['Wheat'],
+    'Ice cream': ['Milk', 'Eggs'],
+    'Lasagna': ['Wheat', 'Milk'],
+    'Lobster bisque': ['Shellfish', 'Milk'],
+    'Macaroni and cheese': ['Wheat', 'Milk'],
+    'Macarons': ['Tree Nuts', 'Eggs'],
+    'Miso soup': ['Soy'],
+    'Omelette': ['Eggs'],
+    'Pad thai': ['Peanuts', 'Eggs'],
+    'Pancakes': ['Wheat', 'Milk', 'Eggs'],
+    'Peking duck': ['Soy', 'Wheat'],
+    'Pizza': ['Wheat', 'Milk'],
+    'Ramen': ['Wheat', 'Soy', 'Eggs'],
+    'Ravioli': ['Wheat', 'Milk', 'Eggs'],
+    'Red velvet cake': ['Wheat', 'Milk', 'Eggs'],
+    'Samosa': ['Wheat'],
+    'Sashimi': ['Fish'],
+    'Shrimp and grits': ['Shellfish', 'Milk'],
+    'Spaghetti bolognese': ['Wheat', 'Milk'],
+    'Spaghetti carbonara': ['Wheat', 'Milk', 'Eggs'],
+    'Spring rolls': ['Wheat'],
+    'Sushi': ['Fish', 'Soy', 'Sesame'],
+    'Tacos': ['Wheat'],
+    'Takoyaki': ['Wheat', 'Eggs'],
+    'Tiramisu': ['Wheat', 'Milk', 'Eggs'],
+    'Waffles': ['Wheat', 'Milk', 'Eggs'],
+}
+
+
+def seed_catalogue():
+    """Create missing allergens and foods, link their allergens and map the classes; returns the sync report."""
+    allergens = {name: Allergen.objects.get_or_create(name=name)[0] for name in ALLERGENS}
+    for name in FOODS:
+        food, _ = FoodItem.objects.get_or_create(name=name, defaults={'ingredients': 'See allergens'})
+        food.allergens.add(*(allergens[a] for a in FOOD_ALLERGENS.get(name, [])))
+    return food_classes.sync()
@@ -0,0 +1,270 @@
+from asgiref.sync import sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import metrics
+from .allergen_index import allergen_index
+from .constants import CANDIDATE_MIN_PROBABILITY, CONFIDENCE_THRESHOLD, SCAN_CANDIDATES
+from .inference_pool import inference_pool
+from .models import ScanHistory, ScanJob
+from .recommender import recommender
+from .signals import scans_bulk_saved
+from .ml_model.load_model import classify_batch, display_name, predict_top_k
+
+
+def _predict(scan, ingested=None):
+    if ingested is not None:
+        return predict_top_k(pixels=ingested.pixels, data=ingested.data)
+    return predict_top_k(scan.image.path)
+
+
+def shortlist(top):
+    """The candidate classes of a top-k prediction, as (class_idx, probability) pairs."""
+    return [(int(c), float(p)) for i, (c, p) in enumerate(top[:SCAN_CANDIDATES])
+            if i == 0 or p >= CANDIDATE_MIN_PROBABILITY]
+
+
+def resolve_candidates(top, user_mask):
+    """
+    The catalogue food and triggering allergens of each candidate class, plus
+    the union of their triggering bitmasks: one allergen check covering every
+    food the photo might be. Classes missing from the catalogue are listed
+    with food_id None.
+    """
+    candidates, union, seen = [], 0, set()
+    for class_idx, probability in top:
+        match = allergen_index.food_for_class(class_idx)
+        food_id, name = match if match else (None, display_name(class_idx))
+        if food_id is not None and food_id in seen:  # two classes for one food
+            continue
+        seen.add(food_id)
+        triggering = allergen_index.food_mask(food_id) & user_mask if food_id is not None and user_mask else 0
+        union |= triggering
+        candidates.append({
+            'class_idx': class_idx,
+            'food_id': food_id,
+            'food_name': name,
+            'confidence': round(probability * 100, 2),
+            'allergen_detected': bool(triggering),
+            'allergens': allergen_index.names(triggering),
+        })
+    return candidates, union
+
+
+def unknown_allergens(candidates, user_mask):
+    """
+    True if a clean union check can't be trusted: the user has no allergy
+    profile, or some candidate isn't in the catalogue so its allergens are unknown.
+    """
+    return user_mask is None or any(c['food_id'] is None for c in candidates)
+
+
+def analyze_scan(scan, user, ingested=None):
+    """
+    Classify a saved scan, persist the outcome on it and return the result-page
+    context as plain, JSON-serializable values (allergen / alternative names).
+    Shared by the synchronous scan view and the background scan workers.
+    `ingested` is the upload already decoded by ingest.py; without it the
+    stored image is read back from disk.
+    """
+    return record_prediction(scan, user, _predict(scan, ingested))
+
+
+async def aanalyze_scan(scan, user, ingested=None):
+    """
+    analyze_scan() for async views: inference runs on the bounded inference
+    pool and the database work is awaited, so the event loop never blocks.
+    Call inside inference_pool.admit().
+    """
+    top = await inference_pool.run(_predict, scan, ingested)
+    return await sync_to_async(record_prediction)(scan, user, top)
+
+
+def record_prediction(scan, user, top, picked=False):
+    """
+    Resolve a top-k prediction to a food, check the user's allergens and save
+    the scan. Below CONFIDENCE_THRESHOLD no food is recorded; the allergens of
+    all candidates are checked instead and the user is asked to pick one.
+    `picked` marks a class the user chose (see choose_candidate()).
+    """
+    top = shortlist(top)
+    class_idx, confidence_raw = top[0] if top else (None, 0.0)
+    predicted_name = display_name(class_idx) if class_idx is not None else "Unknown"
+    confidence_pct = round(float(confidence_raw) * 100, 2)
+    scan.confidence = confidence_pct
+    if not picked:
+        scan.candidates = [[c, round(p, 4)] for c, p in top]
+    print(f"Predicted: {predicted_name} ({confidence_pct}%)")
+    metrics.annotate(predicted=predicted_name, confidence=confidence_pct)
+
+    result = {
+        'food_name': predicted_name,
+        'confidence': confidence_pct,
+        'allergen_detected': False,
+        'allergens': [],
+        'matched_allergens': [],
+        'low_confidence': False,
+        'unknown': False,
+        'alternatives': [],
+        'candidates': [],
+    }
+
+    with metrics.span('allergen_match'):
+        user_mask = allergen_index.user_mask(user.pk)
+        candidates, union = resolve_candidates(top, user_mask) if not picked else ([], 0)
+
+    # Threshold check: not sure which food it is, so check every candidate at once
+    if confidence_raw < CONFIDENCE_THRESHOLD and not picked:
+        scan.allergen_detected = bool(union)
+        with metrics.span('db_save'):
+            scan.save()
+        metrics.inc('safebite_scans_total', outcome='low_confidence')
+        names = allergen_index.names(union)
+        result.update({
+            'low_confidence': True,
+            'threshold': int(CONFIDENCE_THRESHOLD * 100),
+            'allergen_detected': bool(union),
+            'unknown': unknown_allergens(candidates, user_mask),
+            'allergens': names,
+            'matched_allergens': names,
+            'candidates': candidates,
+        })
+        return result
+
+    # Resolve the class to a catalogue food through the in-memory class map
+    with metrics.span('food_lookup'):
+        match = allergen_index.food_for_class(class_idx)
+    if match is None:
+        print(f"Food item '{predicted_name}' not found in DB.")
+        # Food not in DB — don't fail, show low help
+        with metrics.span('db_save'):
+            scan.save()
+        metrics.inc('safebite_scans_total', outcome='unsupported')
+        result['message'] = f"'{predicted_name}' is not supported yet."
+        result['candidates'] = candidates
+        return result
+    food_id, food_name = match
+    print(f"Matched DB item: {food_name}")
+    result['food_name'] = food_name
+
+    # Update scan
+    scan.food_item_id = food_id
+    scan.allergen_detected = False
+
+    # Allergy check on bitmasks from the in-memory allergen index
+    with metrics.span('allergen_match'):
+        if user_mask is None:  # profile not set
+            matched = []
+            detected = False
+        else:
+            triggering = allergen_index.food_mask(food_id) & user_mask
+            detected = bool(triggering)
+            matched = allergen_index.names(triggering)
+
+    # Alternatives: the 3 foods most similar to this one that are free of
+    # every allergen in the user's profile
+    alternatives = []
+    if detected:
+        with metrics.span('alternatives'):
+            alternatives = recommender.alternatives(food_id, user_mask, 3)
+
+    # Save result
+    scan.allergen_detected = detected
+    with metrics.span('db_save'):
+        scan.save()
+    if picked:
+        metrics.inc('safebite_scan_picks_total')
+    else:
+        metrics.inc('safebite_scans_total', outcome='alert' if detected else 'safe')
+
+    result.update({
+        'allergen_detected': detected,
+        'allergens': matched,
+        'matched_allergens': matched,
+        'alternatives': alternatives,
+        'candidates': candidates,
+    })
+    return result
+
+
+def choose_candidate(scan, user, class_idx):
+    """
+    Record the candidate food the user picked for a scan, without running the
+    model again, and return the result-page context for it. Raises ValueError
+    if `class_idx` was not one of the scan's candidates.
+    """
+    probabilities = dict((c, p) for c, p in scan.candidates or [])
+    if class_idx not in probabilities:
+        raise ValueError(f"Class {class_idx} is not a candidate for scan {scan.pk}.")
+    result = record_prediction(scan, user, [(class_idx, probabilities[class_idx])], picked=True)
+    # The queued-scan result page reads the job's stored result
+    ScanJob.objects.filter(scan_id=scan.pk).update(result=result)
+    return result
+
+
+def analyze_batch(user, uploads):
+    """
+    Classify many uploaded images in one go and store a ScanHistory row for
+    each. `uploads` is a list of IngestedImage (see ingest.py); returns one
+    result dict per upload, in order. If storing fails, the images already
+    written are deleted again.
+    """
+    predictions = classify_batch([u.data for u in uploads], pixels=[u.pixels for u in uploads])
+    with metrics.span('allergen_match'):
+        user_mask = allergen_index.user_mask(user.pk)
+
+    scans, results, saved = [], [], []
+    try:
+        for upload, (class_idx, confidence_raw, top) in zip(uploads, predictions):
+            top = shortlist(top)
+            confidence_pct = round(float(confidence_raw) * 100, 2)
+            low_confidence = confidence_raw < CONFIDENCE_THRESHOLD
+            name = display_name(class_idx)
+            # Class index -> food through the in-memory class map; no name query
+            candidates, union = resolve_candidates(top, user_mask)
+            food_id = None
+            if low_confidence:
+                triggering = union  # unsure which food: any candidate's allergens count
+            else:
+                food_id = candidates[0]['food_id']
+                name = candidates[0]['food_name']
+                triggering = allergen_index.food_mask(food_id) & user_mask if food_id is not None and user_mask else 0
+
+            scan = ScanHistory(
+                user=user,
+                food_item_id=food_id,
+                confidence=confidence_pct,
+                allergen_detected=bool(triggering),
+                candidates=[[c, round(p, 4)] for c, p in top],
+            )
+            with metrics.span('upload_save'):
+                scan.image.save(upload.name, ContentFile(upload.data), save=False)
+            saved.append(scan.image.name)
+            scans.append(scan)
+            results.append({
+                'filename': upload.name,
+                'food_name': name,
+                'confidence': confidence_pct,
+                'low_confidence': low_confidence,
+                'unknown': low_confidence and unknown_allergens(candidates, user_mask),
+                'supported': food_id is not None,
+                'allergen_detected': bool(triggering),
+                'allergens': allergen_index.names(triggering),
+                'candidates': candidates,
+            })
+
+        with metrics.span('db_save'), transaction.atomic():
+            ScanHistory.objects.bulk_create(scans)
+            scans_bulk_saved.send(sender=ScanHistory, scans=scans, created=True)
+    except Exception:
+        for path in saved:  # no row points at them
+            default_storage.delete(path)
+        raise
+    for result in results:
+        outcome = ('low_confidence' if result['low_confidence'] else 'unsupported' if not result['supported']
+                   else 'alert' if result['allergen_detected'] else 'safe')
+        metrics.inc('safebite_scans_total', outcome=outcome)
+    for scan, result in zip(scans, results):
+        result['scan_id'] = scan.pk
+    return results
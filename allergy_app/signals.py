@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+from .allergen_index import allergen_index
+from .models import Allergen, AllergyProfile, FoodClass, FoodItem, ScanHistory
+from .thumbnails import delete_thumbnails, schedule_thumbnails
+
+M2M_CHANGES = ('post_add', 'post_remove', 'post_clear')
+
+# Sent by code that writes scans with bulk_create / bulk_update, which skip the
+# model signals. Arguments: scans (saved instances), created (bool).
+scans_bulk_saved = Signal()
+# Sent after a bulk catalogue import (catalogue.py) commits. Arguments: report.
+catalogue_imported = Signal()
+
+# Index updates are deferred until the surrounding transaction commits so a
+# rolled-back edit never leaks into the in-memory index. Catalogue changes
+# rebuild it from the committed rows (see AllergenIndex.rebuild).
+
+
+@receiver(post_save, sender=Allergen)
+@receiver(post_delete, sender=Allergen)
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_save, sender=FoodClass)
+@receiver(post_delete, sender=FoodClass)
+def catalogue_changed(sender, instance, **kwargs):
+    transaction.on_commit(allergen_index.rebuild)
+
+
+@receiver(m2m_changed, sender=FoodItem.allergens.through)
+def food_allergens_changed(sender, instance, action, **kwargs):
+    if action in M2M_CHANGES:
+        transaction.on_commit(allergen_index.rebuild)
+
+
+@receiver(m2m_changed, sender=AllergyProfile.allergens.through)
+def profile_allergens_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in M2M_CHANGES:
+        return
+    if not reverse:
+        user_ids = [instance.user_id]
+    elif pk_set is not None:
+        user_ids = list(
+            AllergyProfile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+        )
+    else:
+        transaction.on_commit(allergen_index.rebuild)
+        return
+    transaction.on_commit(lambda: allergen_index.forget_users(user_ids))
+
+
+@receiver(post_save, sender=AllergyProfile)
+@receiver(post_delete, sender=AllergyProfile)
+def profile_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: allergen_index.forget_users([user_id]))
+
+
+@receiver(post_init, sender=ScanHistory)
+def scan_loaded(sender, instance, **kwargs):
+    # The stored image name, to spot a replaced image on save (None if deferred)
+    image = instance.__dict__.get('image')
+    instance._stored_image_name = getattr(image, 'name', image) if instance.pk else None
+
+
+@receiver(post_save, sender=ScanHistory)
+def scan_saved(sender, instance, created, **kwargs):
+    image_name = instance.image.name
+    previous, instance._stored_image_name = instance._stored_image_name, image_name
+    if not created and (previous is None or previous == image_name):
+        return
+    if previous:
+        transaction.on_commit(lambda: delete_thumbnails(previous))
+    if image_name:
+        transaction.on_commit(lambda: schedule_thumbnails(image_name))
+
+
+@receiver(scans_bulk_saved)
+def scans_bulk_created(sender, scans, created, **kwargs):
+    if not created:
+        return
+    for scan in scans:
+        scan._stored_image_name = scan.image.name
+        if scan.image.name:
+            transaction.on_commit(lambda name=scan.image.name: schedule_thumbnails(name))
+
+
+@receiver(post_delete, sender=ScanHistory)
+def scan_deleted(sender, instance, **kwargs):
+    image_name = instance.image.name
+    if image_name:
+        transaction.on_commit(lambda: delete_thumbnails(image_name))
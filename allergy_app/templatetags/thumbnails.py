@@ -0,0 +1,11 @@
+from django import template
+
+from allergy_app.thumbnails import get_thumbnail_url
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(image, size=128):
+    """{{ scan.image|thumbnail:128 }} -> URL of a cached small rendition."""
+    return get_thumbnail_url(image, int(size))
@@ -1,3 +1,796 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from datetime import timedelta
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import allergen_cache, benchmark, catalogue, food_classes, jobs, metrics, thumbnails
+from .allergen_index import AllergenIndex, allergen_index
+from .inference_pool import inference_pool
+from .ml_model import inference_service, load_model
+from .ml_model.batching import BatchingEngine, QueueFull
+from .ml_model.prediction_cache import file_fingerprint
+from .ml_model.preprocess import normalize
+from .models import Allergen, AllergyProfile, FoodClass, FoodItem, ScanHistory, ScanJob
+from .recommender import Recommender
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg_upload(name='meal.jpg', color=(200, 120, 40)):
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buf, 'JPEG')
+    return SimpleUploadedFile(name, buf.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ScanHotPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.milk = Allergen.objects.create(name='Milk')
+        cls.wheat = Allergen.objects.create(name='Wheat')
+        cls.peanuts = Allergen.objects.create(name='Peanuts')
+        cls.pie = FoodItem.objects.create(name='Apple pie', ingredients='See allergens')
+        cls.pie.allergens.add(cls.milk, cls.wheat)
+        FoodClass.objects.update_or_create(index=0, defaults={'label': 'apple_pie', 'food_item': cls.pie})
+        FoodItem.objects.create(name='Edamame', ingredients='See allergens')
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.profile = AllergyProfile.objects.create(user=cls.user)
+        cls.profile.allergens.add(cls.milk)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        caches['allergens'].clear()
+        self.client.force_login(self.user)
+
+    def scan(self, prediction=(0, 0.9), *runners_up):  # class 0: apple_pie
+        with mock.patch('allergy_app.services.predict_top_k', return_value=[prediction, *runners_up]):
+            return self.client.post(reverse('scan'), {'image': jpeg_upload()})
+
+    def test_scan_query_count_is_constant(self):
+        self.scan()  # warm the allergen caches
+
+        # session, user, INSERT scan, UPDATE scan
+        with self.assertNumQueries(4):
+            response = self.scan()
+        self.assertEqual(response.context['allergens'], ['Milk'])
+
+        # A bigger catalogue must not add queries to the scan path
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(30):
+                FoodItem.objects.create(name=f'Food {i}', ingredients='-').allergens.add(self.wheat)
+        self.scan()
+        with self.assertNumQueries(4):
+            self.scan()
+
+    def test_profile_change_invalidates_cached_allergens(self):
+        self.assertTrue(self.scan().context['allergen_detected'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.allergens.remove(self.milk)
+        self.assertFalse(self.scan().context['allergen_detected'])
+
+    def test_food_change_invalidates_cached_allergens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.allergens.set([self.peanuts])
+        self.assertFalse(self.scan().context['allergen_detected'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pie.allergens.add(self.peanuts)
+        response = self.scan()
+        self.assertTrue(response.context['allergen_detected'])
+        self.assertEqual(response.context['allergens'], ['Peanuts'])
+        self.assertEqual(response.context['alternatives'], ['Edamame'])
+
+    def test_class_resolves_to_differently_named_food(self):
+        cupcakes = FoodItem.objects.create(name='Cupcakes', ingredients='See allergens')
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodClass.objects.update_or_create(index=29, defaults={'label': 'cup_cakes', 'food_item': cupcakes})
+        response = self.scan(prediction=(29, 0.8))
+        self.assertEqual(response.context['food_name'], 'Cupcakes')
+        self.assertEqual(response.context['scan'].food_item, cupcakes)
+
+    def test_low_confidence_checks_allergens_of_every_candidate(self):
+        edamame = FoodItem.objects.get(name='Edamame')
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodClass.objects.update_or_create(index=33, defaults={'label': 'edamame', 'food_item': edamame})
+        # Edamame is the likeliest, but it might be apple pie (Milk)
+        response = self.scan((33, 0.35), (0, 0.3), (29, 0.01))
+        context = response.context
+        self.assertTrue(context['low_confidence'])
+        self.assertTrue(context['allergen_detected'])
+        self.assertEqual(context['allergens'], ['Milk'])
+        self.assertEqual([c['food_name'] for c in context['candidates']], ['Edamame', 'Apple pie'])
+        scan = context['scan']
+        self.assertIsNone(scan.food_item)
+        self.assertTrue(scan.allergen_detected)
+
+        # Picking a candidate records it without another prediction
+        with mock.patch('allergy_app.services.predict_top_k') as predict:
+            response = self.client.post(reverse('scan_pick', args=[scan.pk]), {'class_idx': 33})
+        predict.assert_not_called()
+        self.assertFalse(response.context['allergen_detected'])
+        scan.refresh_from_db()
+        self.assertEqual(scan.food_item, edamame)
+        self.assertFalse(scan.allergen_detected)
+
+        # Only candidates can be picked
+        response = self.client.post(reverse('scan_pick', args=[scan.pk]), {'class_idx': 29})
+        self.assertRedirects(response, reverse('scan_result', args=[scan.pk]))
+
+    def test_low_confidence_with_unchecked_candidate_is_not_reported_safe(self):
+        edamame = FoodItem.objects.get(name='Edamame')
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodClass.objects.update_or_create(index=33, defaults={'label': 'edamame', 'food_item': edamame})
+        # Donuts (class 31) aren't in the catalogue, so their allergens are unknown
+        response = self.scan((33, 0.35), (31, 0.3))
+        context = response.context
+        self.assertTrue(context['low_confidence'])
+        self.assertFalse(context['allergen_detected'])
+        self.assertIsNone(context['candidates'][1]['food_id'])
+        self.assertTrue(context['unknown'])
+        self.assertContains(response, "couldn't check all of them")
+        self.assertNotContains(response, 'None of them contain your allergens')
+
+        # Without an allergy profile nothing was checked at all
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.delete()
+        response = self.scan((33, 0.35), (0, 0.3))
+        self.assertTrue(response.context['unknown'])
+        self.assertNotContains(response, 'None of them contain your allergens')
+
+
+class AllergenIndexTests(TestCase):
+    """Two AllergenIndex instances stand in for two workers sharing the cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.milk = Allergen.objects.create(name='Milk')
+        cls.wheat = Allergen.objects.create(name='Wheat')
+        cls.pie = FoodItem.objects.create(name='Apple pie', ingredients='See allergens')
+        cls.pie.allergens.add(cls.milk)
+        cls.bread = FoodItem.objects.create(name='Bread', ingredients='See allergens')
+
+    def setUp(self):
+        caches['allergens'].clear()
+        self.first, self.second = AllergenIndex(), AllergenIndex()
+        self.first.version(), self.second.version()
+
+    def allergens(self, index, food):
+        return index.names(index.food_mask(food.pk))
+
+    def test_published_catalogue_includes_changes_made_by_other_workers(self):
+        # Each worker commits a change; the last to publish must not undo the other
+        FoodItem.allergens.through.objects.create(fooditem=self.bread, allergen=self.wheat)
+        self.second.rebuild()
+        FoodItem.allergens.through.objects.create(fooditem=self.pie, allergen=self.wheat)
+        self.first.rebuild()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.allergens(self.second, self.pie), ['Milk', 'Wheat'])
+            self.assertEqual(self.allergens(self.second, self.bread), ['Wheat'])
+
+    def test_catalogue_changes_reach_other_workers_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.bread.allergens.add(self.milk)
+        self.assertEqual(self.allergens(self.second, self.bread), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.allergens(self.second, self.bread), ['Milk'])
+
+    @override_settings(WEB_CONCURRENCY=4)
+    def test_several_workers_need_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            allergen_cache.require_shared_cache()
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                  'LOCATION': tempfile.mkdtemp()}
+        self.addCleanup(shutil.rmtree, shared['LOCATION'], True)
+        with override_settings(CACHES={**caches.settings, 'allergens': shared}):
+            allergen_cache.require_shared_cache()
+
+
+class FoodClassSyncTests(TestCase):
+    def test_relabelled_class_is_unlinked_and_matched_again(self):
+        pie = FoodItem.objects.create(name='Apple pie', ingredients='See allergens')
+        donuts = FoodItem.objects.create(name='Donuts', ingredients='See allergens')
+        food_classes.sync()
+        FoodClass.objects.filter(index=1).update(food_item=pie)  # linked by hand in the admin
+
+        # A retrained model with other classes at indices 0 and 1
+        labels = ['donuts', 'baklava', *food_classes.food_classes[2:]]
+        with mock.patch.object(food_classes, 'food_classes', labels):
+            report = food_classes.sync()
+        self.assertEqual(report.unlinked, [(0, 'donuts', 'Apple pie'), (1, 'baklava', 'Apple pie')])
+        self.assertEqual(report.linked, [(0, 'donuts', 'Donuts')])
+        self.assertIn((1, 'baklava'), report.unmapped)
+        self.assertEqual(FoodClass.objects.get(index=0).food_item, donuts)
+        self.assertIsNone(FoodClass.objects.get(index=1).food_item)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BenchmarkTestCase(TestCase):
+    """
+    Small-scale run of the scan-flow benchmark (see benchmark.py): seeded
+    catalogue, users and scans, stub classifier, one client. Query counts per
+    request must not exceed the stored baseline of `manage.py benchmark_scans`.
+    """
+    views = ()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = benchmark.seed(users=5, scans_per_user=5)
+        cls.users = list(User.objects.filter(is_staff=False).order_by('pk')[:1])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        caches['allergens'].clear()
+        saved = (load_model._backend, load_model._engine, load_model._prediction_cache)
+        self.addCleanup(lambda: setattr(load_model, '_backend', saved[0]))
+        self.addCleanup(lambda: setattr(load_model, '_engine', saved[1]))
+        self.addCleanup(lambda: setattr(load_model, '_prediction_cache', saved[2]))
+        benchmark.install_stub(cost_ms=0)
+
+    def run_benchmark(self):
+        results = benchmark.run(self.users, self.staff, clients=1, requests=4, only=self.views, warmup=1)
+        self.assertEqual([r.view for r in results], list(self.views))
+        for r in results:
+            self.assertEqual(r.errors, 0, r.view)
+        return results
+
+
+class ScanFlowBenchmarkTests(BenchmarkTestCase):
+    views = ('scan_food', 'home')
+
+    def test_query_counts_within_baseline(self):
+        before = ScanHistory.objects.count()
+        results = self.run_benchmark()
+        self.assertEqual(ScanHistory.objects.count(), before + 5)  # one warm-up scan
+        self.assertEqual(benchmark.query_regressions(results, benchmark.load_baseline()), [])
+
+
+class BatchingEngineTests(SimpleTestCase):
+    def test_concurrent_requests_share_a_forward_pass(self):
+        sizes = []
+        engine = BatchingEngine(lambda batch: sizes.append(len(batch)) or batch * 2,
+                                max_batch_size=4, max_wait_ms=200)
+        results = [None] * 4
+        def call(i):
+            results[i] = engine.predict(np.full(3, i, dtype=np.float32))
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sizes, [4])
+        for i, row in enumerate(results):
+            np.testing.assert_array_equal(row, np.full(3, 2 * i))
+
+    def test_timed_out_requests_are_not_run(self):
+        release = threading.Event()
+        seen = []
+        def predict(batch):
+            release.wait(5)
+            seen.extend(batch[:, 0].tolist())
+            return batch
+        engine = BatchingEngine(predict, max_batch_size=1, max_wait_ms=0, timeout_s=0.05)
+        blocker = threading.Thread(target=lambda: self.assertRaises(
+            TimeoutError, engine.predict, np.array([1.0])))
+        blocker.start()  # occupies the worker
+        with self.assertRaises(TimeoutError):
+            engine.predict(np.array([2.0]))  # still queued when it times out
+        blocker.join()
+        release.set()
+        engine.timeout_s = 5
+        self.assertEqual(engine.predict(np.array([3.0]))[0], 3.0)
+        self.assertEqual(seen, [1.0, 3.0])
+        self.assertEqual(engine.metrics.snapshot()['cancelled'], 1)
+
+    def test_full_queue_rejects_new_requests(self):
+        running, release = threading.Event(), threading.Event()
+        def predict(batch):
+            running.set()
+            release.wait(5)
+            return batch
+        engine = BatchingEngine(predict, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+        threads = [threading.Thread(target=engine.predict, args=(np.zeros(1),)) for _ in range(3)]
+        threads[0].start()
+        running.wait(5)  # the worker is busy with the first request...
+        for t in threads[1:]:
+            t.start()
+        while engine.metrics.snapshot()['queue_depth'] < 2:  # ...and two more are queued
+            release.wait(0.01)
+        with self.assertRaises(QueueFull):
+            engine.predict(np.zeros(1))
+        release.set()
+        for t in threads:
+            t.join()
+
+    def test_inputs_larger_than_the_queue_are_split(self):
+        engine = BatchingEngine(lambda batch: batch + 1, max_batch_size=2, max_wait_ms=0, max_queue_size=3)
+        outputs = engine.predict_many([np.array([float(i)]) for i in range(7)])
+        self.assertEqual([float(o[0]) for o in outputs], [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0])
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def setUp(self):
+        saved = (load_model._backend, load_model._engine, load_model._prediction_cache,
+                 load_model._model_fingerprint)
+        def restore():
+            (load_model._backend, load_model._engine, load_model._prediction_cache,
+             load_model._model_fingerprint) = saved
+        self.addCleanup(restore)
+        benchmark.install_stub(cost_ms=0)
+        self.data = benchmark.jpeg_bytes(np.random.default_rng(7), size=(64, 64))
+
+    def test_cached_results_honour_top_k(self):
+        self.assertEqual(len(load_model.classify_bytes(self.data, top_k=2)[2]), 2)
+        self.assertEqual(len(load_model.classify_bytes(self.data)[2]), load_model.TOP_K)
+        self.assertEqual(len(load_model.classify_bytes(self.data, top_k=8)[2]), 8)  # more than stored
+        self.assertEqual(load_model.get_prediction_cache().stats()['hits'], 1)
+
+    def test_cache_follows_the_loaded_model(self):
+        load_model.classify_bytes(self.data)
+        load_model.classify_bytes(self.data)
+        self.assertEqual(load_model.get_prediction_cache().stats()['hits'], 1)
+        load_model._model_fingerprint = 'reloaded'  # what get_backend() records for a new model
+        load_model.classify_bytes(self.data)
+        stats = load_model.get_prediction_cache().stats()
+        self.assertEqual((stats['hits'], stats['invalidations']), (1, 1))
+
+    def test_first_lookup_uses_the_model_about_to_load(self):
+        with tempfile.NamedTemporaryFile() as model_file, override_settings(INFERENCE_MODEL_PATH=model_file.name):
+            load_model._model_fingerprint = None  # nothing loaded yet
+            load_model.classify_bytes(self.data)
+            load_model._model_fingerprint = file_fingerprint(model_file.name)  # what get_backend() records
+            load_model.classify_bytes(self.data)
+        stats = load_model.get_prediction_cache().stats()
+        self.assertEqual((stats['hits'], stats['invalidations']), (1, 0))
+
+
+@override_settings(SCAN_QUEUE_BACKEND='thread', SCAN_JOB_MAX_ATTEMPTS=2)
+class ScanJobRecoveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.scan = ScanHistory.objects.create(user=cls.user, image='scans/meal.jpg')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        executor = mock.patch.object(jobs, '_get_executor')
+        self.submit = executor.start().return_value.submit
+        self.addCleanup(executor.stop)
+
+    def job(self, **fields):
+        job = ScanJob.objects.create(scan=self.scan)
+        ScanJob.objects.filter(pk=job.pk).update(**fields)
+        return job
+
+    def job_age(self, job, seconds):
+        ScanJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def poll(self):
+        return self.client.get(reverse('scan_status', args=[self.scan.pk])).json()
+
+    def test_job_lost_by_a_restart_is_resubmitted(self):
+        job = self.job()
+        self.assertFalse(self.poll()['done'])
+        self.submit.assert_not_called()  # just queued: its submission is still pending
+        self.job_age(job, seconds=60)
+        self.poll()
+        self.submit.assert_called_once_with(jobs._run_in_thread, job.pk)
+
+    def test_stale_running_job_is_requeued(self):
+        job = self.job(status=ScanJob.RUNNING, started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.poll()['status'], ScanJob.QUEUED)
+        self.submit.assert_called_once_with(jobs._run_in_thread, job.pk)
+
+    def test_failed_job_is_retried_while_attempts_are_left(self):
+        job = self.job(status=ScanJob.FAILED, attempts=1)
+        self.assertEqual(self.poll(), {'status': ScanJob.QUEUED, 'done': False,
+                                       'result_url': reverse('scan_result', args=[self.scan.pk])})
+        ScanJob.objects.filter(pk=job.pk).update(status=ScanJob.FAILED, attempts=2)
+        self.submit.reset_mock()
+        self.assertTrue(self.poll()['done'])
+        self.submit.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BatchScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        saved = (load_model._backend, load_model._engine, load_model._prediction_cache)
+        def restore():
+            load_model._backend, load_model._engine, load_model._prediction_cache = saved
+        self.addCleanup(restore)
+        benchmark.install_stub(cost_ms=0)
+
+    def post(self, count):
+        uploads = [jpeg_upload(f'meal{i}.jpg', color=(i * 40, 90, 30)) for i in range(count)]
+        return self.client.post(reverse('scan_batch'), {'images': uploads})
+
+    def stored_images(self):
+        scans = os.path.join(MEDIA_ROOT, 'scans')
+        return sorted(os.listdir(scans)) if os.path.isdir(scans) else []
+
+    @override_settings(INFERENCE_MAX_BATCH_SIZE=2)
+    def test_batch_goes_through_the_batching_engine(self):
+        response = self.post(3)
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(load_model.get_engine().metrics.snapshot()['batch_size_histogram'], {1: 1, 2: 1})
+
+    def test_failed_insert_leaves_no_stored_images(self):
+        before = self.stored_images()
+        with mock.patch.object(ScanHistory.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.post(2)
+        self.assertEqual(self.stored_images(), before)
+        self.assertFalse(ScanHistory.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def store(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ScanHistory.objects.create(user=self.user, image=jpeg_upload())
+
+    def stored(self, scan):
+        return [thumbnails.thumbnail_name(scan.image.name, size, ext)
+                for size in thumbnails.THUMBNAIL_SIZES for ext in ('webp', 'jpg')
+                if default_storage.exists(thumbnails.thumbnail_name(scan.image.name, size, ext))]
+
+    def test_thumbnails_are_rendered_on_upload(self):
+        scan = self.store()
+        self.assertEqual(len(self.stored(scan)), len(thumbnails.THUMBNAIL_SIZES))
+        with mock.patch.object(thumbnails, 'schedule_thumbnails') as schedule:
+            url = thumbnails.get_thumbnail_url(scan.image, 96)
+        schedule.assert_not_called()
+        self.assertEqual(url, default_storage.url(thumbnails.thumbnail_name(scan.image.name, 96)))
+
+    def test_missing_thumbnail_falls_back_to_the_image_and_is_rendered(self):
+        with mock.patch('allergy_app.signals.schedule_thumbnails'):  # a scan from before thumbnails
+            scan = self.store()
+        self.assertEqual(self.stored(scan), [])
+        with override_settings(THUMBNAIL_WORKERS=1):
+            self.assertEqual(thumbnails.get_thumbnail_url(scan.image, 96), scan.image.url)
+            thumbnails.wait_for_thumbnails()
+        self.assertEqual(len(self.stored(scan)), len(thumbnails.THUMBNAIL_SIZES))
+        self.assertEqual(thumbnails.get_thumbnail_url(scan.image, 96),
+                         default_storage.url(thumbnails.thumbnail_name(scan.image.name, 96)))
+
+        # A source that can't be rendered keeps the original and isn't retried on every page
+        default_storage.delete(scan.image.name)
+        thumbnails.delete_thumbnails(scan.image.name)
+        self.assertEqual(thumbnails.get_thumbnail_url(scan.image, 96), scan.image.url)
+        with mock.patch.object(thumbnails, 'create_thumbnails') as create:
+            thumbnails.get_thumbnail_url(scan.image, 96)
+        create.assert_not_called()
+
+    def test_replaced_image_gets_new_thumbnails(self):
+        scan = ScanHistory.objects.get(pk=self.store().pk)
+        old = scan.image.name
+        scan.image = jpeg_upload('other.jpg', color=(10, 200, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            scan.save()
+        self.assertNotEqual(scan.image.name, old)
+        self.assertEqual(len(self.stored(scan)), len(thumbnails.THUMBNAIL_SIZES))
+        self.assertFalse(any(default_storage.exists(thumbnails.thumbnail_name(old, size))
+                             for size in thumbnails.THUMBNAIL_SIZES))
+
+    def test_delete_removes_thumbnails_in_every_format(self):
+        with override_settings(THUMBNAIL_FORMAT='jpeg'):
+            scan = self.store()
+        thumbnails.create_thumbnails(scan.image.name)
+        self.assertEqual(len(self.stored(scan)), 2 * len(thumbnails.THUMBNAIL_SIZES))
+        with self.captureOnCommitCallbacks(execute=True):
+            scan.delete()
+        self.assertEqual(self.stored(scan), [])
+
+    def test_decompression_bomb_is_skipped(self):
+        scan = ScanHistory.objects.create(user=self.user, image=jpeg_upload())
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            self.assertFalse(thumbnails.create_thumbnails(scan.image.name))
+        self.assertEqual(self.stored(scan), [])
+
+
+class CatalogueImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        milk = Allergen.objects.create(name='Milk')
+        wheat = Allergen.objects.create(name='Wheat')
+        Allergen.objects.create(name='Peanuts')
+        FoodItem.objects.create(name='Apple pie', ingredients='Flour, butter').allergens.add(milk, wheat)
+        FoodItem.objects.create(name='Edamame', ingredients='Soy beans')
+
+    def catalogue(self):
+        return list(catalogue.export_entries())
+
+    def load(self, text, fmt='csv', **kwargs):
+        return catalogue.import_catalogue(io.BytesIO(text.encode()), fmt, **kwargs)
+
+    def test_export_import_round_trip(self):
+        exported = self.catalogue()
+        for fmt in catalogue.FORMATS:
+            with self.subTest(fmt=fmt):
+                text = ''.join(catalogue.export_chunks(fmt))
+                FoodItem.objects.filter(name='Apple pie').update(ingredients='changed')
+                FoodItem.objects.get(name='Edamame').allergens.add(Allergen.objects.get(name='Peanuts'))
+                report = self.load(text, fmt)
+                self.assertEqual((report.allergens_created, report.foods_created), (0, 0))
+                self.assertEqual(self.catalogue(), exported)
+
+    def test_names_match_case_insensitively(self):
+        report = self.load('kind,name,ingredients,allergens\n'
+                           'allergen,WHEAT,,\n'
+                           'food,apple pie,Flour,milk;MILK;peanuts\n')
+        self.assertEqual((report.allergens_created, report.foods_created, report.foods_updated), (0, 0, 1))
+        pie = FoodItem.objects.get(name='Apple pie')
+        self.assertEqual(sorted(pie.allergens.values_list('name', flat=True)), ['Milk', 'Peanuts'])
+
+    def test_wrongly_shaped_json_is_rejected(self):
+        cases = [
+            ('json', '[{"name": "Tofu"}]'),
+            ('json', '{"foods": {"name": "Tofu"}}'),
+            ('json', '{"foods": ["Tofu"]}'),
+            ('json', '{"allergens": [1]}'),
+            ('jsonl', '"Tofu"\n'),
+            ('jsonl', '42\n'),
+            ('jsonl', '{"name": "Tofu", "allergens": "Milk"}\n'),
+            ('jsonl', '{"name": ["Tofu"]}\n'),
+        ]
+        for fmt, text in cases:
+            with self.subTest(text=text), self.assertRaises(catalogue.CatalogueError):
+                self.load(text, fmt)
+        self.assertFalse(FoodItem.objects.filter(name='Tofu').exists())
+
+    def test_dry_run_rolls_back(self):
+        exported = self.catalogue()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('name,allergens\nTofu,Soy\nApple pie,\n')
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command('import_catalogue', f.name, '--dry-run', stdout=out)
+        self.assertIn('1 allergens created, 1 foods created', out.getvalue())
+        self.assertIn('Dry run, nothing saved', out.getvalue())
+        self.assertEqual(self.catalogue(), exported)
+
+    def test_bad_row_rolls_back_earlier_chunks(self):
+        exported = self.catalogue()
+        with self.assertRaisesMessage(catalogue.CatalogueError, "line 4: unknown kind 'drink'"):
+            self.load('kind,name,allergens\nfood,Tofu,Soy\nfood,Apple pie,\ndrink,Cola,\n', chunk_size=1)
+        self.assertEqual(self.catalogue(), exported)
+
+
+class RecommenderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.milk = Allergen.objects.create(name='Milk')
+        cls.wheat = Allergen.objects.create(name='Wheat')
+        cls.pie = FoodItem.objects.create(name='Apple pie', ingredients='apples flour butter')
+        cls.pie.allergens.add(cls.milk, cls.wheat)
+        cls.cheesecake = FoodItem.objects.create(name='Cheesecake', ingredients='cream cheese sugar')
+        cls.cheesecake.allergens.add(cls.milk)
+        cls.crumble = FoodItem.objects.create(name='Apple crumble', ingredients='apples oats sugar')
+        cls.tart = FoodItem.objects.create(name='Apple tart', ingredients='apples flour')
+        cls.tart.allergens.add(cls.wheat)
+        FoodItem.objects.create(name='Edamame', ingredients='soy beans salt')
+
+    def setUp(self):
+        caches['allergens'].clear()
+        self.recommender = Recommender()
+        self.milk_mask = allergen_index.mask_for_allergens([self.milk.pk])
+
+    def test_unsafe_and_scanned_foods_are_never_returned(self):
+        result = self.recommender.alternatives(self.pie.pk, self.milk_mask, limit=10)
+        self.assertEqual(result[:2], ['Apple tart', 'Apple crumble'])  # shared words first
+        self.assertNotIn('Cheesecake', result)  # contains milk
+        self.assertNotIn('Apple pie', result)  # the scanned food itself
+        everything = self.recommender.alternatives(self.pie.pk, 0, limit=10)
+        self.assertEqual(sorted(everything), ['Apple crumble', 'Apple tart', 'Cheesecake', 'Edamame'])
+
+    def test_results_are_cached_per_food_and_mask(self):
+        first = self.recommender.alternatives(self.pie.pk, self.milk_mask)
+        with self.assertNumQueries(0), mock.patch('numpy.partition') as partition:
+            self.assertEqual(self.recommender.alternatives(self.pie.pk, self.milk_mask), first)
+            partition.assert_not_called()
+        wheat_mask = allergen_index.mask_for_allergens([self.wheat.pk])
+        self.assertNotIn('Apple tart', self.recommender.alternatives(self.pie.pk, wheat_mask))
+
+    def test_catalogue_change_invalidates_results(self):
+        self.assertIn('Apple crumble', self.recommender.alternatives(self.pie.pk, self.milk_mask))
+        version = allergen_index.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crumble.allergens.add(self.milk)
+        self.assertNotEqual(allergen_index.version(), version)
+        self.assertNotIn('Apple crumble', self.recommender.alternatives(self.pie.pk, self.milk_mask))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, METRICS_ENABLED=True, METRICS_LOG=True, THUMBNAIL_WORKERS=0)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        saved = (load_model._backend, load_model._engine, load_model._prediction_cache)
+        def restore():
+            load_model._backend, load_model._engine, load_model._prediction_cache = saved
+        self.addCleanup(restore)
+        benchmark.install_stub(cost_ms=0)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_scan_logs_one_line_with_stage_timings(self):
+        with self.assertLogs('safebite.metrics', 'INFO') as logs:
+            self.client.post(reverse('scan'), {'image': jpeg_upload()})
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['endpoint'], 'scan POST')
+        self.assertIn('inference_wait', line['stages_ms'])
+        rendered = metrics.render()
+        self.assertIn('safebite_stage_seconds_count{stage="inference_wait"} 1', rendered)
+        self.assertIn('safebite_model_predict_seconds_count 1', rendered)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, METRICS_ENABLED=True, THUMBNAIL_WORKERS=0)
+class AsyncScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def setUp(self):
+        saved = (load_model._backend, load_model._engine, load_model._prediction_cache)
+        def restore():
+            load_model._backend, load_model._engine, load_model._prediction_cache = saved
+        self.addCleanup(restore)
+        benchmark.install_stub(cost_ms=0)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    @override_settings(INFERENCE_POOL_MAX_PENDING=1)
+    def test_saturated_pool_answers_503_with_retry_after(self):
+        self.client.force_login(self.user)
+        with inference_pool.admit():  # another scan holds the only slot
+            response = self.client.post(reverse('scan'), {'image': jpeg_upload()})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertFalse(ScanHistory.objects.exists())
+        self.assertIn('safebite_scans_rejected_total{reason="pool"} 1', metrics.render())
+
+        response = self.client.post(reverse('scan'), {'image': jpeg_upload()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(inference_pool.stats()['pending'], 0)
+
+    async def test_scan_through_async_client(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('scan'), {'image': jpeg_upload()})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'result.html')
+        self.assertEqual(await ScanHistory.objects.filter(user=self.user).acount(), 1)
+
+
+class EchoBackend:
+    """Model stand-in for the inference service: each image's mean per channel."""
+    name = 'echo'
+
+    def __init__(self, model_path=None, num_threads=None):
+        pass
+
+    def predict(self, batch):
+        return batch.reshape(len(batch), -1, 3).mean(axis=1)
+
+
+class ThreadContext:
+    """Runs the inference service's model workers as threads of the test process."""
+    Pipe = staticmethod(multiprocessing.Pipe)
+
+    class Process(threading.Thread):
+        def __init__(self, target, args, **kwargs):
+            conn, *rest = args
+            # The service closes its copy of the worker's end, as it would in a real child
+            own = Connection(os.dup(conn.fileno()))
+            super().__init__(target=target, args=(own, *rest), **kwargs)
+
+
+class InferenceServiceTests(SimpleTestCase):
+    authkey = 'test-key'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.address = os.path.join(directory, 'inference.sock')
+        service = inference_service.InferenceService(
+            self.address, authkey=self.authkey, workers=1, threads=1,
+            backend='allergy_app.tests:EchoBackend', pin=False, context=ThreadContext(),
+        )
+        thread = threading.Thread(target=service.serve_forever, daemon=True)
+        thread.start()
+        self.assertTrue(service.ready.wait(5))
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(service.shutdown)
+
+    def request(self, message):
+        with Client(self.address, family='AF_UNIX', authkey=self.authkey.encode()) as conn:
+            inference_service.send_message(conn, message)
+            return inference_service.recv_message(conn)
+
+    def test_round_trip_through_shared_buffer(self):
+        client = inference_service.ServiceClient(self.address, self.authkey)
+        self.addCleanup(client.close)
+        pixels = np.random.default_rng(0).integers(0, 256, (2, 4, 4, 3), dtype=np.uint8)
+        scores = client.predict(pixels)
+        np.testing.assert_allclose(scores, normalize(pixels).reshape(2, -1, 3).mean(axis=1), rtol=1e-6)
+        self.assertEqual(client.stats()['requests'], 1)
+
+    def test_reconnects_reuse_the_thread_buffer(self):
+        client = inference_service.ServiceClient(self.address, self.authkey)
+        self.addCleanup(client.close)
+        prefix = f'{inference_service.BUFFER_PREFIX}{os.getpid()}-'
+        def live_buffers():
+            return [f for f in os.listdir(inference_service.buffer_dir()) if f.startswith(prefix)]
+        before = live_buffers()
+        pixels = np.zeros((1, 4, 4, 3), np.uint8)
+        client.predict(pixels)
+        for _ in range(2):
+            client._local.conn.close()  # the service went away
+            client.predict(pixels)
+        self.assertEqual(len(client._buffers), 1)
+        self.assertEqual(len(live_buffers()), len(before) + 1)
+
+    def test_key_is_required_and_checked(self):
+        with self.assertRaises(ValueError):
+            inference_service.ServiceClient(self.address, None)
+        with self.assertRaises(AuthenticationError):
+            inference_service.ServiceClient(self.address, 'wrong-key').predict(np.zeros((1, 4, 4, 3), np.uint8))
+        self.test_round_trip_through_shared_buffer()  # still serving
+
+    def test_only_buffer_files_are_mapped(self):
+        link = os.path.join(inference_service.buffer_dir(), f'{inference_service.BUFFER_PREFIX}{os.getpid()}-x.buf')
+        os.symlink(__file__, link)
+        self.addCleanup(os.unlink, link)
+        for path in (__file__, link):
+            reply = self.request({'op': 'predict', 'path': path, 'shape': [1], 'dtype': '|u1'})
+            self.assertEqual(reply['status'], 'error')
+            self.assertIn('not an inference buffer', reply['message'])
+
+    def test_buffers_of_dead_processes_are_swept(self):
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        for pid in (dead.pid, os.getpid()):
+            open(os.path.join(directory, f'{inference_service.BUFFER_PREFIX}{pid}-x.buf'), 'w').close()
+        self.assertEqual(inference_service.sweep_buffers(directory), 1)
+        self.assertEqual(os.listdir(directory), [f'{inference_service.BUFFER_PREFIX}{os.getpid()}-x.buf'])
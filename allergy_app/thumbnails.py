@@ -0,0 +1,141 @@
+# allergy_app/thumbnails.py
+#
+# Small renditions of scan images for list views and admin previews, so pages
+# showing 40-56px previews don't ship full-resolution uploads. Every size is
+# rendered once when a scan is stored (see signals.py), on a background thread
+# off the scan request, into MEDIA_ROOT/thumbs/, keyed by the source image name
+# and the rendition size. A page asking for a rendition that isn't stored yet
+# (older scan, render still pending or failed) gets the original image and the
+# rendition is queued. `manage.py make_thumbnails` backfills older scans in bulk.
+import hashlib
+import io
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+THUMBNAIL_DIR = 'thumbs'
+# Allowed edge lengths (px) -- roughly 2x the CSS size for high-DPI screens
+THUMBNAIL_SIZES = (96, 128, 320)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()   # image names queued on the executor
+_unusable = set()  # image names whose source could not be rendered
+
+
+def _format():
+    if getattr(settings, 'THUMBNAIL_FORMAT', 'webp') == 'webp' and features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+# Every scan pays for its renditions: fastest WebP effort, a few % larger files
+_SAVE_OPTIONS = {'WEBP': {'method': 0}, 'JPEG': {}}
+
+
+def thumbnail_name(image_name, size, ext=None):
+    digest = hashlib.sha1(image_name.encode()).hexdigest()
+    ext = ext or _format()[1]
+    return posixpath.join(THUMBNAIL_DIR, str(size), digest[:2], f'{digest}.{ext}')
+
+
+def render_thumbnails(source, sizes=THUMBNAIL_SIZES):
+    """{size: encoded bytes fitting within size x size}, EXIF orientation applied; one decode."""
+    img = Image.open(source)
+    largest = max(sizes)
+    img.draft('RGB', (largest, largest))  # reduced-scale JPEG decode
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    fmt, _ = _format()
+    renditions = {}
+    for size in sorted(sizes, reverse=True):  # each one downscaled from the previous
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, fmt, quality=getattr(settings, 'THUMBNAIL_QUALITY', 80), **_SAVE_OPTIONS[fmt])
+        renditions[size] = buf.getvalue()
+    return renditions
+
+
+def create_thumbnails(image_name):
+    """Render and store every size of a stored image. Returns False if the source is unusable."""
+    try:
+        with default_storage.open(image_name, 'rb') as source:
+            renditions = render_thumbnails(source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Missing or unreadable source: pages fall back to a broken preview, not an error
+        print(f"Thumbnail error for {image_name}: {e}")
+        return False
+    for size, data in renditions.items():
+        name = thumbnail_name(image_name, size)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(data))
+    return True
+
+
+def _render(image_name):
+    try:
+        if not create_thumbnails(image_name):
+            _unusable.add(image_name)
+    finally:
+        _pending.discard(image_name)
+
+
+def schedule_thumbnails(image_name):
+    """create_thumbnails() on the thumbnail threads, or inline with THUMBNAIL_WORKERS = 0."""
+    global _executor
+    workers = getattr(settings, 'THUMBNAIL_WORKERS', 1)
+    with _executor_lock:
+        if image_name in _pending:
+            return
+        _pending.add(image_name)
+        _unusable.discard(image_name)
+        if workers and _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='safebite-thumbs')
+        executor = _executor if workers else None
+    if executor is None:
+        _render(image_name)
+    else:
+        executor.submit(_render, image_name)
+
+
+def wait_for_thumbnails():
+    """Block until every scheduled rendition is stored."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def get_thumbnail_url(image, size=128):
+    """
+    URL of the `size` rendition of an ImageField file. Until it is stored the
+    original image's URL is returned and the rendition is queued (once; a
+    source that failed to render isn't retried).
+    """
+    if not image:
+        return ''
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f'Unsupported thumbnail size {size}; use one of {THUMBNAIL_SIZES}.')
+    name = thumbnail_name(image.name, size)
+    if default_storage.exists(name):
+        return default_storage.url(name)
+    if image.name not in _pending and image.name not in _unusable:
+        schedule_thumbnails(image.name)
+        if default_storage.exists(name):  # rendered inline (THUMBNAIL_WORKERS = 0)
+            return default_storage.url(name)
+    return image.url
+
+
+def delete_thumbnails(image_name):
+    # Both formats: THUMBNAIL_FORMAT may have changed since they were rendered
+    for size in THUMBNAIL_SIZES:
+        for ext in ('webp', 'jpg'):
+            name = thumbnail_name(image_name, size, ext)
+            if default_storage.exists(name):
+                default_storage.delete(name)
@@ -5,9 +5,15 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('history/page/', views.history_page, name='history_page'),
      path('scan/', views.scan_food, name='scan'),
+    path('scan/batch/', views.scan_batch, name='scan_batch'),
+    path('scan/<int:pk>/', views.scan_result, name='scan_result'),
+    path('scan/<int:pk>/status/', views.scan_status, name='scan_status'),
+    path('scan/<int:pk>/pick/', views.scan_pick, name='scan_pick'),
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.profile, name='profile'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,22 +1,56 @@
-from django.shortcuts import render, redirect
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from .forms import UserRegisterForm, AllergyProfileForm, ScanForm
-from .models import ScanHistory, FoodItem, AllergyProfile
-from .ml_model.load_model import predict_food  
-import random
-def home(request):
-    history = []
-    if request.user.is_authenticated:
-        user = request.user
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from django.urls import reverse
+from . import metrics
+from .forms import UserRegisterForm, AllergyProfileForm, ScanForm, BatchScanForm
+from .models import ScanHistory, AllergyProfile, ScanJob
+from .inference_pool import PoolSaturated, inference_pool
+from .ml_model.batching import QueueFull
+from .services import aanalyze_scan, analyze_batch, choose_candidate
+from .jobs import enqueue_scan, resume_job
+from .pagination import keyset_page, page_response, page_size_from
+
+# The home, history and scan views are async: under ASGI they await the ORM
+# and run upload decoding and inference on the bounded inference pool (see
+# inference_pool.py), so a worker can hold many uploads in flight. Rendering
+# goes through sync_to_async as templates may still touch the database.
+arender = sync_to_async(render)
+
+
+async def _request_user(request):
+    """The logged-in user, loaded without blocking; also set as request.user for templates."""
+    request.user = await request.auser()
+    return request.user
+
+
+async def home(request):
+    history = None
+    user = await _request_user(request)
+    if user.is_authenticated:
         if user.is_active and (user.is_staff or user.is_superuser):
                 return redirect('adminpanel:dashboard')
-        history = (ScanHistory.objects
-                   .filter(user=request.user)
-                   .select_related('food_item')
-                   .order_by('-scanned_at'))
-    return render(request, 'home.html', {'history': history})
+        history = await sync_to_async(keyset_page)(
+            ScanHistory.objects.filter(user=user).select_related('food_item'),
+            request.GET.get('cursor'),
+        )
+    return await arender(request, 'home.html', {'history': history})
+
+@login_required
+async def history_page(request):
+    """Next page of the user's scan history for infinite scroll."""
+    user = await _request_user(request)
+    page = await sync_to_async(keyset_page)(
+        ScanHistory.objects.filter(user=user).select_related('food_item'),
+        request.GET.get('cursor'),
+        page_size_from(request),
+    )
+    return await sync_to_async(page_response)(request, page, '_history_items.html')
 
 def register(request):
     if request.method == 'POST':
@@ -152,115 +186,126 @@ def profile(request):
 #     return render(request, 'scan.html', {'form': form})
 
 
-from django.db.models import Prefetch
-from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+def _validated_scan_form(request):
+    # Parses the multipart body and decodes the upload; runs on the inference pool
+    form = ScanForm(request.POST, request.FILES)
+    form.is_valid()
+    return form
+
+
+def _pool_busy(reason):
+    metrics.inc('safebite_scans_rejected_total', reason=reason)
+    response = HttpResponse('The scanner is busy right now. Please try again in a moment.', status=503)
+    response['Retry-After'] = '2'
+    return response
 
-# Confidence threshold (e.g., 40% for full Food-101)
-CONFIDENCE_THRESHOLD = 0.40
 
 @login_required
-def scan_food(request):
+@metrics.traced('scan')
+async def scan_food(request):
+    user = await _request_user(request)
     if request.method == 'POST':
-        form = ScanForm(request.POST, request.FILES)
-        if form.is_valid():
-            scan = form.save(commit=False)
-            scan.user = request.user
-            scan.save()
-
-            # Predict food
-            predicted_name, confidence_raw = predict_food(scan.image.path)
-            # `predict_food` now returns display name like 'Apple Pie'
-            confidence_pct = round(float(confidence_raw) * 100, 2)
-            scan.confidence = confidence_pct
-            print(f"Predicted: {predicted_name} ({confidence_pct}%)")
-
-            # Threshold check
-            if confidence_raw < CONFIDENCE_THRESHOLD:
-                context = {
-                    'scan': scan,
-                    'food_name': predicted_name,
-                    'confidence': confidence_pct,
-                    'allergen_detected': False,
-                    'allergens': [],
-                    'matched_allergens': [],
-                    'low_confidence': True,
-                    'threshold': int(CONFIDENCE_THRESHOLD * 100),
-                    'alternatives': [],
-                }
-                return render(request, 'result.html', context)
-
-            # Find matching food item (case-insensitive)
-            try:
-                food_item = FoodItem.objects.prefetch_related('allergens').get(name__iexact=predicted_name)
-                print(f"Matched DB item: {food_item.name}")
-            except FoodItem.DoesNotExist:
-                print(f"Food item '{predicted_name}' not found in DB.")
-                # Food not in DB — don't fail, show low help
-                return render(request, 'result.html', {
-                    'scan': scan,
-                    'food_name': predicted_name,
-                    'confidence': confidence_pct,
-                    'allergen_detected': False,
-                    'allergens': [],
-                    'matched_allergens': [],
-                    'message': f"'{predicted_name}' is not supported yet.",
-                })
-
-            # Update scan
-            scan.food_item = food_item
-            scan.allergen_detected = False
-            scan.save()
-
-            # Safety check: user profile exists?
-            try:
-                profile = request.user.allergyprofile
-                user_allergens = set(profile.allergens.values_list('name', flat=True))
-                food_allergens = set(food_item.allergens.values_list('name', flat=True))
-                triggering = user_allergens & food_allergens
-                detected = len(triggering) > 0
-
-                # Save result
-                scan.allergen_detected = detected
-                scan.save()
-
-                # Matched allergens queryset
-                matched_qs = food_item.allergens.filter(name__in=triggering)
-
-                # Alternatives: 3 safest options
-                alternatives = []
-                if detected:
-                    candidates = FoodItem.objects.exclude(pk=food_item.pk).prefetch_related('allergens')
-                    safe = [
-                        fi.name for fi in candidates
-                        if not (set(fi.allergens.values_list('name', flat=True)) & user_allergens)
-                    ]
-                    if len(safe) > 3:
-                        alternatives = random.sample(safe, 3)  # get 3 random items
-                    else:
-                        alternatives = safe  # return all if less than 3
-            except Exception:  # profile not set etc.
-                user_allergens = set()
-                triggering = set()
-                matched_qs = []
-                detected = False
-                alternatives = []
-
-            # Final context
-            context = {
-                'scan': scan,
-                'food_name': predicted_name,
-                'confidence': confidence_pct,
-                'allergen_detected': detected,
-                'allergens': matched_qs,
-                'matched_allergens': matched_qs,
-                'low_confidence': False,
-                'alternatives': alternatives,
-            }
-            return render(request, 'result.html', context)
+        try:
+            with inference_pool.admit():
+                form = await inference_pool.run(_validated_scan_form, request)
+                if form.is_valid():
+                    scan = form.save(commit=False)
+                    scan.user = user
+                    with metrics.span('upload_save'):
+                        await scan.asave()
+
+                    # Asynchronous mode: queue inference and let the result page poll for it
+                    if settings.SCAN_ASYNC:
+                        await sync_to_async(enqueue_scan)(scan)
+                        return redirect('scan_result', pk=scan.pk)
+
+                    context = await aanalyze_scan(scan, user, ingested=form.ingested)
+                    context['scan'] = scan
+                    return await arender(request, 'result.html', context)
+        except PoolSaturated:
+            return _pool_busy('pool')
     else:
         form = ScanForm()
 
-    return render(request, 'scan.html', {'form': form})
+    return await arender(request, 'scan.html', {'form': form})
+
+@login_required
+def scan_result(request, pk):
+    scan = get_object_or_404(ScanHistory.objects.select_related('job'), pk=pk, user=request.user)
+    job = getattr(scan, 'job', None)
+    if job is not None and job.status != ScanJob.DONE:
+        resume_job(job)  # stalled, or failed with attempts left
+    if job is None or job.status == ScanJob.DONE:
+        context = dict(job.result) if job else {
+            'food_name': scan.food_item.name if scan.food_item else 'Unknown',
+            'confidence': scan.confidence,
+            'allergen_detected': scan.allergen_detected,
+        }
+        context['scan'] = scan
+        return render(request, 'result.html', context)
+    if job.status == ScanJob.FAILED:
+        return render(request, 'result.html', {
+            'scan': scan,
+            'failed': True,
+            'message': "We couldn't analyse this photo. Please try scanning again.",
+        })
+    return render(request, 'scan_pending.html', {'scan': scan, 'job': job})
+
+@login_required
+@require_POST
+def scan_pick(request, pk):
+    """The user says which of the scan's candidate foods it is; no new inference."""
+    scan = get_object_or_404(ScanHistory, pk=pk, user=request.user)
+    try:
+        context = choose_candidate(scan, request.user, int(request.POST.get('class_idx', '')))
+    except ValueError:
+        return redirect('scan_result', pk=scan.pk)
+    context['scan'] = scan
+    return render(request, 'result.html', context)
+
+@login_required
+async def scan_status(request, pk):
+    """Lightweight JSON endpoint polled by the pending-scan page."""
+    user = await _request_user(request)
+    job = await aget_object_or_404(
+        ScanJob.objects.only('status', 'scan_id', 'attempts', 'created_at', 'started_at'),
+        scan_id=pk, scan__user=user,
+    )
+    if job.status != ScanJob.DONE:
+        await sync_to_async(resume_job)(job)
+    return JsonResponse({
+        'status': job.status,
+        'done': job.status in (ScanJob.DONE, ScanJob.FAILED),
+        'result_url': reverse('scan_result', args=[pk]),
+    })
+
+@login_required
+@require_POST
+@metrics.traced('scan_batch')
+def scan_batch(request):
+    """
+    Scan many photos in one request: multipart `images` files and/or a zip
+    `archive`. All images are queued on the classifier together and the
+    per-image results are returned as JSON.
+    """
+    form = BatchScanForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    try:
+        results = analyze_batch(request.user, form.cleaned_data['uploads'])
+    except QueueFull:
+        return _pool_busy('queue')
+    return JsonResponse({'count': len(results), 'results': results})
+
 
+def metrics_view(request):
+    """
+    Scan timings and inference counters in the Prometheus text format. Served
+    only with METRICS_ENABLED, to METRICS_ALLOWED_IPS (local by default) or staff.
+    """
+    if not metrics.enabled():
+        raise Http404
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,6 +2,8 @@
 ASGI config for safebite_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with any ASGI server (e.g. ``uvicorn safebite_project.asgi:application``)
+to run the async scan / history views without tying up a thread per upload.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -14,3 +16,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'safebite_project.settings')
 
 application = get_asgi_application()
+
+# Optionally pay the TensorFlow import / model load at worker boot instead of
+# on the first scan request.
+from django.conf import settings  # noqa: E402
+
+if settings.INFERENCE_PRELOAD:
+    from allergy_app.ml_model.load_model import preload_model
+    preload_model()
@@ -75,12 +75,55 @@ WSGI_APPLICATION = 'safebite_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default. Set SAFEBITE_DB_ENGINE=postgresql (plus SAFEBITE_DB_NAME,
+# _USER, _PASSWORD, _HOST, _PORT) for production: concurrent scan writes then
+# no longer queue on SQLite's single writer lock. Connections are kept open for
+# SAFEBITE_DB_CONN_MAX_AGE seconds, or taken from a psycopg connection pool
+# with SAFEBITE_DB_POOL=1 (requires psycopg[pool]).
+DB_ENGINE = os.environ.get('SAFEBITE_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = os.environ.get('SAFEBITE_DB_POOL', '0') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SAFEBITE_DB_NAME', 'safebite'),
+            'USER': os.environ.get('SAFEBITE_DB_USER', 'safebite'),
+            'PASSWORD': os.environ.get('SAFEBITE_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SAFEBITE_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('SAFEBITE_DB_PORT', '5432'),
+            # Persistent connections and pooling are mutually exclusive
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('SAFEBITE_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('SAFEBITE_DB_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('SAFEBITE_DB_POOL_MAX', 10)),
+                    'timeout': 10,
+                } if DB_POOL else False,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # WAL lets readers run alongside the single writer; writers
+                # wait up to `timeout` seconds for the lock instead of failing
+                # with "database is locked", and IMMEDIATE transactions take
+                # the write lock up front so they never deadlock on upgrade.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                ),
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -117,6 +160,13 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Scan previews are served from thumbnails under MEDIA_ROOT/thumbs/, rendered
+# when a scan is stored on THUMBNAIL_WORKERS background threads (0 renders them
+# inline; see allergy_app/thumbnails.py). 'webp' falls back to JPEG if Pillow lacks it.
+THUMBNAIL_FORMAT = os.environ.get('SAFEBITE_THUMBNAIL_FORMAT', 'webp')
+THUMBNAIL_QUALITY = int(os.environ.get('SAFEBITE_THUMBNAIL_QUALITY', 80))
+THUMBNAIL_WORKERS = int(os.environ.get('SAFEBITE_THUMBNAIL_WORKERS', 1))
+
 # Static files
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -126,6 +176,114 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/home/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Inference
+# 'keras' serves the full food_model_full.h5 graph; 'tflite' serves the int8
+# model written by `python -m allergy_app.ml_model.export_model`; 'service'
+# sends batches to `python -m allergy_app.ml_model.inference_service`, a fixed
+# pool of model processes shared by all web workers on the host.
+INFERENCE_BACKEND = os.environ.get('SAFEBITE_INFERENCE_BACKEND', 'keras')
+INFERENCE_MODEL_PATH = os.environ.get('SAFEBITE_INFERENCE_MODEL_PATH') or None  # backend default
+INFERENCE_NUM_THREADS = int(os.environ.get('SAFEBITE_INFERENCE_NUM_THREADS', 0)) or None
+# Temperature written by `python -m allergy_app.ml_model.calibrate`
+INFERENCE_CALIBRATION_PATH = os.environ.get('SAFEBITE_INFERENCE_CALIBRATION_PATH') or None  # next to the model
+# Unix socket of the inference service (in a 0700 directory) and the key both
+# sides authenticate with; the key has no default and is required for 'service'.
+INFERENCE_SERVICE_ADDRESS = os.environ.get('SAFEBITE_INFERENCE_SERVICE_ADDRESS') or None  # service default
+INFERENCE_SERVICE_AUTHKEY = os.environ.get('SAFEBITE_INFERENCE_SERVICE_AUTHKEY') or None
+# Concurrent scans are grouped into one model.predict call: a batch is run as soon
+# as it holds INFERENCE_MAX_BATCH_SIZE images or the oldest request has waited
+# INFERENCE_MAX_WAIT_MS milliseconds.
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('SAFEBITE_INFERENCE_MAX_BATCH_SIZE', 8))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('SAFEBITE_INFERENCE_MAX_WAIT_MS', 5))
+INFERENCE_MAX_QUEUE_SIZE = int(os.environ.get('SAFEBITE_INFERENCE_MAX_QUEUE_SIZE', 256))
+# The model is loaded lazily on the first scan; set SAFEBITE_PRELOAD_MODEL=1 to
+# load it when the WSGI/ASGI worker boots instead (manage.py never loads it).
+INFERENCE_PRELOAD = os.environ.get('SAFEBITE_PRELOAD_MODEL', '0') == '1'
+# Results are cached per image content hash (LRU, 0 disables) and dropped when
+# the model file changes. A non-zero PHASH distance also reuses results for
+# near-duplicate photos within that many differing bits of a 64-bit dHash.
+PREDICTION_CACHE_SIZE = int(os.environ.get('SAFEBITE_PREDICTION_CACHE_SIZE', 2048))
+PREDICTION_CACHE_PHASH_DISTANCE = int(os.environ.get('SAFEBITE_PREDICTION_CACHE_PHASH_DISTANCE', 0))
+
+# Async scan views (allergy_app/inference_pool.py): threads decoding uploads
+# and running inference, and how many scans may be in flight (running or
+# waiting) before new ones get 503 + Retry-After.
+INFERENCE_POOL_WORKERS = int(os.environ.get('SAFEBITE_INFERENCE_POOL_WORKERS', 4))
+INFERENCE_POOL_MAX_PENDING = int(os.environ.get('SAFEBITE_INFERENCE_POOL_MAX_PENDING', 32))
+
+# Scan upload ingestion (allergy_app/ingest.py): uploads above the size or
+# pixel limits are rejected; the stored copy is bounded to SCAN_MAX_DIMENSION
+# on its longest side and re-encoded at SCAN_JPEG_QUALITY without EXIF.
+SCAN_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+SCAN_MAX_PIXELS = 40_000_000
+SCAN_MAX_DIMENSION = int(os.environ.get('SAFEBITE_SCAN_MAX_DIMENSION', 1024))
+SCAN_JPEG_QUALITY = int(os.environ.get('SAFEBITE_SCAN_JPEG_QUALITY', 85))
+
+# Batch scan API (/scan/batch/): images per request and per-image size limit
+BATCH_SCAN_MAX_IMAGES = int(os.environ.get('SAFEBITE_BATCH_SCAN_MAX_IMAGES', 32))
+BATCH_SCAN_MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# Allergen bitmask index (allergy_app/allergen_index.py) and the cache behind
+# it. Signals publish catalogue / profile changes through the 'allergens' cache;
+# the default local-memory cache is only seen by its own process, so the app
+# refuses to start with more than one worker (WEB_CONCURRENCY, also read by
+# gunicorn) unless SAFEBITE_ALLERGEN_CACHE_DIR points at a shared directory.
+ALLERGEN_INDEX_TTL = int(os.environ.get('SAFEBITE_ALLERGEN_INDEX_TTL', 60))
+ALLERGEN_CACHE_DIR = os.environ.get('SAFEBITE_ALLERGEN_CACHE_DIR')
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Scan instrumentation (allergy_app/metrics.py): per-stage latency histograms
+# and counters served at /metrics/ to METRICS_ALLOWED_IPS and staff users;
+# SAFEBITE_METRICS_LOG=1 also logs one JSON line per scan request to the
+# 'safebite.metrics' logger (stderr unless LOGGING routes it elsewhere).
+METRICS_ENABLED = os.environ.get('SAFEBITE_METRICS', '0') == '1'
+METRICS_LOG = os.environ.get('SAFEBITE_METRICS_LOG', '0') == '1'
+METRICS_ALLOWED_IPS = os.environ.get('SAFEBITE_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'safebite.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Alternatives recommender (allergy_app/recommender.py): hashed ingredient
+# embedding size and the number of (food, allergen set) results kept.
+RECOMMENDER_DIM = int(os.environ.get('SAFEBITE_RECOMMENDER_DIM', 256))
+RECOMMENDER_CACHE_SIZE = int(os.environ.get('SAFEBITE_RECOMMENDER_CACHE_SIZE', 4096))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'allergens': {
+        'BACKEND': ('django.core.cache.backends.filebased.FileBasedCache' if ALLERGEN_CACHE_DIR
+                    else 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': ALLERGEN_CACHE_DIR or 'safebite-allergens',
+        'KEY_PREFIX': 'safebite',
+        'VERSION': 2,  # bump when the cached value formats change
+    },
+}
+
+# Asynchronous scans
+# With SCAN_ASYNC on, the scan POST only stores the upload and a ScanJob row and
+# the result page polls for the outcome. Jobs run on a thread pool inside the
+# web process ('thread') or are left in the table for `manage.py run_scan_worker`
+# ('db').
+SCAN_ASYNC = os.environ.get('SAFEBITE_SCAN_ASYNC', '0') == '1'
+SCAN_QUEUE_BACKEND = os.environ.get('SAFEBITE_SCAN_QUEUE_BACKEND', 'thread')
+SCAN_WORKER_THREADS = int(os.environ.get('SAFEBITE_SCAN_WORKER_THREADS', 2))
+# Polling an unfinished job resubmits it after SCAN_JOB_RESUBMIT_AFTER seconds
+# in the queue, requeues it after SCAN_JOB_STALE_AFTER seconds 'running' and
+# retries failures until SCAN_JOB_MAX_ATTEMPTS attempts.
+SCAN_JOB_RESUBMIT_AFTER = int(os.environ.get('SAFEBITE_SCAN_JOB_RESUBMIT_AFTER', 30))
+SCAN_JOB_STALE_AFTER = int(os.environ.get('SAFEBITE_SCAN_JOB_STALE_AFTER', 300))
+SCAN_JOB_MAX_ATTEMPTS = int(os.environ.get('SAFEBITE_SCAN_JOB_MAX_ATTEMPTS', 3))
+
 
 
 # Static files (CSS, JavaScript, Images)
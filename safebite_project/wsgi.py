@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'safebite_project.settings')
 
 application = get_wsgi_application()
+
+# Optionally pay the TensorFlow import / model load at worker boot instead of
+# on the first scan request.
+from django.conf import settings  # noqa: E402
+
+if settings.INFERENCE_PRELOAD:
+    from allergy_app.ml_model.load_model import preload_model
+    preload_model()
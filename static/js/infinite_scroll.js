@@ -0,0 +1,57 @@
+// Infinite scroll for keyset-paginated lists.
+//
+// <div data-infinite-scroll data-next-url="/history/page/" data-cursor="..."
+//      [data-target="#tbody-id"] [data-scroll-root="self"]>
+//
+// When the end of the list scrolls into view, the next page is fetched from
+// data-next-url?cursor=... ({html, next_cursor}) and its rows are appended.
+(function () {
+  function setup(list) {
+    const url = list.dataset.nextUrl;
+    let cursor = list.dataset.cursor;
+    if (!url || !cursor) return;
+
+    const target = list.dataset.target ? document.querySelector(list.dataset.target) : list;
+    const sentinel = document.createElement('div');
+    sentinel.className = 'sb-scroll-sentinel';
+    list.appendChild(sentinel);
+    list.querySelectorAll('[data-infinite-fallback]').forEach(function (el) { el.remove(); });
+
+    let loading = false;
+    const observer = new IntersectionObserver(function (entries) {
+      if (!entries[0].isIntersecting || loading || !cursor) return;
+      loading = true;
+      const sep = url.indexOf('?') === -1 ? '?' : '&';
+      fetch(url + sep + 'cursor=' + encodeURIComponent(cursor), {
+        credentials: 'same-origin',
+        headers: { 'Accept': 'application/json' }
+      })
+        .then(function (r) { return r.json(); })
+        .then(function (data) {
+          if (target === list) {
+            sentinel.insertAdjacentHTML('beforebegin', data.html);
+          } else {
+            target.insertAdjacentHTML('beforeend', data.html);
+          }
+          cursor = data.next_cursor;
+          if (!cursor) {
+            observer.disconnect();
+            sentinel.remove();
+          }
+        })
+        .finally(function () {
+          loading = false;
+          // Re-check: if the sentinel is still visible, load the next page too
+          if (cursor) {
+            observer.unobserve(sentinel);
+            observer.observe(sentinel);
+          }
+        });
+    }, { root: list.dataset.scrollRoot === 'self' ? list : null, rootMargin: '200px' });
+    observer.observe(sentinel);
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('[data-infinite-scroll]').forEach(setup);
+  });
+})();